@@ -260,10 +260,100 @@ function! UltiSnips#LeavingInsertMode() abort
     py3 UltiSnips_Manager._leaving_insert_mode()
 endfunction
 
+function! s:can_skip_track_change() abort
+    " Calling into Python on every keystroke is expensive, on Neovim it is an
+    " RPC round-trip. Outside of a snippet, only keystrokes that can complete
+    " an autotrigger snippet need it, unless a placeholder selected by the
+    " last jump is waiting to be forgotten by the typed text. Which those are is asked once per
+    " buffer and again whenever the snippets or the filetype changed.
+    if v:char !=# ''
+        let s:last_inserted_char = v:char
+    endif
+    if get(g:, '_ultisnips_inner_state_up', 0)
+                \ || get(g:, '_ultisnips_visual_placeholder', 0)
+        return 0
+    endif
+    let l:key = [get(g:, '_ultisnips_snippets_generation', 0), &filetype]
+    if get(b:, '_ultisnips_autotrigger_key', []) !=# l:key
+        let l:summary = py3eval('UltiSnips_Manager._autotrigger_characters()')
+        if type(l:summary) != v:t_dict
+            let l:summary = {'any': 1, 'characters': {}}
+        endif
+        let b:_ultisnips_autotrigger = l:summary
+        let b:_ultisnips_autotrigger_key = l:key
+    endif
+    if b:_ultisnips_autotrigger.any
+        return 0
+    endif
+    if v:char !=# ''
+        return !has_key(b:_ultisnips_autotrigger.characters, v:char)
+    endif
+    " Python only expands after the character inserted last, see
+    " SnippetManager._track_change.
+    let l:before = strpart(getline('.'), 0, col('.') - 1)
+    let l:last = strcharpart(l:before, strchars(l:before) - 1)
+    return l:last !=# get(s:, 'last_inserted_char', '')
+                \ || !has_key(b:_ultisnips_autotrigger.characters, l:last)
+endfunction
+
 function! UltiSnips#TrackChange() abort
+    if s:can_skip_track_change()
+        return
+    endif
     py3 UltiSnips_Manager._track_change()
 endfunction
 
+function! UltiSnips#IskeywordChanged() abort
+    py3 UltiSnips_Manager._iskeyword_changed()
+endfunction
+
 function! UltiSnips#RefreshSnippets() abort
     py3 UltiSnips_Manager._refresh_snippets()
 endfunction
+
+function! s:check_snippet_directories(timer) abort
+    py3 UltiSnips_Manager._check_snippet_directories()
+endfunction
+
+function! UltiSnips#WatchSnippetDirectories() abort
+    " The directories are watched in a background thread, this only picks up
+    " what it found.
+    if !exists('s:watch_timer')
+        let s:watch_timer = timer_start(250,
+                    \ function('s:check_snippet_directories'), {'repeat': -1})
+    endif
+endfunction
+
+function! s:preload_impl() abort
+    if py3eval('UltiSnips_Manager._preload_snippets()')
+        call timer_start(20, function('s:finish_preload'))
+    endif
+endfunction
+
+function! s:finish_preload(timer) abort
+    if py3eval('UltiSnips_Manager._finish_preloading_snippets()')
+        call timer_start(20, function('s:finish_preload'))
+    endif
+endfunction
+
+function! UltiSnips#Preload() abort
+    " Deferred to the next event-loop tick, so that a freshly opened buffer
+    " has its filetype set and the autocmd returns right away. Files are
+    " parsed in a background thread; the timer merges the results.
+    call timer_start(0, {-> s:preload_impl()})
+endfunction
+
+function! UltiSnips#ClearSnippetCache() abort
+    py3 UltiSnips_Manager._clear_snippet_cache()
+endfunction
+
+function! UltiSnips#Compile(...) abort
+    let l:bundles = py3eval("UltiSnips_Manager._compile_snippet_bundles(vim.eval('a:000'))")
+    if type(l:bundles) == v:t_list
+        echo printf("UltiSnips: wrote %d snippet bundles.", len(l:bundles))
+    endif
+endfunction
+
+function! UltiSnips#SnippetCacheStats() abort
+    return py3eval("UltiSnips_Manager.snippet_cache_stats()")
+endfunction
@@ -3,21 +3,63 @@
 " buffer change notifications.
 
 let s:listener_id = -1
-let g:_ultisnips_listener_changes = []
 let g:_ultisnips_listener_suppressed = 0
 
+" Changes since the last UltiSnips#listener#Drain(), in the order they were
+" made. Each is a dict with 'lnum', 'end', 'added' and 'col' like
+" listener_add() reports them. A change that touches the lines of the one
+" before it is merged into it. A change within one line that is at most
+" s:text_limit bytes long also gets the line after the change as 'text'.
+let s:changes = []
+let s:text_limit = 1000
+
+function! s:merge(last, lnum, end, added, col) abort
+    " a:lnum and a:end are lines after a:last was made; the lines a:last
+    " left end before a:last.end + a:last.added.
+    let l:end = max([a:last.end + a:last.added, a:end])
+    if a:lnum < a:last.lnum
+        let a:last.col = a:col
+    elseif a:lnum == a:last.lnum
+        let a:last.col = min([a:last.col, a:col])
+    endif
+    let a:last.lnum = min([a:last.lnum, a:lnum])
+    let a:last.end = l:end - a:last.added
+    let a:last.added += a:added
+    silent! unlet a:last.text
+endfunction
+
 function! s:on_change(bufnr, start, end, added, changes) abort
     if g:_ultisnips_listener_suppressed
         return
     endif
     for change in a:changes
-        call add(g:_ultisnips_listener_changes, {
-            \ 'lnum': change.lnum,
-            \ 'end': change.end,
-            \ 'added': change.added,
-            \ 'col': change.col,
-            \ })
+        let l:last = get(s:changes, -1, {})
+        if !empty(l:last)
+                    \ && change.lnum <= l:last.end + l:last.added
+                    \ && change.end >= l:last.lnum
+            call s:merge(l:last, change.lnum, change.end, change.added, change.col)
+        else
+            call add(s:changes, {
+                \ 'lnum': change.lnum,
+                \ 'end': change.end,
+                \ 'added': change.added,
+                \ 'col': change.col,
+                \ })
+        endif
     endfor
+    if empty(s:changes)
+        return
+    endif
+    " The line numbers of all changes are valid while the callback runs, so
+    " the last change can read its line now. Changes before it might have
+    " been changed again by it, so their text is left alone.
+    let l:last = s:changes[-1]
+    if l:last.added == 0 && l:last.end == l:last.lnum + 1
+        let l:text = getbufline(a:bufnr, l:last.lnum)
+        if len(l:text) == 1 && strlen(l:text[0]) <= s:text_limit
+            let l:last.text = l:text[0]
+        endif
+    endif
 endfunction
 
 function! UltiSnips#listener#Attach(bufnr) abort
@@ -30,11 +72,15 @@ function! UltiSnips#listener#Detach() abort
         call listener_remove(s:listener_id)
         let s:listener_id = -1
     endif
-    let g:_ultisnips_listener_changes = []
+    let s:changes = []
 endfunction
 
-function! UltiSnips#listener#Flush() abort
+" Returns the changes made since the last call and forgets them.
+function! UltiSnips#listener#Drain() abort
     if s:listener_id != -1
         call listener_flush()
     endif
+    let l:changes = s:changes
+    let s:changes = []
+    return l:changes
 endfunction
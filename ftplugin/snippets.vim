@@ -20,7 +20,7 @@ setlocal autoindent nosmartindent nocindent
 " Whenever a snippets file is written, we ask UltiSnips to reload all snippet
 " files. This feels like auto-updating, but is of course just an
 " approximation: If files change outside of the current Vim instance, we will
-" not notice.
+" only notice with g:UltiSnipsWatchSnippetDirectories set.
 augroup ultisnips_snippets.vim
 autocmd!
 autocmd BufWritePost <buffer> call UltiSnips#RefreshSnippets()
@@ -1,12 +1,16 @@
 -- Neovim on_bytes buffer change listener for UltiSnips.
 --
 -- Uses nvim_buf_attach with on_bytes to capture exact byte coordinates
--- for every buffer change.  Events are appended to vim.g._ultisnips_nvim_changes
--- (cleared by the Python side after consumption).
+-- for every buffer change, together with the text the change inserted.
+-- Events are kept in a Lua table, merging an event into the one before it
+-- when it continues it, and the Python side takes them all with a single
+-- drain() call and replays them in order.
 
 local M = {}
 
-vim.g._ultisnips_nvim_changes = {}
+-- Pending events: {start_row, start_col, old_end_row, old_end_col,
+-- new_end_row, new_end_col, text}.
+local pending = {}
 local suppressed = false
 -- Each attach bumps this token. Active callback closes over its token;
 -- when a new attach replaces it, the old callback returns true on its
@@ -14,19 +18,70 @@ local suppressed = false
 -- removal API, so this is how we avoid stacking callbacks.
 local attached_token = 0
 
+-- Returns the position where the text inserted by 'change' ends.
+local function inserted_end(change)
+  if change[5] == 0 then return change[1], change[2] + change[6] end
+  return change[1] + change[5], change[6]
+end
+
+-- Merges 'change' into 'last' if it continues it, so that typing or
+-- deleting a run of characters is one event. Returns true if it did.
+local function merge(last, change)
+  local row, col = change[1], change[2]
+  local deletes = change[3] ~= 0 or change[4] ~= 0
+  local inserts = change[5] ~= 0 or change[6] ~= 0
+  local end_row, end_col = inserted_end(last)
+  if not deletes and row == end_row and col == end_col then
+    -- Inserting right after the text 'last' inserted.
+    if change[5] == 0 then
+      last[6] = last[6] + change[6]
+    else
+      last[5] = last[5] + change[5]
+      last[6] = change[6]
+    end
+    last[7] = last[7] .. change[7]
+    return true
+  end
+  if inserts or change[3] ~= 0 or row ~= last[1] then return false end
+  if last[5] == 0 and col >= last[2] and col + change[4] == end_col then
+    -- Deleting the end of the text 'last' inserted on one line.
+    last[6] = last[6] - change[4]
+    last[7] = last[7]:sub(1, #last[7] - change[4])
+    return true
+  end
+  if last[3] ~= 0 or last[5] ~= 0 or last[6] ~= 0 then return false end
+  -- Both only delete within one line: 'x' deletes at the same position,
+  -- backspace right before the text 'last' deleted.
+  if col == last[2] or col + change[4] == last[2] then
+    last[2] = col
+    last[4] = last[4] + change[4]
+    return true
+  end
+  return false
+end
+
 local function make_callback(token)
-  return function(_, _buf, _, start_row, start_col, _byte_offset,
+  return function(_, buf, _, start_row, start_col, _byte_offset,
                   old_end_row, old_end_col, _old_byte_length,
                   new_end_row, new_end_col, _new_byte_length)
     if token ~= attached_token then return true end
     if suppressed then return end
-    local changes = vim.g._ultisnips_nvim_changes
-    table.insert(changes, {
+    -- The buffer already holds the change, so the inserted text can be read
+    -- now. Later changes in the same burst may overwrite it.
+    local end_col = new_end_col
+    if new_end_row == 0 then end_col = start_col + new_end_col end
+    local inserted = vim.api.nvim_buf_get_text(
+      buf, start_row, start_col, start_row + new_end_row, end_col, {})
+    local change = {
       start_row, start_col,
       old_end_row, old_end_col,
       new_end_row, new_end_col,
-    })
-    vim.g._ultisnips_nvim_changes = changes
+      table.concat(inserted, "\n"),
+    }
+    local last = pending[#pending]
+    if last == nil or not merge(last, change) then
+      pending[#pending + 1] = change
+    end
   end
 end
 
@@ -38,11 +93,22 @@ end
 
 function M.detach()
   attached_token = attached_token + 1
-  vim.g._ultisnips_nvim_changes = {}
+  pending = {}
+end
+
+-- Returns the pending events as one flat list of 7 values per event and
+-- forgets them.
+function M.drain()
+  local flat = {}
+  for _, change in ipairs(pending) do
+    for i = 1, 7 do flat[#flat + 1] = change[i] end
+  end
+  pending = {}
+  return flat
 end
 
 function M.suppress()  suppressed = true end
 function M.unsuppress() suppressed = false end
-function M.reset()     vim.g._ultisnips_nvim_changes = {} end
+function M.reset()     pending = {} end
 
 return M
@@ -169,6 +169,9 @@ command! -nargs=1 UltiSnipsRemoveFiletypes :call UltiSnips#RemoveFiletypes(<q-ar
 
 command! UltiSnipsListLocations :call UltiSnips#ListSnippetLocations()
 
+command! UltiSnipsClearCache :call UltiSnips#ClearSnippetCache()
+command! -nargs=* -complete=dir UltiSnipsCompile :call UltiSnips#Compile(<f-args>)
+
 augroup UltiSnips_AutoTrigger
     au!
     au InsertCharPre * call UltiSnips#TrackChange()
@@ -178,6 +181,31 @@ augroup UltiSnips_AutoTrigger
     endif
 augroup END
 
+function! s:iskeyword_changed() abort
+    " Word boundaries are computed in Python from 'iskeyword', which is only
+    " read again after this. Nothing is cached before UltiSnips was loaded.
+    if exists('*UltiSnips#IskeywordChanged')
+        call UltiSnips#IskeywordChanged()
+    endif
+endfunction
+
+augroup UltiSnips_Iskeyword
+    au!
+    au BufEnter,FileType * call s:iskeyword_changed()
+    au OptionSet iskeyword,lisp call s:iskeyword_changed()
+augroup END
+
+if get(g:, 'UltiSnipsPreloadSnippets', 0)
+    augroup UltiSnips_Preload
+        au!
+        au FileType,BufEnter * call UltiSnips#Preload()
+    augroup END
+endif
+
+if get(g:, 'UltiSnipsWatchSnippetDirectories', 0)
+    call UltiSnips#WatchSnippetDirectories()
+endif
+
 call UltiSnips#map_keys#MapKeys()
 
 " vim: ts=8 sts=4 sw=4
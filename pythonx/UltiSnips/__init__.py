@@ -2,4 +2,13 @@
 
 """Entry point for all things UltiSnips."""
 
-from UltiSnips.snippet_manager import UltiSnips_Manager
+
+def __getattr__(name):
+    # The manager talks to Vim as soon as it is created, so it is only
+    # imported on first use. This keeps the parts of the package that do not
+    # need a running Vim, like `python -m UltiSnips.compile`, importable.
+    if name == "UltiSnips_Manager":
+        from UltiSnips.snippet_manager import UltiSnips_Manager
+
+        return UltiSnips_Manager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
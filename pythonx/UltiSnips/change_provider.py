@@ -9,157 +9,480 @@ Edit commands are tuples of ("I"|"D", line, col, text) where:
 - line numbers are 0-indexed absolute buffer positions
 """
 
-import sys
-from collections import defaultdict
+import re
+from bisect import bisect_left
+from collections import Counter
 from contextlib import contextmanager
 
 import vim
 
 # Returned by consume_edits when the buffer change cannot plausibly be
 # reconciled against the snippet's tracked state (pre-snippet content
-# restored by undo, huge single-event paste dumped outside any tabstop,
-# etc.). The caller terminates the snippet rather than hanging in diff()
-# or producing a corrupted text-object tree.
+# restored by undo, etc.). The caller terminates the snippet rather than
+# producing a corrupted text-object tree.
 DROP_SNIPPET = object()
 
-# diff() is an O(|a|·|b|) shortest-edit-path search. For total char counts
-# up to a few hundred it is imperceptible; beyond ~2000 the latency becomes
-# a freeze. Rather than feed such inputs to diff(), we treat them as a
-# signal that the snippet has lost its grip on the buffer.
+# A change of more than this many characters that keeps too little of the
+# snippet's remembered text at its ends is taken as a sign that the snippet
+# has lost its grip on the buffer.
 _PATHOLOGICAL_CHAR_DELTA = 2000
 
+# How many characters of the remembered text a large change has to keep at
+# its start and end together. Shorter texts have to keep half of theirs.
+_PATHOLOGICAL_KEPT_CHARS = 8
 
-def _joined_len(lines):
-    """Length of '\\n'.join(lines) without materializing the string."""
-    if not lines:
-        return 0
-    return sum(len(l) for l in lines) + len(lines) - 1
+# diff() searches at most this many edits on each side of a middle snake.
+# Regions that differ by more are split around a long common part or where
+# the search got furthest and diffed piece by piece, which keeps dissimilar
+# inputs from taking quadratic time at the price of a script that might not
+# be the shortest.
+_MAX_DIFF_COST = 256
 
 
 def _is_pathological_diff_input(old_lines, new_lines):
-    """Return True when running diff(old, new) would be both slow and
-    structurally suspect — meaning the buffer has diverged from the
-    snippet's tracked state in a way no reasonable replay can recover.
+    """Return True when the buffer has diverged from the snippet's tracked
+    state in a way no reasonable replay can recover.
 
     Heuristic: the character-count delta exceeds what an interactive
-    snippet edit could plausibly produce in a single CursorMoved cycle.
+    snippet edit could plausibly produce in a single CursorMoved cycle, and
+    the new text keeps fewer than _PATHOLOGICAL_KEPT_CHARS characters of the
+    remembered one at its start and end. Large pastes into a tabstop keep
+    the text around the tabstop and are tracked.
     """
-    return (
-        abs(_joined_len(new_lines) - _joined_len(old_lines)) > _PATHOLOGICAL_CHAR_DELTA
+    old = "\n".join(old_lines)
+    new = "\n".join(new_lines)
+    if not old or abs(len(new) - len(old)) <= _PATHOLOGICAL_CHAR_DELTA:
+        return False
+    prefix = _common_length(old, 0, new, 0, 1)
+    suffix = _common_length(old, len(old) - 1, new, len(new) - 1, -1)
+    kept = min(prefix + suffix, len(old))
+    return kept < min(_PATHOLOGICAL_KEPT_CHARS, (len(old) + 1) // 2)
+
+
+def _middle_snake(a, a_lo, a_hi, b, b_lo, b_hi):
+    """Finds the middle snake of a shortest edit script for a[a_lo:a_hi]
+    and b[b_lo:b_hi] (Myers, "An O(ND) Difference Algorithm and Its
+    Variations", section 4b). Returns (x_start, y_start, x_end, y_end,
+    True) with its start and end as offsets into both ranges.
+
+    If the ranges differ by more than _MAX_DIFF_COST edits on each side of
+    it, returns a common part at least half as long as the longer range
+    instead, in the same way. Without one, returns the points the forward
+    and the backward search got furthest to as (x_start, y_start) and
+    (x_end, y_end) and False; the part between them is not a snake."""
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    forward = [0] * (2 * max_d + 3)
+    backward = [0] * (2 * max_d + 3)
+    for d in range(min(max_d, _MAX_DIFF_COST) + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (
+                k != d and forward[offset + k - 1] < forward[offset + k + 1]
+            ):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if (
+                odd
+                and delta - (d - 1) <= k <= delta + (d - 1)
+                and x + backward[offset + delta - k] >= n
+            ):
+                return x_start, y_start, x, y, True
+        for k in range(-d, d + 1, 2):
+            if k == -d or (
+                k != d and backward[offset + k - 1] < backward[offset + k + 1]
+            ):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if (
+                not odd
+                and -d <= delta - k <= d
+                and x + forward[offset + delta - k] >= n
+            ):
+                return n - x, m - y, n - x_start, m - y_start, True
+    common = _half_match(a[a_lo:a_hi], b[b_lo:b_hi])
+    if common is not None:
+        x, y, length = common
+        return x, y, x + length, y + length, True
+    # Every point reached costs at most _MAX_DIFF_COST edits from its end,
+    # so the parts up to them are diffed exactly.
+    x_start, y_start = _furthest_point(forward, offset, d, n, m)
+    x_end, y_end = _furthest_point(backward, offset, d, n, m)
+    x_end = n - x_end
+    y_end = m - y_end
+    if x_end < x_start or y_end < y_start:
+        # The searches passed each other on different diagonals.
+        x_end = n
+        y_end = m
+    return x_start, y_start, x_end, y_end, False
+
+
+def _furthest_point(furthest, offset, d, n, m):
+    """Returns the point of the search with 'd' edits that got furthest, as
+    (x, y) from where the search started."""
+    return max(
+        (
+            (furthest[offset + k], furthest[offset + k] - k)
+            for k in range(-d, d + 1, 2)
+            if furthest[offset + k] <= n and furthest[offset + k] - k <= m
+        ),
+        key=sum,
     )
 
 
+def _common_length(a, a_start, b, b_start, step):
+    """Returns how many items a and b have in common going from a_start and
+    b_start in the direction of 'step' (1 or -1)."""
+    length = 0
+    a_index = a_start
+    b_index = b_start
+    while 0 <= a_index < len(a) and 0 <= b_index < len(b) and a[a_index] == b[b_index]:
+        length += 1
+        a_index += step
+        b_index += step
+    return length
+
+
+def _half_match(a, b):
+    """Returns (a_start, b_start, length) of a part 'a' and 'b' have in
+    common that is at least half as long as the longer of them, or None.
+    Such a part contains the middle quarter or the one before it of the
+    longer string, so only those are looked for in the shorter one (as
+    diff-match-patch does it)."""
+    swapped = len(a) < len(b)
+    long, short = (b, a) if swapped else (a, b)
+    quarter = len(long) // 4
+    if not quarter:
+        return None
+    best = None
+    for start in (quarter, 2 * quarter):
+        seed = long[start : start + quarter]
+        found = short.find(seed)
+        while found != -1:
+            before = _common_length(long, start - 1, short, found - 1, -1)
+            after = _common_length(long, start, short, found, 1)
+            if best is None or before + after > best[2]:
+                best = (start - before, found - before, before + after)
+            found = short.find(seed, found + 1)
+    if best is None or 2 * best[2] < len(long):
+        return None
+    if swapped:
+        return best[1], best[0], best[2]
+    return best
+
+
+def _edit_script(a, a_lo, a_hi, b, b_lo, b_hi, ops):
+    """Appends an edit script turning a[a_lo:a_hi] into b[b_lo:b_hi] to
+    'ops' as ("=", text), ("-", text) and ("+", text). It is a shortest one
+    unless a part differs too much to search."""
+    suffixes = []
+    # The part after each snake is handled by the loop instead of a
+    # recursive call, since splitting a dissimilar region only takes off
+    # _MAX_DIFF_COST edits or so from its ends every time.
+    while True:
+        start = a_lo
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            a_lo += 1
+            b_lo += 1
+        if a_lo > start:
+            ops.append(("=", a[start:a_lo]))
+        end = a_hi
+        while a_hi > a_lo and b_hi > b_lo and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+        if a_hi < end:
+            suffixes.append([("=", a[a_hi:end])])
+        if a_lo == a_hi or b_lo == b_hi:
+            if a_lo < a_hi:
+                ops.append(("-", a[a_lo:a_hi]))
+            if b_lo < b_hi:
+                ops.append(("+", b[b_lo:b_hi]))
+            break
+        x_start, y_start, x_end, y_end, is_snake = _middle_snake(
+            a, a_lo, a_hi, b, b_lo, b_hi
+        )
+        _edit_script(a, a_lo, a_lo + x_start, b, b_lo, b_lo + y_start, ops)
+        if is_snake:
+            if x_end > x_start:
+                ops.append(("=", a[a_lo + x_start : a_lo + x_end]))
+            a_lo += x_end
+            b_lo += y_end
+            continue
+        # The search gave up: the part after where the backward search got
+        # is diffed on its own, the one in between by the next round.
+        tail = []
+        _edit_script(a, a_lo + x_end, a_hi, b, b_lo + y_end, b_hi, tail)
+        suffixes.append(tail)
+        a_hi = a_lo + x_end
+        b_hi = b_lo + y_end
+        a_lo += x_start
+        b_lo += y_start
+    for part in reversed(suffixes):
+        ops.extend(part)
+
+
+def _hunks(a, b):
+    """Returns the edit script of 'a' to 'b' as a list alternating between
+    matched text (str) and changes ([deleted, inserted])."""
+    ops = []
+    _edit_script(a, 0, len(a), b, 0, len(b), ops)
+    segments = [""]
+    for op, text in ops:
+        if op == "=":
+            if isinstance(segments[-1], str):
+                segments[-1] += text
+            else:
+                segments.append(text)
+            continue
+        if isinstance(segments[-1], str):
+            segments.append(["", ""])
+        segments[-1][op == "+"] += text
+    if not isinstance(segments[-1], str):
+        segments.append("")
+    return segments
+
+
+def _slide_left(segments):
+    """Moves every change as far to the front as the text allows, since an
+    edit that happens earlier is preferred."""
+    index = 1
+    while index < len(segments) - 1:
+        before = segments[index - 1]
+        deleted, inserted = segments[index]
+        moved = 0
+        while moved < len(before):
+            char = before[-1 - moved]
+            if deleted and deleted[-1 - moved % len(deleted)] != char:
+                break
+            if inserted and inserted[-1 - moved % len(inserted)] != char:
+                break
+            moved += 1
+        if not moved:
+            index += 2
+            continue
+        segments[index + 1] = before[-moved:] + segments[index + 1]
+        segments[index] = [_rotate(deleted, moved), _rotate(inserted, moved)]
+        segments[index - 1] = before[:-moved]
+        if index > 1 and not segments[index - 1]:
+            # Now adjacent to the previous change, which might move further.
+            previous = segments[index - 2]
+            segments[index - 2] = [
+                previous[0] + segments[index][0],
+                previous[1] + segments[index][1],
+            ]
+            del segments[index - 1 : index + 1]
+            index -= 2
+
+
+def _rotate(text, count):
+    """Moves the last 'count' characters of 'text' to its front."""
+    if not text:
+        return text
+    count %= len(text)
+    if not count:
+        return text
+    return text[-count:] + text[:-count]
+
+
+def _group_deletions(segments):
+    """Turns matched text right after a deletion into a deletion and an
+    insertion, up to the next newline. One change is preferred over a
+    deletion that is interrupted by a few matching characters. Text after
+    the last change is left alone."""
+    index = 1
+    while index < len(segments) - 2:
+        deleted, inserted = segments[index]
+        after = segments[index + 1]
+        if inserted or not deleted:
+            index += 2
+            continue
+        absorbed = after.find("\n")
+        if absorbed == -1:
+            absorbed = len(after)
+        segments[index] = [deleted + after[:absorbed], after[:absorbed]]
+        segments[index + 1] = after[absorbed:]
+        if not segments[index + 1]:
+            following = segments[index + 2]
+            segments[index] = [
+                segments[index][0] + following[0],
+                segments[index][1] + following[1],
+            ]
+            del segments[index + 1 : index + 3]
+        else:
+            index += 2
+
+
+def _split_lines(text):
+    """Splits 'text' into its lines and the newlines between them, leaving
+    out empty strings."""
+    return [part for part in re.split("(\n)", text) if part]
+
+
+def _advance(line, col, text):
+    """Returns the position after 'text' if it starts at 'line', 'col'."""
+    newlines = text.count("\n")
+    if not newlines:
+        return line, col + len(text)
+    return line + newlines, len(text) - text.rfind("\n") - 1
+
+
+def _change_edits(edits, line, col, deleted, inserted):
+    """Appends the edit commands that replace 'deleted' at 'line', 'col' by
+    'inserted' to 'edits'. Returns the position after the insertion."""
+    edits.extend(("D", line, col, part) for part in _split_lines(deleted))
+    for part in _split_lines(inserted):
+        edits.append(("I", line, col, part))
+        line, col = _advance(line, col, part)
+    return line, col
+
+
 def diff(a, b, sline=0):
     """
-    Return a list of deletions and insertions that will turn 'a' into 'b'. This
-    is done by traversing an implicit edit graph and searching for the shortest
-    route. The basic idea is as follows:
-
-        - Matching a character is free as long as there was no
-          deletion/insertion before. Then, matching will be seen as delete +
-          insert [1].
-        - Deleting one character has the same cost everywhere. Each additional
-          character costs only have of the first deletion.
-        - Insertion is cheaper the earlier it happens. The first character is
-          more expensive that any later [2].
-
-    [1] This is that world -> aolsa will be "D" world + "I" aolsa instead of
+    Return a list of deletions and insertions that will turn 'a' into 'b'.
+    The changes come from a shortest edit script (Myers' O(ND) algorithm in
+    linear space), which is then adjusted to the edits a user most likely
+    made:
+
+        - Every change is moved as far to the front as possible: an edit
+          that happens earlier is preferred [1].
+        - Matched text right after a deletion is deleted and inserted again,
+          up to the next newline, so a deletion is not interrupted by a few
+          matching characters [2].
+        - Deletions all happen at one position and insertions advance it.
+          Newlines are always deleted and inserted on their own.
+
+    [1] This is that "hello\n\n" -> "hello\n\n\n" will insert a newline
+        after hello and not after \n
+    [2] This is that world -> aolsa will be "D" world + "I" aolsa instead of
         "D" w , "D" rld, "I" a, "I" lsa
-    [2] This is that "hello\n\n" -> "hello\n\n\n" will insert a newline after
-        hello and not after \n
     """
-    d = defaultdict(list)
-    seen = defaultdict(lambda: sys.maxsize)
-
-    d[0] = [(0, 0, sline, 0, ())]
-    cost = 0
-    deletion_cost = len(a) + len(b)
-    insertion_cost = len(a) + len(b)
-    while True:
-        while len(d[cost]):
-            x, y, line, col, what = d[cost].pop()
-
-            if a[x:] == b[y:]:
-                return what
-
-            if x < len(a) and y < len(b) and a[x] == b[y]:
-                ncol = col + 1
-                nline = line
-                if a[x] == "\n":
-                    ncol = 0
-                    nline += 1
-                lcost = cost + 1
-                if (
-                    what
-                    and what[-1][0] == "D"
-                    and what[-1][1] == line
-                    and what[-1][2] == col
-                    and a[x] != "\n"
-                ):
-                    # Matching directly after a deletion should be as costly as
-                    # DELETE + INSERT + a bit
-                    lcost = (deletion_cost + insertion_cost) * 1.5
-                if seen[x + 1, y + 1] > lcost:
-                    d[lcost].append((x + 1, y + 1, nline, ncol, what))
-                    seen[x + 1, y + 1] = lcost
-            if y < len(b):  # INSERT
-                ncol = col + 1
-                nline = line
-                if b[y] == "\n":
-                    ncol = 0
-                    nline += 1
-                if (
-                    what
-                    and what[-1][0] == "I"
-                    and what[-1][1] == nline
-                    and what[-1][2] + len(what[-1][-1]) == col
-                    and b[y] != "\n"
-                    and seen[x, y + 1] > cost + (insertion_cost + ncol) // 2
-                ):
-                    seen[x, y + 1] = cost + (insertion_cost + ncol) // 2
-                    d[cost + (insertion_cost + ncol) // 2].append(
-                        (
-                            x,
-                            y + 1,
-                            line,
-                            ncol,
-                            (
-                                *what[:-1],
-                                ("I", what[-1][1], what[-1][2], what[-1][-1] + b[y]),
-                            ),
-                        )
-                    )
-                elif seen[x, y + 1] > cost + insertion_cost + ncol:
-                    seen[x, y + 1] = cost + insertion_cost + ncol
-                    d[cost + ncol + insertion_cost].append(
-                        (x, y + 1, nline, ncol, (*what, ("I", line, col, b[y])))
-                    )
-            if x < len(a):  # DELETE
-                if (
-                    what
-                    and what[-1][0] == "D"
-                    and what[-1][1] == line
-                    and what[-1][2] == col
-                    and a[x] != "\n"
-                    and what[-1][-1] != "\n"
-                    and seen[x + 1, y] > cost + deletion_cost // 2
-                ):
-                    seen[x + 1, y] = cost + deletion_cost // 2
-                    d[cost + deletion_cost // 2].append(
-                        (
-                            x + 1,
-                            y,
-                            line,
-                            col,
-                            (*what[:-1], ("D", line, col, what[-1][-1] + a[x])),
-                        )
-                    )
-                elif seen[x + 1, y] > cost + deletion_cost:
-                    seen[x + 1, y] = cost + deletion_cost
-                    d[cost + deletion_cost].append(
-                        (x + 1, y, line, col, (*what, ("D", line, col, a[x])))
-                    )
-        cost += 1
+    segments = _hunks(a, b)
+    _slide_left(segments)
+    _group_deletions(segments)
+    edits = []
+    line = sline
+    col = 0
+    for segment in segments:
+        if isinstance(segment, str):
+            line, col = _advance(line, col, segment)
+            continue
+        deleted, inserted = segment
+        line, col = _change_edits(edits, line, col, deleted, inserted)
+    return tuple(edits)
+
+
+def _unique_matches(a, b):
+    """Returns the pairs (i, j) with a[i] == b[j] of the items that occur
+    once in 'a' and once in 'b', keeping the longest series of them that
+    is in the same order in both (as in patience diff)."""
+    in_a = Counter(a)
+    in_b = Counter(b)
+    where_in_a = {item: i for i, item in enumerate(a) if in_a[item] == 1}
+    pairs = [
+        (where_in_a[item], j)
+        for j, item in enumerate(b)
+        if in_b[item] == 1 and item in where_in_a
+    ]
+    # Longest increasing subsequence of the positions in 'a'. ends[k] is
+    # the pair ending the best series of length k + 1 found so far.
+    ends = []
+    end_positions = []
+    previous = []
+    for index, (i, _) in enumerate(pairs):
+        k = bisect_left(end_positions, i)
+        previous.append(ends[k - 1] if k else None)
+        if k == len(ends):
+            ends.append(index)
+            end_positions.append(i)
+        else:
+            ends[k] = index
+            end_positions[k] = i
+    series = []
+    index = ends[-1] if ends else None
+    while index is not None:
+        series.append(pairs[index])
+        index = previous[index]
+    series.reverse()
+    return series
+
+
+def _line_hunks(old_lines, new_lines):
+    """Returns the changes of a line-level edit script of 'old_lines' to
+    'new_lines' as (old_lo, old_hi, new_lo, new_hi) ranges. Lines are
+    replaced by characters first, so comparing two lines costs one step. Lines
+    that occur once on both sides split the search, so that changes far
+    apart do not add up to the cost limit of one search."""
+    numbers = {}
+    a = "".join(chr(numbers.setdefault(line, len(numbers))) for line in old_lines)
+    b = "".join(chr(numbers.setdefault(line, len(numbers))) for line in new_lines)
+    ops = []
+    a_lo = b_lo = 0
+    for i, j in _unique_matches(a, b):
+        _edit_script(a, a_lo, i, b, b_lo, j, ops)
+        ops.append(("=", a[i : i + 1]))
+        a_lo = i + 1
+        b_lo = j + 1
+    _edit_script(a, a_lo, len(a), b, b_lo, len(b), ops)
+    hunks = []
+    old = new = 0
+    for op, items in ops:
+        if op == "=":
+            old += len(items)
+            new += len(items)
+            continue
+        if not hunks or hunks[-1][1] != old or hunks[-1][3] != new:
+            hunks.append([old, old, new, new])
+        if op == "-":
+            old += len(items)
+            hunks[-1][1] = old
+        else:
+            new += len(items)
+            hunks[-1][3] = new
+    return hunks
+
+
+def diff_lines(old_lines, new_lines, sline=0):
+    """Like diff("\n".join(old_lines), "\n".join(new_lines), sline), but
+    compares whole lines first and characters only within the lines that
+    changed. The cost follows the size of the change, not of the text."""
+    edits = []
+    for old_lo, old_hi, new_lo, new_hi in _line_hunks(old_lines, new_lines):
+        if old_lo == old_hi or new_lo == new_hi:
+            # Lines were only added or removed. Take a neighbouring line
+            # along so that the newline between them is part of the change.
+            if old_lo:
+                old_lo -= 1
+                new_lo -= 1
+            else:
+                old_hi += 1
+                new_hi += 1
+        # The hunks before this one are already applied, so its lines are
+        # where they are in the new text.
+        edits.extend(
+            diff(
+                "\n".join(old_lines[old_lo:old_hi]),
+                "\n".join(new_lines[new_lo:new_hi]),
+                sline + new_lo,
+            )
+        )
+    return tuple(edits)
 
 
 class _ChangeProvider:
@@ -195,81 +518,54 @@ def _byte_to_char_col(line, byte_col):
     return len(encoded[:byte_col].decode("utf-8", errors="replace"))
 
 
-def _on_bytes_to_edits(event, old_lines, new_buf, snippet_start):
-    """Translate one on_bytes event to edit commands.
+# Values per event in the flat list returned by on_bytes.lua's drain().
+_ON_BYTES_FIELDS = 7
 
-    event: (start_row, start_col, old_end_row, old_end_col, new_end_row, new_end_col)
-        Note: column values are UTF-8 BYTE offsets (Neovim convention).
+
+def _replay_on_bytes(events, old_lines, snippet_start):
+    """Translate on_bytes events to edit commands by applying them in order
+    to a copy of the snippet region.
+
+    events: (start_row, start_col, old_end_row, old_end_col, new_end_row,
+        new_end_col, text) in the order Neovim reported them. Column values
+        are UTF-8 BYTE offsets (Neovim convention); text is what the event
+        inserted, read from the buffer right after it.
     old_lines: remembered buffer slice (list of strings, snippet region)
-    new_buf: current full buffer (for reading inserted text)
     snippet_start: absolute line number of snippet start
 
-    Returns list of edit commands using CHARACTER columns (UltiSnips
-    convention), or None if the event extends beyond available data
-    (caller should fall back to detect_edits/diff).
+    The deleted text of every event is read from the copy, which at that
+    point holds the region as it was right before the event, so the cost
+    only depends on the size of the changes. Returns edit commands using
+    CHARACTER columns (UltiSnips convention), or None if an event reaches
+    outside the region (caller should fall back to detect_edits/diff_lines).
     """
-    start_row, start_col_b, old_end_row, old_end_col_b, new_end_row, new_end_col_b = (
-        event
-    )
-    rel_row = start_row - snippet_start
-
-    # Bounds checks: change must be within the snippet region we know about
-    if rel_row < 0 or rel_row >= len(old_lines):
-        return None
-    if old_end_row > 0 and rel_row + old_end_row >= len(old_lines):
-        return None
-    if new_end_row > 0 and start_row + new_end_row >= len(new_buf):
-        return None
-
+    region = list(old_lines)
     cmds = []
-    # The line at start_row exists in both old and new (change starts AT this
-    # row, not above), so byte→char conversion at start_col_b yields the same
-    # character position in both.
-    start_col = _byte_to_char_col(old_lines[rel_row], start_col_b)
-
-    # --- Deletion ---
-    if old_end_row == 0 and old_end_col_b > 0:
-        end_col = _byte_to_char_col(old_lines[rel_row], start_col_b + old_end_col_b)
-        deleted = old_lines[rel_row][start_col:end_col]
-        cmds.append(("D", start_row, start_col, deleted))
-    elif old_end_row > 0:
-        # Multi-line deletion — all at (start_row, start_col)
-        rest = old_lines[rel_row][start_col:]
-        if rest:
-            cmds.append(("D", start_row, start_col, rest))
-        cmds.append(("D", start_row, start_col, "\n"))
-        for i in range(1, old_end_row):
-            content = old_lines[rel_row + i]
-            if content:
-                cmds.append(("D", start_row, start_col, content))
-            cmds.append(("D", start_row, start_col, "\n"))
-        last_line = old_lines[rel_row + old_end_row]
-        last_end_col = _byte_to_char_col(last_line, old_end_col_b)
-        last = last_line[:last_end_col]
-        if last:
-            cmds.append(("D", start_row, start_col, last))
-
-    # --- Insertion ---
-    if new_end_row == 0 and new_end_col_b > 0:
-        end_col = _byte_to_char_col(new_buf[start_row], start_col_b + new_end_col_b)
-        inserted = new_buf[start_row][start_col:end_col]
-        cmds.append(("I", start_row, start_col, inserted))
-    elif new_end_row > 0:
-        first = new_buf[start_row][start_col:]
-        if first:
-            cmds.append(("I", start_row, start_col, first))
-        cmds.append(("I", start_row, start_col + len(first), "\n"))
-        for i in range(1, new_end_row):
-            content = new_buf[start_row + i]
-            if content:
-                cmds.append(("I", start_row + i, 0, content))
-            cmds.append(("I", start_row + i, len(content), "\n"))
-        last_new_line = new_buf[start_row + new_end_row]
-        last_end_col = _byte_to_char_col(last_new_line, new_end_col_b)
-        last_text = last_new_line[:last_end_col]
-        if last_text:
-            cmds.append(("I", start_row + new_end_row, 0, last_text))
-
+    for event in events:
+        start_row, start_col_b, old_end_row, old_end_col_b, new_end_row, _, text = event
+        rel_row = start_row - snippet_start
+        if (
+            rel_row < 0
+            or rel_row + old_end_row >= len(region)
+            or text.count("\n") != new_end_row
+        ):
+            return None
+        first = region[rel_row]
+        last = region[rel_row + old_end_row]
+        # The line at start_row exists before and after the event (change
+        # starts AT this row, not above), so byte→char conversion at
+        # start_col_b yields the same character position in both.
+        start_col = _byte_to_char_col(first, start_col_b)
+        if old_end_row:
+            end_col = _byte_to_char_col(last, old_end_col_b)
+        else:
+            end_col = _byte_to_char_col(first, start_col_b + old_end_col_b)
+        old = "\n".join(region[rel_row : rel_row + old_end_row + 1])
+        end = len(old) - len(last) + end_col
+        _change_edits(cmds, start_row, start_col, old[start_col:end], text)
+        region[rel_row : rel_row + old_end_row + 1] = (
+            old[:start_col] + text + old[end:]
+        ).split("\n")
     return cmds
 
 
@@ -521,7 +817,7 @@ def detect_edits(old_lines, new_lines, start_line, cursor_line, cursor_col):
 
 
 def _listener_to_edits(
-    event, old_lines, new_buf, snippet_start, cursor_line, cursor_col
+    event, old_lines, new_buf, snippet_start, cursor_line, cursor_col, new_lines=None
 ):
     """Translate a single Vim listener_add event to edit commands.
 
@@ -529,6 +825,8 @@ def _listener_to_edits(
         past last original changed line), 'added' (lines added; negative
         if removed), and 'col' (1-indexed BYTE start column on lnum, or
         1 if "unknown / whole line affected" per :help listener_add).
+    new_lines: the lines the change left, if known. They are read from
+        new_buf otherwise.
 
     For single-line changes with a known col (>1), translate directly:
     col gives a hard prefix anchor, so we can find the change span by
@@ -554,13 +852,15 @@ def _listener_to_edits(
     rel_start = start_0 - snippet_start
     if rel_start < 0 or rel_start + old_count > len(old_lines):
         return None
-    if start_0 + new_count > len(new_buf):
-        return None
+    if new_lines is None:
+        if start_0 + new_count > len(new_buf):
+            return None
+        new_lines = new_buf[start_0 : start_0 + new_count]
 
     # Fast deterministic path: single-line change with reliable col.
     if old_count == 1 and new_count == 1 and col_b > 1:
         old_line = old_lines[rel_start]
-        new_line = new_buf[start_0]
+        new_line = new_lines[0]
         prefix = _byte_to_char_col(old_line, col_b - 1)
         suffix = _suffix_match(old_line, new_line, prefix)
         deleted = old_line[prefix : len(old_line) - suffix if suffix else None]
@@ -572,18 +872,84 @@ def _listener_to_edits(
             cmds.append(("I", start_0, prefix, inserted))
         return cmds
 
+    # Lines inserted above lnum bring their own newlines.
+    if old_count == 0 and rel_start < len(old_lines):
+        cmds = []
+        _change_edits(cmds, start_0, 0, "", "".join(f"{line}\n" for line in new_lines))
+        return cmds
+
     # Multi-line or unknown-col path: scoped detect_edits.
     old_region = old_lines[rel_start : rel_start + old_count]
-    new_region = list(new_buf[start_0 : start_0 + new_count])
+    new_region = list(new_lines)
     return detect_edits(old_region, new_region, start_0, cursor_line, cursor_col)
 
 
+def _final_row(row, count, later_events):
+    """Returns where the 'count' (> 0) lines at 0-indexed 'row' are after
+    'later_events', or None if one of those changed them."""
+    for event in later_events:
+        lnum = int(event["lnum"]) - 1
+        end = int(event["end"]) - 1
+        if lnum >= row + count:
+            continue
+        # Lines inserted above 'row' have end == lnum == row.
+        if end > row:
+            return None
+        row += int(event["added"])
+    return row
+
+
+def _replay_listener(
+    events, old_lines, new_buf, snippet_start, cursor_line, cursor_col
+):
+    """Translate Vim listener_add events to edit commands by applying them
+    in order to a copy of the snippet region.
+
+    events: dicts like _listener_to_edits takes them, in the order the
+        changes were made. An event may carry the line it left as 'text'.
+
+    The lines an event left are its 'text', which holds even if a later
+    event changed them again, or else are read from new_buf, which only
+    works if no later event did. Returns None if an
+    event reaches outside the region or its lines cannot be known (caller
+    falls back to detect_edits/diff_lines).
+    """
+    region = list(old_lines)
+    cmds = []
+    for index, event in enumerate(events):
+        start = int(event["lnum"]) - 1
+        count = int(event["end"]) - int(event["lnum"]) + int(event["added"])
+        new_lines = []
+        if "text" in event:
+            new_lines = [event["text"]]
+        elif count:
+            row = _final_row(start, count, events[index + 1 :])
+            if row is None:
+                return None
+            new_lines = new_buf[row : row + count]
+            if len(new_lines) != count:
+                return None
+        es = _listener_to_edits(
+            event, region, new_buf, snippet_start, cursor_line, cursor_col, new_lines
+        )
+        if es is None:
+            return None
+        cmds.extend(es)
+        rel_start = start - snippet_start
+        region[rel_start : rel_start + int(event["end"]) - int(event["lnum"])] = (
+            new_lines
+        )
+    return cmds
+
+
 class VimChangeProvider(_ChangeProvider):
     """Uses listener_add() as a reliable change signal for Vim.
 
     listener_add() fires for ALL buffer modifications regardless of mode.
-    When a change is detected, we compare buffer snapshots and run
-    detect_edits/diff to produce edit commands.
+    The changes between CursorMoved calls are replayed in order on a copy
+    of the snippet region, each compared only within the lines it reports.
+    When that is not possible, we compare buffer snapshots and run
+    detect_edits/diff_lines to produce edit commands.
     """
 
     def __init__(self):
@@ -605,13 +971,10 @@ class VimChangeProvider(_ChangeProvider):
         vim.command("let g:_ultisnips_listener_suppressed = 0")
 
     def reset(self):
-        vim.command("call UltiSnips#listener#Flush()")
-        vim.command("let g:_ultisnips_listener_changes = []")
+        vim.command("call UltiSnips#listener#Drain()")
 
     def consume_edits(self, buf, snippet, vstate):
-        vim.command("call UltiSnips#listener#Flush()")
-        raw = vim.eval("g:_ultisnips_listener_changes")
-        vim.command("let g:_ultisnips_listener_changes = []")
+        raw = vim.eval("UltiSnips#listener#Drain()")
         if not raw:
             return None
 
@@ -619,15 +982,12 @@ class VimChangeProvider(_ChangeProvider):
         snippet_start = snippet.start.line
         pos = buf.cursor
 
-        if len(raw) == 1:
-            # Single event: use listener metadata to scope comparison
-            es = _listener_to_edits(
-                raw[0], old_lines, buf, snippet_start, pos.line, pos.col
-            )
-            if es is not None:
-                return es
+        # Use listener metadata to scope the comparison of every change
+        es = _replay_listener(raw, old_lines, buf, snippet_start, pos.line, pos.col)
+        if es is not None:
+            return es
 
-        # Multiple events or scoped detection failed: full snippet comparison
+        # Scoped detection failed: full snippet comparison
         new_end = snippet.end.line + (len(buf) - vstate.remembered_buffer_length)
         new_lines = buf[snippet_start : new_end + 1]
 
@@ -636,15 +996,16 @@ class VimChangeProvider(_ChangeProvider):
             return es
         if _is_pathological_diff_input(old_lines, new_lines):
             return DROP_SNIPPET
-        return diff("\n".join(old_lines), "\n".join(new_lines), snippet_start)
+        return diff_lines(old_lines, new_lines, snippet_start)
 
 
 class NvimChangeProvider(_ChangeProvider):
     """Uses on_bytes for deterministic edit detection in Neovim.
 
-    For single on_bytes events, translates the exact byte coordinates
-    directly to edit commands. For multiple events between CursorMoved
-    calls, falls back to buffer comparison via detect_edits/diff.
+    The on_bytes events between CursorMoved calls are replayed in order on
+    a copy of the snippet region, which translates their exact byte
+    coordinates directly to edit commands. Only events that reach outside
+    the region fall back to buffer comparison via detect_edits/diff_lines.
     """
 
     def attach(self, bufnr):
@@ -663,19 +1024,21 @@ class NvimChangeProvider(_ChangeProvider):
         vim.command("lua require('ultisnips.on_bytes').reset()")
 
     def consume_edits(self, buf, snippet, vstate):
-        raw = vim.eval("g:_ultisnips_nvim_changes")
-        vim.command("lua require('ultisnips.on_bytes').reset()")
-        if not raw:
+        # Takes and forgets the pending events in one round trip.
+        flat = vim.exec_lua("return require('ultisnips.on_bytes').drain()")
+        if not flat:
             return None
 
         old_lines = vstate.remembered_buffer
         snippet_start = snippet.start.line
 
-        if len(raw) == 1:
-            event = tuple(int(x) for x in raw[0])
-            es = _on_bytes_to_edits(event, old_lines, buf, snippet_start)
-            if es is not None:
-                return es
+        events = [
+            tuple(flat[i : i + _ON_BYTES_FIELDS])
+            for i in range(0, len(flat), _ON_BYTES_FIELDS)
+        ]
+        es = _replay_on_bytes(events, old_lines, snippet_start)
+        if es is not None:
+            return es
 
         new_end = snippet.end.line + (len(buf) - vstate.remembered_buffer_length)
         new_lines = buf[snippet_start : new_end + 1]
@@ -686,4 +1049,4 @@ class NvimChangeProvider(_ChangeProvider):
             return es
         if _is_pathological_diff_input(old_lines, new_lines):
             return DROP_SNIPPET
-        return diff("\n".join(old_lines), "\n".join(new_lines), snippet_start)
+        return diff_lines(old_lines, new_lines, snippet_start)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Compiles snippet directories into bundles outside of Vim.
+
+Usage: python -m UltiSnips.compile DIRECTORY...
+
+Run it with the `pythonx` directory of UltiSnips on the Python path. It
+writes the same bundles as :UltiSnipsCompile, see
+`:help UltiSnips-snippet-bundles`.
+"""
+
+import argparse
+import sys
+import types
+
+
+def _provide_vim_module():
+    """Parsing snippet files never calls into Vim, but the modules doing it
+    import `vim`. Outside of Vim, a module that only provides the names
+    needed at import time takes its place."""
+    try:
+        import vim
+    except ImportError:
+        vim = types.ModuleType("vim")
+        vim.error = type("error", (Exception,), {})
+        sys.modules["vim"] = vim
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m UltiSnips.compile",
+        description="Compile UltiSnips snippet directories into bundles.",
+    )
+    parser.add_argument("directories", nargs="+", metavar="DIRECTORY")
+    args = parser.parse_args(argv)
+
+    _provide_vim_module()
+    from UltiSnips.snippet.source.file.ulti_snips import compile_snippet_bundles
+
+    errors = []
+    for directory in args.directories:
+        for path in compile_snippet_bundles(directory, errors):
+            print(path)
+    for filename, message in errors:
+        print(f"{filename}: {message}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,9 @@
 """In memory representation of snippet definitions."""
 
+from UltiSnips.snippet.definition.base import (
+    PythonGlobals,
+    SnippetDefinition,
+    SnippetMatch,
+)
 from UltiSnips.snippet.definition.snipmate import SnipMateSnippetDefinition
 from UltiSnips.snippet.definition.ulti_snips import UltiSnipsSnippetDefinition
@@ -2,8 +2,11 @@
 
 """Snippet representation after parsing."""
 
+import contextlib
 import re
 import textwrap
+from collections import defaultdict
+from typing import NamedTuple
 
 import vim
 
@@ -11,12 +14,16 @@ from UltiSnips import vim_helper
 from UltiSnips.error import PebkacError
 from UltiSnips.indent_util import IndentUtil
 from UltiSnips.position import Position
-from UltiSnips.text import escape
 from UltiSnips.text_objects import SnippetInstance
 from UltiSnips.text_objects.python_code import SnippetUtilForAction, cached_compile
+from UltiSnips.word_boundary import current_word_boundaries
 
 __WHITESPACE_SPLIT = re.compile(r"\s")
 
+# The start of a regular expression that is anchored at the start of the
+# text, after any inline flags.
+_START_ANCHOR = re.compile(r"(?:\(\?[aiLmsux]+\))*(?:\^|\\A)")
+
 
 class _SnippetUtilCursor:
     def __init__(self, cursor):
@@ -56,6 +63,29 @@ def split_at_whitespace(string):
     return re.split(__WHITESPACE_SPLIT, string)
 
 
+def _trigger_window(trigger, before):
+    """Returns the end of 'before' that decides whether its last words
+    match 'trigger'. Its words match exactly when the words of all of
+    'before' do, so very long lines cost no more than short ones."""
+    return before[-(len(trigger) + 1) :]
+
+
+def _is_start_anchored(trigger):
+    """Returns true if the regular expression 'trigger' can only match at
+    the start of the line."""
+    return _START_ANCHOR.match(trigger) is not None
+
+
+def _regex_window_start(before, trigger=None):
+    """Returns where in 'before' the regular expression 'trigger' starts
+    looking for a match. See g:UltiSnipsRegexTriggerWindow. Triggers that
+    are anchored at the start of the line always look at all of it."""
+    window = SnippetDefinition.regex_trigger_window
+    if window <= 0 or (trigger is not None and _is_start_anchored(trigger)):
+        return 0
+    return max(0, len(before) - window)
+
+
 def _words_for_line(trigger, before, num_words=None):
     """Gets the final 'num_words' words from 'before'.
 
@@ -75,12 +105,63 @@ def _words_for_line(trigger, before, num_words=None):
     return before[len(before_words) :].strip()
 
 
+def _globals_source(globals):
+    """Returns the code that runs before any python code of a snippet whose
+    `global` blocks are 'globals'."""
+    return "\n".join(
+        [
+            "import re, os, vim, string, random",
+            "\n".join(globals.get("!p", [])).replace("\r\n", "\n"),
+        ]
+    )
+
+
+class PythonGlobals(defaultdict):
+    """The `global` blocks of one snippet file, shared by all of its
+    snippets. The `!p` blocks are compiled once for all of them, on first
+    use, and the code is released together with the file's snippets when the
+    file is reloaded."""
+
+    def __init__(self, *args):
+        super().__init__(list, *args)
+        self._compiled = None
+
+    def __reduce__(self):
+        # Like for SnippetDefinition, compiled code is not pickled.
+        return (self.__class__, (dict(self),))
+
+    def compiled(self):
+        """Returns the code object of the `!p` blocks."""
+        if self._compiled is None:
+            self._compiled = compile(_globals_source(self), "<global-snippets>", "exec")
+        return self._compiled
+
+
+class SnippetMatch(NamedTuple):
+    """The result of matching a snippet against the text before the cursor.
+    Matching leaves the snippet untouched, so results of the same snippet
+    can be held on to and launched independently."""
+
+    snippet: "SnippetDefinition"
+    # The text before the cursor that expanding the snippet replaces.
+    matched: str
+    # The match of a regular expression trigger, or None.
+    last_re: object
+    # The value of the context code, or None.
+    context: object
+
+
 class SnippetDefinition:
     """Represents a snippet as parsed from a file."""
 
     _INDENT = re.compile(r"^[ \t]*")
     _TABS = re.compile(r"^\t*")
 
+    # Number of characters before the cursor that regular expression
+    # triggers are matched against, or 0 for the whole line. Set from
+    # g:UltiSnipsRegexTriggerWindow by the SnippetManager.
+    regex_trigger_window = 1000
+
     def __init__(
         self,
         priority,
@@ -98,29 +179,37 @@ class SnippetDefinition:
         self._value = value
         self._description = description
         self._opts = options
-        self._matched = ""
-        self._last_re = None
+        # Compiled on first use. Holding on to it avoids going through the
+        # bounded cache of the re module, which large regex collections
+        # thrash.
+        self._trigger_regex = None
         self._globals = globals
         self._compiled_globals = None
         self._location = location
-
-        # Make sure that we actually match our trigger in case we are
-        # immediately expanded. At this point we don't take into
-        # account a any context code
-        self._context_code = None
-        self.matches(self._trigger)
-
         self._context_code = context
-        if context:
-            self._compiled_context_code = cached_compile(
-                "snip.context = " + context, "<context-code>", "exec"
-            )
-        self._context = None
+        self._compiled_context_code = None
         self._actions = actions or {}
-        self._compiled_actions = {
-            action: cached_compile(source, "<action-code>", "exec")
-            for action, source in self._actions.items()
-        }
+        # Context and action code is only compiled once it runs: most loaded
+        # snippets are never expanded.
+        self._compiled_actions = {}
+
+    def __reduce__(self):
+        # Only the constructor arguments are pickled (see the on-disk snippet
+        # cache); compiled code is recreated on load.
+        return (
+            self.__class__,
+            (
+                self._priority,
+                self._trigger,
+                self._value,
+                self._description,
+                self._opts,
+                self._globals,
+                self._location,
+                self._context_code,
+                self._actions,
+            ),
+        )
 
     def __repr__(self):
         return (
@@ -130,21 +219,19 @@ class SnippetDefinition:
         )
 
     def _re_match(self, trigger):
-        """Test if the current regex trigger matches `trigger`.
-
-        If so, set _last_re and _matched.
-
-        """
-        for match in re.finditer(self._trigger, trigger):
-            if match.end() != len(trigger):
-                continue
-            self._matched = trigger[match.start() : match.end()]
-
-            self._last_re = match
-            return match
-        return False
-
-    def _context_match(self, visual_content, before):
+        """Returns the match of the regex trigger that ends at the end of
+        `trigger`, or None."""
+        if self._trigger_regex is None:
+            self._trigger_regex = re.compile(self._trigger)
+        # Unlike slicing, a start position keeps lookbehinds working and
+        # '^' from matching inside the line.
+        start = _regex_window_start(trigger, self._trigger)
+        for match in self._trigger_regex.finditer(trigger, start):
+            if match.end() == len(trigger):
+                return match
+        return None
+
+    def _context_match(self, visual_content, before, last_re):
         # skip on empty buffer
         if len(vim.current.buffer) == 1 and vim.current.buffer[0] == "":
             return
@@ -162,11 +249,20 @@ class SnippetDefinition:
             locals["visual_text"] = visual_content.text
             locals["last_placeholder"] = visual_content.placeholder
 
+        if self._compiled_context_code is None:
+            self._compiled_context_code = self._compile(
+                "snip.context = " + self._context_code, "<context-code>"
+            )
         return self._eval_code(
-            "snip.context = " + self._context_code, locals, self._compiled_context_code
+            "snip.context = " + self._context_code,
+            locals,
+            self._compiled_context_code,
+            last_re,
         ).context
 
-    def _eval_code(self, code, additional_locals=None, compiled_code=None):
+    def _eval_code(
+        self, code, additional_locals=None, compiled_code=None, last_re=None
+    ):
         if additional_locals is None:
             additional_locals = {}
         current = vim.current
@@ -186,24 +282,23 @@ class SnippetDefinition:
         try:
             if self._compiled_globals is None:
                 self._precompile_globals()
-            glob = {"snip": snip, "match": self._last_re}
+            glob = {"snip": snip, "match": last_re}
             exec(self._compiled_globals, glob)
             exec(compiled_code or code, glob)
         except Exception as e:
-            code = "\n".join(
-                [
-                    "import re, os, vim, string, random",
-                    "\n".join(self._globals.get("!p", [])).replace("\r\n", "\n"),
-                    code,
-                ]
-            )
+            code = _globals_source(self._globals) + "\n" + code
             self._make_debug_exception(e, code)
             raise
 
         return snip
 
     def _execute_action(
-        self, action, context, additional_locals=None, compiled_action=None
+        self,
+        action,
+        context,
+        additional_locals=None,
+        compiled_action=None,
+        last_re=None,
     ):
         if additional_locals is None:
             additional_locals = {}
@@ -222,7 +317,7 @@ class SnippetDefinition:
             locals = {"context": context}
             locals.update(additional_locals)
 
-            snip = self._eval_code(action, locals, compiled_action)
+            snip = self._eval_code(action, locals, compiled_action, last_re)
 
             if snip.cursor.is_set():
                 vim_helper.buf.cursor = Position(
@@ -265,17 +360,66 @@ class SnippetDefinition:
 
         e.snippet_code = code
 
+    def _compile(self, source, filename):
+        try:
+            return cached_compile(source, filename, "exec")
+        except SyntaxError as e:
+            self._make_debug_exception(e, source)
+            raise
+
+    def _compiled_action(self, action):
+        compiled = self._compiled_actions.get(action)
+        if compiled is None:
+            compiled = self._compile(self._actions[action], "<action-code>")
+            self._compiled_actions[action] = compiled
+        return compiled
+
+    def _precompiled_code(self):
+        """Compiles the global, context and action code of this snippet and
+        returns it as a dict that can be marshalled (see the snippet
+        bundles). Code with syntax errors is left out, so that the error is
+        reported when the snippet is used."""
+        sources = {"action:" + name: code for name, code in self._actions.items()}
+        if self._context_code:
+            sources["context"] = "snip.context = " + self._context_code
+        code = {}
+        with contextlib.suppress(SyntaxError):
+            self._precompile_globals()
+            code["globals"] = self._compiled_globals
+        for key, source in sources.items():
+            filename = "<context-code>" if key == "context" else "<action-code>"
+            with contextlib.suppress(SyntaxError):
+                code[key] = cached_compile(source, filename, "exec")
+        return code
+
+    def _use_precompiled_code(self, code):
+        """Installs code returned by '_precompiled_code', so that it does
+        not need to be compiled on first use."""
+        self._compiled_globals = code.get("globals", self._compiled_globals)
+        if "globals" in code and isinstance(self._globals, PythonGlobals):
+            self._globals._compiled = code["globals"]
+        self._compiled_context_code = code.get("context", self._compiled_context_code)
+        for key, compiled in code.items():
+            if key.startswith("action:"):
+                self._compiled_actions[key[len("action:") :]] = compiled
+
+    def _initial_match(self):
+        """Matches the snippet against its own trigger, ignoring any context
+        code. This is the match of snippets that are expanded without being
+        matched first, for example anonymous snippets."""
+        match = self._match_trigger(self._trigger)
+        if match is None:
+            return SnippetMatch(self, "", None, None)
+        return match
+
     def _precompile_globals(self):
-        self._compiled_globals = cached_compile(
-            "\n".join(
-                [
-                    "import re, os, vim, string, random",
-                    "\n".join(self._globals.get("!p", [])).replace("\r\n", "\n"),
-                ]
-            ),
-            "<global-snippets>",
-            "exec",
-        )
+        if isinstance(self._globals, PythonGlobals):
+            # Shared with all other snippets of the same file.
+            self._compiled_globals = self._globals.compiled()
+        else:
+            self._compiled_globals = cached_compile(
+                _globals_source(self._globals), "<global-snippets>", "exec"
+            )
 
     def has_option(self, opt):
         """Check if the named option is set."""
@@ -297,39 +441,46 @@ class SnippetDefinition:
         """The trigger text for the snippet."""
         return self._trigger
 
-    @property
-    def matched(self):
-        """The last text that matched this snippet in match() or
-        could_match()."""
-        return self._matched
-
     @property
     def location(self):
         """Where this snippet was defined."""
         return self._location
 
-    @property
-    def context(self):
-        """The matched context."""
-        return self._context
-
     def matches(self, before, visual_content=None):
         """Returns True if this snippet matches 'before'."""
+        return self.match(before, visual_content) is not None
+
+    def match(self, before, visual_content=None):
+        """Returns the SnippetMatch of this snippet for 'before', or None if
+        it does not match."""
+        match = self._match_trigger(before)
+        if match is None or not self._context_code:
+            return match
+        context = self._context_match(visual_content, before, match.last_re)
+        if not context:
+            return None
+        return match._replace(context=context)
+
+    def _match_trigger(self, before):
+        """Like match(), but ignores the context code."""
         # If user supplies both "w" and "i", it should perhaps be an
         # error, but if permitted it seems that "w" should take precedence
         # (since matching at word boundary and within a word == matching at word
         # boundary).
-        self._matched = ""
+        matched = ""
+        last_re = None
 
-        words = _words_for_line(self._trigger, before)
+        words = _words_for_line(self._trigger, _trigger_window(self._trigger, before))
 
         if "r" in self._opts:
             try:
-                match = self._re_match(before)
+                last_re = self._re_match(before)
             except Exception as e:
                 self._make_debug_exception(e)
                 raise
-
+            match = last_re is not None
+            if match:
+                matched = last_re.group(0)
         elif "w" in self._opts:
             words_len = len(self._trigger)
             words_prefix = words[:-words_len]
@@ -337,8 +488,9 @@ class SnippetDefinition:
             match = words_suffix == self._trigger
             if match and words_prefix:
                 # Require a word boundary between prefix and suffix.
-                boundary_chars = escape(words_prefix[-1:] + words_suffix[:1], r"\"")
-                match = vim_helper.eval(f'"{boundary_chars}" =~# "\\\\v.<."') != "0"
+                match = current_word_boundaries().is_word_start(
+                    words_prefix[-1], words_suffix[0]
+                )
         elif "i" in self._opts:
             match = words.endswith(self._trigger)
         elif "p" in self._opts:
@@ -348,52 +500,54 @@ class SnippetDefinition:
             # they actually typed.
             match = bool(words) and self._trigger.startswith(words)
             if match:
-                self._matched = words
+                matched = words
         else:
             match = words == self._trigger
 
+        if not match:
+            return None
+
         # By default, we match the whole trigger
-        if match and not self._matched:
-            self._matched = self._trigger
+        if not matched:
+            matched = self._trigger
 
         # Ensure the match was on a word boundry if needed
-        if "b" in self._opts and match:
-            text_before = before.rstrip()[: -len(self._matched)]
+        if "b" in self._opts:
+            text_before = before.rstrip()[: -len(matched)]
             if text_before.strip(" \t") != "":
-                self._matched = ""
-                return False
+                return None
 
-        self._context = None
-        if match and self._context_code:
-            self._context = self._context_match(visual_content, before)
-            if not self.context:
-                match = False
-
-        return match
+        return SnippetMatch(self, matched, last_re, None)
 
     def could_match(self, before):
         """Return True if this snippet could match the (partial) 'before'."""
-        self._matched = ""
+        return self.partial_match(before) is not None
+
+    def partial_match(self, before):
+        """Returns the SnippetMatch of this snippet for the (partial)
+        'before', or None if it could not match. Context code is not run."""
+        matched = ""
+        last_re = None
 
         # List all on whitespace.
         if before and before[-1] in (" ", "\t"):
             before = ""
         if before and before.rstrip() is not before:
-            return False
+            return None
 
-        words = _words_for_line(self._trigger, before)
+        words = _words_for_line(self._trigger, _trigger_window(self._trigger, before))
 
         if "r" in self._opts:
             # Test for full match only
-            match = self._re_match(before)
+            last_re = self._re_match(before)
+            match = last_re is not None
+            if match:
+                matched = last_re.group(0)
         elif "w" in self._opts:
             # Trim non-empty prefix up to word boundary, if present.
-            qwords = escape(words, r"\"")
-            words_suffix = vim_helper.eval(
-                f'substitute("{qwords}", "\\\\v^.+<(.+)", "\\\\1", "")'
-            )
+            words_suffix = words[current_word_boundaries().last_word_start(words) :]
             match = self._trigger.startswith(words_suffix)
-            self._matched = words_suffix
+            matched = words_suffix
         elif "i" in self._opts:
             # In-word snippets can appear after arbitrary non-word
             # characters, so check if the trigger starts with any
@@ -402,42 +556,46 @@ class SnippetDefinition:
             for i in range(len(words)):
                 if self._trigger.startswith(words[i:]):
                     match = True
-                    self._matched = words[i:]
+                    matched = words[i:]
                     break
         else:
             match = self._trigger.startswith(words)
 
+        if not match:
+            return None
+
         # By default, we match the words from the trigger
-        if match and not self._matched:
-            self._matched = words
+        if not matched:
+            matched = words
 
         # Ensure the match was on a word boundry if needed
-        if "b" in self._opts and match:
-            text_before = before.rstrip()[: -len(self._matched)]
+        if "b" in self._opts:
+            text_before = before.rstrip()[: -len(matched)]
             if text_before.strip(" \t") != "":
-                self._matched = ""
-                return False
+                return None
 
-        return match
+        return SnippetMatch(self, matched, last_re, None)
 
     def instantiate(self, snippet_instance, initial_text, indent):
         """Parses the content of this snippet and brings the corresponding text
         objects alive inside of Vim."""
         raise NotImplementedError()
 
-    def do_pre_expand(self, visual_content, snippets_stack):
+    def do_pre_expand(self, match, visual_content, snippets_stack):
+        """Runs the `pre_expand` action for 'match'. Returns whether the
+        action set the cursor, and 'match' with the context it left."""
         if "pre_expand" in self._actions:
             locals = {"buffer": vim_helper.buf, "visual_content": visual_content}
 
             snip = self._execute_action(
                 self._actions["pre_expand"],
-                self._context,
+                match.context,
                 locals,
-                self._compiled_actions["pre_expand"],
+                self._compiled_action("pre_expand"),
+                match.last_re,
             )
-            self._context = snip.context
-            return snip.cursor.is_set()
-        return False
+            return snip.cursor.is_set(), match._replace(context=snip.context)
+        return False, match
 
     def do_post_expand(self, start, end, snippets_stack):
         if "post_expand" in self._actions:
@@ -451,7 +609,8 @@ class SnippetDefinition:
                 self._actions["post_expand"],
                 snippets_stack[-1].context,
                 locals,
-                self._compiled_actions["post_expand"],
+                self._compiled_action("post_expand"),
+                snippets_stack[-1].last_re,
             )
 
             snippets_stack[-1].context = snip.context
@@ -471,7 +630,8 @@ class SnippetDefinition:
                 self._actions["post_finish"],
                 snippet_instance.context,
                 locals,
-                self._compiled_actions["post_finish"],
+                self._compiled_action("post_finish"),
+                snippet_instance.last_re,
             )
 
     def do_post_jump(
@@ -501,7 +661,8 @@ class SnippetDefinition:
                 self._actions["post_jump"],
                 current_snippet.context,
                 locals,
-                self._compiled_actions["post_jump"],
+                self._compiled_action("post_jump"),
+                current_snippet.last_re,
             )
 
             current_snippet.context = snip.context
@@ -509,9 +670,9 @@ class SnippetDefinition:
             return snip.cursor.is_set()
         return False
 
-    def launch(self, text_before, visual_content, parent, start, end):
-        """Launch this snippet, overwriting the text 'start' to 'end' and
-        keeping the 'text_before' on the launch line.
+    def launch(self, match, text_before, visual_content, parent, start, end):
+        """Launch this snippet for 'match', overwriting the text 'start' to
+        'end' and keeping the 'text_before' on the launch line.
 
         'Parent' is the parent snippet instance if any.
 
@@ -543,9 +704,9 @@ class SnippetDefinition:
             start,
             end,
             visual_content,
-            last_re=self._last_re,
+            last_re=match.last_re,
             globals=self._globals,
-            context=self._context,
+            context=match.context,
             _compiled_globals=self._compiled_globals,
         )
         self.instantiate(snippet_instance, initial_text, indent)
@@ -24,5 +24,11 @@ class SnipMateSnippetDefinition(SnippetDefinition):
             {},
         )
 
+    def __reduce__(self):
+        return (
+            self.__class__,
+            (self._trigger, self._value, self._description, self._location),
+        )
+
     def instantiate(self, snippet_instance, initial_text, indent):
         parse_and_instantiate(snippet_instance, initial_text, indent)
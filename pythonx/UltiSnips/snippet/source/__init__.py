@@ -7,6 +7,8 @@ from UltiSnips.snippet.source.base import SnippetSource
 from UltiSnips.snippet.source.file.snipmate import SnipMateFileSource
 from UltiSnips.snippet.source.file.ulti_snips import (
     UltiSnipsFileSource,
+    compile_snippet_bundles,
     find_all_snippet_directories,
     find_snippet_files,
 )
+from UltiSnips.snippet.source.resolved import ResolvedSnippets
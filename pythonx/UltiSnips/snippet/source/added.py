@@ -11,3 +11,7 @@ class AddedSnippetsSource(SnippetSource):
     def add_snippet(self, ft, snippet):
         """Adds the given 'snippet' for 'ft'."""
         self._snippets[ft].add_snippet(snippet)
+        self.generation += 1
+
+    def get_all_snippets(self, filetypes):
+        return self._all_snippets(filetypes)
@@ -16,6 +16,12 @@ class SnippetSource:
         # which keeps `get_deep_extends` deterministic — see issue surfaced in
         # `DuplicateSnippets_DoesNotMergeDistinctTriggers`.
         self._extends = defaultdict(dict)
+        # tuple of base filetypes -> result of get_deep_extends. Cleared
+        # whenever '_extends' changes.
+        self._deep_extends = {}
+        # Incremented whenever the snippets or extends change, see
+        # get_all_snippets.
+        self.generation = 0
 
     def ensure(self, filetypes):
         """Ensures that snippets are loaded."""
@@ -25,6 +31,27 @@ class SnippetSource:
         ensure.
         """
 
+    def preload(self, filetypes):
+        """Starts loading the snippets for 'filetypes' in the background.
+        Returns true if there is work to wait for with finish_preload."""
+        return False
+
+    def finish_preload(self, wait=False):
+        """Merges the snippets loaded in the background. If 'wait' is true,
+        blocks until all of them are loaded. Returns true while loading is
+        still in progress."""
+        return False
+
+    def watched_directories(self):
+        """Returns the directories holding the files of this source, which
+        are watched for changes if g:UltiSnipsWatchSnippetDirectories is
+        set."""
+        return []
+
+    def files_changed(self, paths):
+        """Called with the paths that changed in the watched directories.
+        Sources make sure that snippets from them are reloaded."""
+
     def get_all_snippet_files_for(self, ft):
         """Returns the set of on-disk snippet files this source would load
         for filetype 'ft'. Returns an empty set for sources that don't
@@ -58,6 +85,20 @@ class SnippetSource:
             )
         return result
 
+    def get_all_snippets(self, filetypes):
+        """Returns all snippets for 'filetypes' and their parents, in the
+        order get_snippets considers them, or None if get_snippets must be
+        asked on every lookup, for example because it creates snippets on
+        the fly. Sources that return them must increment 'generation'
+        whenever they change."""
+        return
+
+    def _all_snippets(self, filetypes):
+        result = []
+        for ft in self._get_existing_deep_extends(filetypes):
+            result.extend(self._snippets[ft])
+        return result
+
     def get_clear_priority(self, filetypes):
         """Get maximum clearsnippets priority without arguments for specified
         filetypes, if any.
@@ -86,8 +127,12 @@ class SnippetSource:
     def update_extends(self, child_ft, parent_fts):
         """Update the extending relation by given child filetype and its parent
         filetypes."""
+        parents = self._extends[child_ft]
         for ft in parent_fts:
-            self._extends[child_ft][ft] = None
+            if ft not in parents:
+                parents[ft] = None
+                self._deep_extends.clear()
+                self.generation += 1
 
     def get_deep_extends(self, base_filetypes):
         """Return the list of filetypes that is directly or transitively
@@ -98,15 +143,30 @@ class SnippetSource:
         directives. A stable order matters: the "Multiple matches" prompt
         and per-trigger priority resolution both walk this list, so two
         Vim sessions must agree on which snippet is "first".
+
+        The result is cached until the `extends` relation changes, so all
+        callers share the same list and must not modify it.
         """
-        seen = {}  # dict gives us an order-preserving set
-        for ft in base_filetypes:
-            seen.setdefault(ft, None)
-        todo_fts = list(seen)
-        while todo_fts:
-            todo_ft = todo_fts.pop(0)
-            for parent_ft in self._extends[todo_ft]:
+        key = tuple(base_filetypes)
+        deep_extends = self._deep_extends.get(key)
+        if deep_extends is None:
+            deep_extends = self._deep_extends[key] = self._resolve_extends(key)
+        return deep_extends
+
+    def _resolve_extends(self, base_filetypes):
+        """Computes the result of get_deep_extends."""
+        seen = dict.fromkeys(base_filetypes)  # an order-preserving set
+        result = list(seen)
+        # Appending while iterating makes this a breadth-first search.
+        for todo_ft in result:
+            for parent_ft in self._extends.get(todo_ft, ()):
                 if parent_ft not in seen:
                     seen[parent_ft] = None
-                    todo_fts.append(parent_ft)
-        return list(seen)
+                    result.append(parent_ft)
+        return result
+
+    def _forget_extends(self, ft):
+        """Removes everything 'ft' extends."""
+        if self._extends.pop(ft, None):
+            self._deep_extends.clear()
+            self.generation += 1
@@ -5,6 +5,15 @@
 from UltiSnips import vim_helper
 from UltiSnips.error import PebkacError
 from UltiSnips.snippet.source.base import SnippetSource
+from UltiSnips.snippet.source.file.cache import file_signature
+from UltiSnips.snippet.source.file.common import normalize_file_path
+from UltiSnips.snippet.source.file.parallel import (
+    can_fork,
+    parse_in_parallel,
+    worker_count,
+)
+from UltiSnips.snippet.source.file.preload import PreloadJob
+from UltiSnips.snippet.source.snippet_dictionary import SnippetDictionary
 
 
 class SnippetSyntaxError(PebkacError):
@@ -17,10 +26,78 @@ class SnippetSyntaxError(PebkacError):
 class SnippetFileSource(SnippetSource):
     """Base class that abstracts away 'extends' info and file hashes."""
 
+    def __init__(self, cache=None, parallel_threshold=None):
+        super().__init__()
+        self._cache = cache
+        # Minimum number of bytes to parse before worker processes are used,
+        # or None to always parse in this process.
+        self._parallel_threshold = parallel_threshold
+        # ft -> {filename: signature} of the files each bucket was built from.
+        self._file_signatures = {}
+        # filename -> (signature, events) of every file backing a bucket.
+        self._parsed_files = {}
+        # Buckets that must be checked against the disk before their next use.
+        self._unverified = set()
+        self._preload_jobs = []
+
     def ensure(self, filetypes):
+        loaded = False
         for ft in self.get_deep_extends(filetypes):
             if self._needs_update(ft):
                 self._load_snippets_for(ft)
+                loaded = True
+        if loaded:
+            self._forget_unused_files()
+
+    def preload(self, filetypes):
+        """Starts parsing the files of every filetype in 'filetypes' and
+        their parents that is not loaded yet in a background thread."""
+        pending = set()
+        for job in self._preload_jobs:
+            pending.update(job.filetypes)
+        stale = [
+            ft
+            for ft in self.get_deep_extends(filetypes)
+            if (ft not in self._snippets or ft in self._unverified)
+            and ft not in pending
+        ]
+        if not stale:
+            return False
+        self._preload_jobs.append(
+            PreloadJob(
+                stale,
+                self._file_finder(),
+                self._read_events,
+                dict(self._parsed_files),
+            )
+        )
+        return True
+
+    def finish_preload(self, wait=False):
+        """Builds the buckets of all finished preload jobs. If 'wait' is
+        true, running jobs are waited for first. Returns true while jobs are
+        still running."""
+        if wait:
+            for job in self._preload_jobs:
+                job.wait()
+        done = [job for job in self._preload_jobs if job.done()]
+        if not done:
+            return bool(self._preload_jobs)
+        self._preload_jobs = [job for job in self._preload_jobs if job not in done]
+        filetypes = []
+        for job in done:
+            self._parsed_files.update(job.parsed)
+            filetypes.extend(job.filetypes)
+        try:
+            self.ensure(filetypes)
+        except PebkacError:
+            # Drop the half built buckets, so that the error is reported by
+            # the next expansion instead of being lost in a timer.
+            for ft in self.get_deep_extends(filetypes):
+                if ft not in self._file_signatures:
+                    self._snippets.pop(ft, None)
+            self.generation += 1
+        return bool(self._preload_jobs)
 
     def get_snippets(
         self, filetypes, before, possible, autotrigger_only, visual_content
@@ -43,27 +120,95 @@ class SnippetFileSource(SnippetSource):
             result.append(snippet)
         return result
 
+    def get_all_snippets(self, filetypes):
+        if type(self).get_snippets is not SnippetFileSource.get_snippets:
+            return None
+        # Deduplicated like in get_snippets: snippets with the same trigger
+        # and location are the same definition, so they match alike.
+        seen = set()
+        result = []
+        for snippet in self._all_snippets(filetypes):
+            key = (snippet.trigger, snippet.location)
+            if key not in seen:
+                seen.add(key)
+                result.append(snippet)
+        return result
+
     def refresh(self):
-        self.__init__()
+        """Marks every loaded filetype for re-validation. Only the buckets
+        whose files were added, removed or changed on disk are rebuilt on the
+        next call to ensure, and unchanged files are not parsed again."""
+        self._unverified.update(self._snippets)
+
+    def files_changed(self, paths):
+        """Marks the buckets built from any of 'paths' for re-validation. A
+        path no bucket was built from might be a new snippet file, so all
+        buckets are checked then. Either way, only buckets whose files
+        really changed are rebuilt on the next call to ensure."""
+        paths = {normalize_file_path(path) for path in paths}
+        known = set()
+        for ft, signatures in self._file_signatures.items():
+            if not paths.isdisjoint(signatures):
+                self._unverified.add(ft)
+            known.update(signatures)
+        if not paths <= known:
+            self.refresh()
 
     def get_all_snippet_files_for(self, ft):
         """Returns a set of all files that define snippets for 'ft'."""
         raise NotImplementedError()
 
+    def _file_finder(self):
+        """Returns a function behaving like 'get_all_snippet_files_for' that
+        can be called from a background thread."""
+        return self.get_all_snippet_files_for
+
     def _parse_snippet_file(self, filedata, filename):
         """Parses 'filedata' as a snippet file and yields events."""
         raise NotImplementedError()
 
+    def _file_parser(self):
+        """Returns a module level function behaving like
+        '_parse_snippet_file' that can be sent to worker processes, or None
+        if files must be parsed in this process."""
+        return
+
     def _needs_update(self, ft):
         """Returns true if any files for 'ft' have changed and must be
         reloaded."""
-        return ft not in self._snippets
+        if ft not in self._snippets:
+            return True
+        if ft not in self._unverified:
+            return False
+        self._unverified.discard(ft)
+        return self._files_changed(ft)
+
+    def _files_changed(self, ft):
+        """Returns true if the files backing 'ft' differ from the ones its
+        bucket was built from."""
+        known = self._file_signatures.get(ft)
+        if known is None:
+            # The last load of 'ft' failed half way through.
+            return True
+        if known.keys() != self.get_all_snippet_files_for(ft):
+            return True
+        return any(file_signature(fn) != sig for fn, sig in known.items())
 
     def _load_snippets_for(self, ft):
         """Load all snippets for the given 'ft'."""
-        assert ft not in self._snippets
-        for fn in self.get_all_snippet_files_for(ft):
-            self._parse_snippets(ft, fn)
+        # Start from an empty bucket: 'ft' is either new or one of its files
+        # changed, and 'extends' lines are only ever read from its own files.
+        self._snippets[ft] = SnippetDictionary()
+        self.generation += 1
+        self._forget_extends(ft)
+        self._file_signatures.pop(ft, None)
+        signatures = {}
+        filenames = list(self.get_all_snippet_files_for(ft))
+        self._load_bundles(ft)
+        self._parse_in_parallel(filenames)
+        for fn in filenames:
+            signatures[fn] = self._parse_snippets(ft, fn)
+        self._file_signatures[ft] = signatures
         # Now load for the parents
         for parent_ft in self.get_deep_extends([ft]):
             if parent_ft != ft and self._needs_update(parent_ft):
@@ -73,12 +218,100 @@ class SnippetFileSource(SnippetSource):
         # searches down Vim's 'runtimepath'.
         self._snippets[ft]
 
-    def _parse_snippets(self, ft, filename):
-        """Parse the 'filename' for the given 'ft'."""
+    def _load_bundles(self, ft):
+        """Fills the memo with the files of 'ft' found in compiled bundles.
+        Only sources that support bundles do anything here."""
+
+    def _is_parsed(self, filename, signature):
+        """Returns true if the memo holds the events of 'filename' for
+        'signature'."""
+        parsed = self._parsed_files.get(filename)
+        return parsed is not None and signature is not None and parsed[0] == signature
+
+    def _parse_in_parallel(self, filenames):
+        """Parses the files in 'filenames' that are neither parsed already
+        nor in the on-disk cache in worker processes, if parallel parsing is
+        enabled and they are large enough to pay for starting the workers.
+        The events are only stored, the caller still applies them one file
+        after the other in its own order."""
+        parse = self._file_parser()
+        if (
+            self._parallel_threshold is None
+            or parse is None
+            or worker_count() < 2
+            or not can_fork()
+        ):
+            return
+        kind = type(self).__name__
+        stale = {}
+        for fn in filenames:
+            signature = file_signature(fn)
+            if signature is None or self._is_parsed(fn, signature):
+                continue
+            if self._cache is not None:
+                events = self._cache.load(kind, fn, signature)
+                if events is not None:
+                    self._parsed_files[fn] = (signature, events)
+                    continue
+            stale[fn] = signature
+        size = sum(signature[1] for signature in stale.values())
+        if len(stale) < 2 or size < self._parallel_threshold:
+            return
+        try:
+            parsed = parse_in_parallel(parse, list(stale))
+        except Exception:
+            # Most likely the workers could not be started. Parse serially.
+            return
+        for fn, events in parsed.items():
+            self._parsed_files[fn] = (stale[fn], events)
+            if self._cache is not None:
+                self._cache.store(kind, fn, stale[fn], events)
+
+    def _forget_unused_files(self):
+        """Drops parsed files that no bucket is built from anymore."""
+        used = set()
+        for signatures in self._file_signatures.values():
+            used.update(signatures)
+        for fn in self._parsed_files.keys() - used:
+            del self._parsed_files[fn]
+
+    def _events_for_file(self, filename):
+        """Returns the signature of 'filename' and the list of its events.
+        The events are reused if the file did not change since it was last
+        parsed, either in this session or, with the cache enabled, in an
+        earlier one."""
+        # Stat before reading, so that a write racing with us leaves a
+        # signature that no longer matches the file instead of a stale one.
+        signature = file_signature(filename)
+        if self._is_parsed(filename, signature):
+            return self._parsed_files[filename]
+        events = self._read_events(filename, signature)
+        self._parsed_files[filename] = (signature, events)
+        return signature, events
+
+    def _read_events(self, filename, signature):
+        """Returns the list of events in 'filename', taken from the on-disk
+        cache if it has an entry for 'signature'. Does not call into Vim, so
+        it can be used from a background thread."""
+        kind = type(self).__name__
+        use_cache = self._cache is not None and signature is not None
+        if use_cache:
+            events = self._cache.load(kind, filename, signature)
+            if events is not None:
+                return events
         with open(filename, encoding="utf-8-sig") as to_read:
             file_data = to_read.read()
+        events = list(self._parse_snippet_file(file_data, filename))
+        if use_cache:
+            self._cache.store(kind, filename, signature, events)
+        return events
+
+    def _parse_snippets(self, ft, filename):
+        """Parse the 'filename' for the given 'ft' and return the signature of
+        the file."""
         self._snippets[ft]  # Make sure the dictionary exists
-        for event, data in self._parse_snippet_file(file_data, filename):
+        signature, events = self._events_for_file(filename)
+        for event, data in events:
             if event == "error":
                 msg, line_index = data
                 filename = vim_helper.eval(
@@ -96,6 +329,4 @@ class SnippetFileSource(SnippetSource):
                 self._snippets[ft].add_snippet(snippet)
             else:
                 raise AssertionError(f"Unhandled {event}: {data!r}")
-        # precompile global snippets code for all snipepts we just sourced
-        for snippet in self._snippets[ft]:
-            snippet._precompile_globals()
+        return signature
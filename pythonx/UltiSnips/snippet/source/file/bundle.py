@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+"""Ahead-of-time compiled snippet bundles.
+
+A bundle holds the parsed events of all snippet files a directory has for
+one filetype, together with the code objects of their `global !p`, context
+and action code. Loading a filetype from a bundle takes a single read and
+unpickle instead of parsing every file. Bundles are written by
+:UltiSnipsCompile or `python -m UltiSnips.compile`. Files are stored by
+their path relative to the bundle and checked by size and content, so a
+bundle stays valid when the directory is moved, copied or checked out
+elsewhere, and is only used while every file it was compiled from is
+unchanged.
+"""
+
+import contextlib
+import hashlib
+import importlib.util
+import marshal
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from UltiSnips.snippet.source.file.cache import PARSER_VERSION, file_signature
+from UltiSnips.snippet.source.file.common import normalize_file_path
+
+# Bump whenever the layout of a bundle changes.
+BUNDLE_VERSION = 2
+
+BUNDLE_SUFFIX = ".bundle"
+
+
+def _header():
+    return (BUNDLE_VERSION, PARSER_VERSION)
+
+
+def _snippets(events):
+    return [data[0] for event, data in events if event == "snippet"]
+
+
+def _relative_name(filename, directory):
+    """Returns the name 'filename' is stored under in a bundle in
+    'directory'."""
+    return Path(os.path.relpath(filename, directory)).as_posix()
+
+
+def _content_signature(data):
+    return (len(data), hashlib.sha1(data).hexdigest())
+
+
+def write_bundle(path, filenames, parse):
+    """Parses every file in 'filenames' with 'parse' and writes the events to
+    the bundle at 'path'. Returns (filename, message) for every file that
+    could not be read or parsed; the bundle is only written if there are
+    none."""
+    directory = normalize_file_path(os.path.dirname(path))
+    signatures = {}
+    events = {}
+    code = {}
+    errors = []
+    for fn in sorted(filenames):
+        name = _relative_name(fn, directory)
+        try:
+            with open(fn, "rb") as to_read:
+                data = to_read.read()
+            # Snippets are parsed with the relative name as their location,
+            # load_bundle puts the directory in front of it again.
+            file_events = list(parse(data.decode("utf-8-sig"), name))
+            file_code = [
+                snippet._precompiled_code() for snippet in _snippets(file_events)
+            ]
+        except Exception as e:
+            errors.append((fn, str(e)))
+            continue
+        signatures[name] = _content_signature(data)
+        events[name] = file_events
+        code[name] = file_code
+    if errors:
+        return errors
+    # Code objects cannot be pickled and their marshal format changes with
+    # every Python version, so they are stored separately and tagged with
+    # the version that wrote them.
+    payload = (signatures, events, importlib.util.MAGIC_NUMBER, marshal.dumps(code))
+    tmp_name = None
+    try:
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory, suffix=".tmp", delete=False
+        ) as tmp_file:
+            tmp_name = tmp_file.name
+            pickle.dump(_header(), tmp_file, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(payload, tmp_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if tmp_name is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_name)
+        raise
+    return errors
+
+
+def load_bundle(path, filenames):
+    """Returns a dict from filename to (signature, events) for the files in
+    'filenames', read from the bundle at 'path'. Returns None if the bundle
+    is unreadable, was written by another version of UltiSnips, was
+    compiled from a different set of files or one of them changed since."""
+    directory = normalize_file_path(os.path.dirname(path))
+    names = {_relative_name(fn, directory): fn for fn in filenames}
+    try:
+        with open(path, "rb") as bundle_file:
+            if pickle.load(bundle_file) != _header():
+                return None
+            content_signatures, events, magic, code = pickle.load(bundle_file)
+    except Exception:
+        return None
+    if events.keys() != names.keys():
+        return None
+    signatures = {}
+    for name, fn in names.items():
+        signature = file_signature(fn)
+        try:
+            with open(fn, "rb") as to_read:
+                data = to_read.read()
+        except OSError:
+            return None
+        if signature is None or _content_signature(data) != content_signatures[name]:
+            return None
+        signatures[fn] = signature
+    for name, fn in names.items():
+        for snippet in _snippets(events[name]):
+            snippet._location = fn + snippet._location[len(name) :]
+    if magic == importlib.util.MAGIC_NUMBER:
+        # Without usable code objects the snippets still work, they compile
+        # their code on first use.
+        with contextlib.suppress(Exception):
+            code = marshal.loads(code)
+            for name, file_events in events.items():
+                for snippet, snippet_code in zip(
+                    _snippets(file_events), code[name], strict=True
+                ):
+                    snippet._use_precompiled_code(snippet_code)
+    return {fn: (signatures[fn], events[name]) for name, fn in names.items()}
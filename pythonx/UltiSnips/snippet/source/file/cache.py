@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Persistent on-disk cache of parsed snippet files.
+
+Every entry holds the events a file source produced for one snippet file,
+keyed on the canonical path, the file's stat signature and the parser
+version. A file that did not change since it was last parsed is loaded by
+unpickling its events instead of running the parser again.
+"""
+
+import contextlib
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+# Bump whenever the parsers or the pickled shape of snippet definitions
+# change, so that entries written by an older UltiSnips are ignored.
+PARSER_VERSION = 2
+
+_SUFFIX = ".pickle"
+
+
+def file_signature(filename):
+    """Returns the (mtime_ns, size) of 'filename', or None if it cannot be
+    stat'ed."""
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class SnippetFileCache:
+    """A directory of pickled events, one file per parsed snippet file."""
+
+    def __init__(self, directory):
+        self._directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def directory(self):
+        """The directory the entries are stored in."""
+        return str(self._directory)
+
+    def _entry_path(self, kind, filename):
+        digest = hashlib.sha1(f"{kind}\0{filename}".encode()).hexdigest()
+        return self._directory / (digest + _SUFFIX)
+
+    def load(self, kind, filename, signature):
+        """Returns the cached events for 'filename' as parsed by 'kind', or
+        None if there is no entry matching 'signature'."""
+        key = (PARSER_VERSION, kind, filename, signature)
+        try:
+            with open(self._entry_path(kind, filename), "rb") as cache_file:
+                # The key is pickled separately so that a stale entry is
+                # rejected without unpickling all of its snippets.
+                if pickle.load(cache_file) != key:
+                    self.misses += 1
+                    return None
+                events = pickle.load(cache_file)
+        except Exception:
+            # Missing, truncated or otherwise unreadable entries are just
+            # misses; the file is parsed and the entry rewritten.
+            self.misses += 1
+            return None
+        self.hits += 1
+        return events
+
+    def store(self, kind, filename, signature, events):
+        """Stores 'events' for 'filename'. Failures are silently ignored, the
+        cache is an optimization only."""
+        key = (PARSER_VERSION, kind, filename, signature)
+        tmp_name = None
+        try:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "wb", dir=self._directory, suffix=".tmp", delete=False
+            ) as tmp_file:
+                tmp_name = tmp_file.name
+                pickle.dump(key, tmp_file, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(events, tmp_file, pickle.HIGHEST_PROTOCOL)
+            # Replace atomically so that concurrent Vim instances never see a
+            # half written entry.
+            os.replace(tmp_name, self._entry_path(kind, filename))
+        except Exception:
+            if tmp_name is not None:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_name)
+
+    def clear(self):
+        """Removes all entries and resets the hit and miss counters."""
+        if self._directory.is_dir():
+            for path in self._directory.iterdir():
+                if path.suffix in (_SUFFIX, ".tmp"):
+                    with contextlib.suppress(OSError):
+                        path.unlink()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""Cached listings of snippet directories.
+
+Finding the snippet files for a filetype used to glob several patterns in
+every snippet directory on the runtimepath, for every filetype. The index
+lists each directory once with a single os.scandir pass and keeps the
+listing until the modification time of the directory changes.
+"""
+
+import os
+from collections import namedtuple
+
+from UltiSnips.snippet.source.file.common import normalize_file_path
+
+# 'files' and 'dirs' map entry names to paths, with files already resolved
+# to their canonical form. 'filetypes' maps a filetype to the `.snippets`
+# files UltiSnips loads for it from this directory.
+DirectoryListing = namedtuple(
+    "DirectoryListing", ["mtime", "files", "dirs", "filetypes"]
+)
+
+_EMPTY_LISTING = DirectoryListing(None, {}, {}, {})
+
+
+def _filetypes_for(name):
+    """Returns the filetypes 'name' is a `.snippets` file for. `a_b.snippets`
+    is loaded for `a_b` itself and through the `<ft>_*.snippets` pattern for
+    `a`."""
+    stem = name[: -len(".snippets")]
+    filetypes = [stem]
+    index = stem.find("_")
+    while index != -1:
+        filetypes.append(stem[:index])
+        index = stem.find("_", index + 1)
+    return filetypes
+
+
+def _scan(directory, mtime):
+    """Lists 'directory' with a single os.scandir pass."""
+    files = {}
+    dirs = {}
+    filetypes = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name = os.path.normcase(entry.name)
+            try:
+                if entry.is_dir():
+                    dirs[name] = entry.path
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            path = normalize_file_path(entry.path)
+            files[name] = path
+            if name.endswith(".snippets"):
+                for ft in _filetypes_for(name):
+                    filetypes.setdefault(ft, []).append(path)
+    return DirectoryListing(mtime, files, dirs, filetypes)
+
+
+class SnippetDirectoryIndex:
+    """Remembers the snippet directories of a source and their contents."""
+
+    def __init__(self):
+        self._directories_key = None
+        self._directories = []
+        self._listings = {}
+
+    def directories(self, key, compute):
+        """Returns the list of directories computed by 'compute'. It is only
+        called again once 'key' (the settings the list is derived from)
+        changes."""
+        if key != self._directories_key:
+            self._directories = compute()
+            self._directories_key = key
+        return self._directories
+
+    def listing(self, directory):
+        """Returns the DirectoryListing of 'directory', which is empty if it
+        does not exist. Costs a single stat while the directory is
+        unchanged."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            self._listings.pop(directory, None)
+            return _EMPTY_LISTING
+        listing = self._listings.get(directory)
+        if listing is None or listing.mtime != mtime:
+            try:
+                listing = _scan(directory, mtime)
+            except OSError:
+                return _EMPTY_LISTING
+            self._listings[directory] = listing
+        return listing
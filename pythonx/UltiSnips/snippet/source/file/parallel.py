@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""Parses snippet files in a pool of worker processes."""
+
+import multiprocessing
+import os
+import sys
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+
+def can_fork():
+    """Returns true if worker processes can be forked from this one. Python
+    is embedded into Vim, so 'spawn' would start another Vim instead of a
+    Python interpreter, and forking is not safe on macOS."""
+    return (
+        sys.platform != "darwin" and "fork" in multiprocessing.get_all_start_methods()
+    )
+
+
+def worker_count():
+    """Returns the number of worker processes to parse files with."""
+    return os.cpu_count() or 1
+
+
+def _parse_file(parse, filename):
+    """Reads 'filename' and returns the list of events 'parse' yields for it.
+    Runs in a worker process."""
+    with open(filename, encoding="utf-8-sig") as to_read:
+        return list(parse(to_read.read(), filename))
+
+
+def parse_in_parallel(parse, filenames):
+    """Parses every file in 'filenames' with 'parse', which must be a module
+    level function so that it can be sent to the workers. Returns a dict from
+    filename to its list of events. Files that could not be read are left
+    out, so that the error is raised when the caller reads them itself."""
+    workers = min(len(filenames), worker_count())
+    context = multiprocessing.get_context("fork")
+    result = {}
+    # Python warns about forking a process that runs threads, which the
+    # preload thread or the Vim host might be doing. The workers only parse
+    # text and never touch locks held by those threads.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = {fn: pool.submit(_parse_file, parse, fn) for fn in filenames}
+            for fn, future in futures.items():
+                if future.exception() is None:
+                    result[fn] = future.result()
+    return result
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""Reading and parsing of snippet files in a background thread.
+
+Nothing in here calls into Vim: the thread only sees a function mapping a
+filetype to its snippet files and one reading the events of a file. The
+results are handed back to the source, which merges them on the main
+thread.
+"""
+
+import threading
+from collections import deque
+
+from UltiSnips.snippet.source.file.cache import file_signature
+
+
+class PreloadJob:
+    """Parses the files for 'filetypes' and for every filetype they extend in
+    a daemon thread. 'parsed_files' are the (signature, events) the source
+    already knows; files matching them are not read again."""
+
+    def __init__(self, filetypes, find_files, read_events, parsed_files):
+        self.filetypes = filetypes
+        # filename -> (signature, events) of the files parsed by this job.
+        self.parsed = {}
+        self._find_files = find_files
+        self._read_events = read_events
+        self._known = parsed_files
+        self._thread = threading.Thread(
+            target=self._run, name="UltiSnipsPreload", daemon=True
+        )
+        self._thread.start()
+
+    def done(self):
+        """Returns true once the thread finished."""
+        return not self._thread.is_alive()
+
+    def wait(self):
+        """Blocks until the thread finished."""
+        self._thread.join()
+
+    def _run(self):
+        seen = dict.fromkeys(self.filetypes)
+        todo = deque(seen)
+        while todo:
+            ft = todo.popleft()
+            try:
+                filenames = sorted(self._find_files(ft))
+            except Exception:
+                continue
+            for filename in filenames:
+                events = self._events(filename)
+                for event, data in events:
+                    if event != "extends":
+                        continue
+                    for parent_ft in data[0]:
+                        if parent_ft not in seen:
+                            seen[parent_ft] = None
+                            todo.append(parent_ft)
+
+    def _events(self, filename):
+        signature = file_signature(filename)
+        known = self._known.get(filename)
+        if known is not None and signature is not None and known[0] == signature:
+            return known[1]
+        try:
+            events = self._read_events(filename, signature)
+        except Exception:
+            # Unreadable files are skipped here, loading them on the main
+            # thread reports the error to the user.
+            return []
+        self.parsed[filename] = (signature, events)
+        return events
@@ -3,12 +3,15 @@
 """Parses snipMate files."""
 
 import os
+import re
+from functools import partial
 from pathlib import Path
 
 from UltiSnips import vim_helper
 from UltiSnips.snippet.definition import SnipMateSnippetDefinition
 from UltiSnips.snippet.source.file.base import SnippetFileSource
-from UltiSnips.snippet.source.file.common import handle_extends, normalize_file_path
+from UltiSnips.snippet.source.file.common import handle_extends
+from UltiSnips.snippet.source.file.directory_index import SnippetDirectoryIndex
 from UltiSnips.text import LineIterator, head_tail
 
 
@@ -17,22 +20,33 @@ def _splitall(path):
     return list(Path(path).parts)
 
 
-def _snipmate_files_for(ft):
-    """Returns all snipMate files we need to look at for 'ft'."""
-    if ft == "all":
-        ft = "_"
-    patterns = [
-        f"{ft}.snippets",
-        str(Path(ft) / "*.snippets"),
-        str(Path(ft) / "*.snippet"),
-        str(Path(ft) / "*" / "*.snippet"),
-    ]
+def _snipmate_files_for(ft, index, directory):
+    """Returns all snipMate files in 'directory' we need to look at for 'ft',
+    that is `ft.snippets`, `ft/*.snippets`, `ft/*.snippet` and
+    `ft/*/*.snippet`."""
+    listing = index.listing(directory)
     ret = set()
-    for rtp in vim_helper.eval("&runtimepath").split(","):
-        path = Path(rtp, "snippets").expanduser()
-        for pattern in patterns:
-            for fn in path.glob(pattern):
-                ret.add(normalize_file_path(str(fn)))
+    if ft + ".snippets" in listing.files:
+        ret.add(listing.files[ft + ".snippets"])
+    if ft not in listing.dirs:
+        return ret
+    ft_listing = index.listing(listing.dirs[ft])
+    for name, fn in ft_listing.files.items():
+        if name.endswith((".snippets", ".snippet")):
+            ret.add(fn)
+    for trigger_dir in ft_listing.dirs.values():
+        for name, fn in index.listing(trigger_dir).files.items():
+            if name.endswith(".snippet"):
+                ret.add(fn)
+    return ret
+
+
+def _snipmate_files_in_directories(index, directories, ft):
+    """Returns all snipMate files for 'ft' in all 'directories'."""
+    ft = os.path.normcase("_" if ft == "all" else ft)
+    ret = set()
+    for directory in directories:
+        ret.update(_snipmate_files_for(ft, index, directory))
     return ret
 
 
@@ -55,21 +69,21 @@ def _parse_snippet_file(content, full_filename):
     )
 
 
+# The first line after a snippet body: it neither starts with a tab nor is
+# blank.
+_BODY_END = re.compile(r"\n(?!\t)[^\S\n]*\S")
+
+
 def _parse_snippet(line, lines, filename):
     """Parse a snippet definition."""
     start_line_index = lines.line_index
     trigger, description = head_tail(line[len("snippet") :].lstrip())
-    content = ""
-    while True:
-        next_line = lines.peek()
-        if next_line is None:
-            break
-        if next_line.strip() and not next_line.startswith("\t"):
-            break
-        line = next(lines)
-        if line[0] == "\t":
-            line = line[1:]
-        content += line
+    body_start = lines.offset
+    lines.skip_to(_BODY_END)
+    content = "".join(
+        line[1:] if line[0] == "\t" else line
+        for line in lines.text[body_start : lines.offset].splitlines(True)
+    )
     content = content[:-1]  # Chomp the last newline
     return (
         "snippet",
@@ -135,16 +149,46 @@ def _parse_snippets_file(data, filename):
             yield "error", (f"Invalid line {line.rstrip()!r}", lines.line_index)
 
 
+def _parse_file(filedata, filename):
+    """Parses 'filedata' as a .snippet or .snippets file, depending on the
+    extension of 'filename', and yields events."""
+    if filename.lower().endswith("snippet"):
+        yield from _parse_snippet_file(filedata, filename)
+    else:
+        yield from _parse_snippets_file(filedata, filename)
+
+
 class SnipMateFileSource(SnippetFileSource):
     """Manages all snipMate snippet definitions found in rtp."""
 
+    def __init__(self, cache=None, parallel_threshold=None):
+        super().__init__(cache, parallel_threshold)
+        self._index = SnippetDirectoryIndex()
+
     def get_all_snippet_files_for(self, ft):
-        return _snipmate_files_for(ft)
+        return self._file_finder()(ft)
+
+    def _file_finder(self):
+        return partial(
+            _snipmate_files_in_directories, self._index, self._snippet_directories()
+        )
+
+    def _snippet_directories(self):
+        """Returns the `snippets` directory of every runtimepath entry."""
+        runtimepath = vim_helper.eval("&runtimepath")
+        return self._index.directories(
+            runtimepath,
+            lambda: [
+                str(Path(rtp, "snippets").expanduser())
+                for rtp in runtimepath.split(",")
+            ],
+        )
+
+    def watched_directories(self):
+        return self._snippet_directories()
 
     def _parse_snippet_file(self, filedata, filename):
-        if filename.lower().endswith("snippet"):
-            for event, data in _parse_snippet_file(filedata, filename):
-                yield event, data
-        else:
-            for event, data in _parse_snippets_file(filedata, filename):
-                yield event, data
+        yield from _parse_file(filedata, filename)
+
+    def _file_parser(self):
+        return _parse_file
@@ -2,21 +2,32 @@
 
 """Parsing of snippet files."""
 
-from collections import defaultdict
+import os
+import re
+from functools import partial
 from pathlib import Path
 
 from UltiSnips import vim_helper
 from UltiSnips.error import PebkacError
-from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+from UltiSnips.snippet.definition import PythonGlobals, UltiSnipsSnippetDefinition
 from UltiSnips.snippet.source.file.base import SnippetFileSource
+from UltiSnips.snippet.source.file.bundle import (
+    BUNDLE_SUFFIX,
+    load_bundle,
+    write_bundle,
+)
+from UltiSnips.snippet.source.file.cache import file_signature
 from UltiSnips.snippet.source.file.common import (
     handle_action,
     handle_context,
     handle_extends,
     normalize_file_path,
 )
+from UltiSnips.snippet.source.file.directory_index import SnippetDirectoryIndex
 from UltiSnips.text import LineIterator, head_tail
 
+_GLOB_MAGIC = re.compile(r"[*?[]")
+
 
 def find_snippet_files(ft, directory: str) -> set[str]:
     """Returns all matching snippet files for 'ft' in 'directory'."""
@@ -29,15 +40,20 @@ def find_snippet_files(ft, directory: str) -> set[str]:
     return ret
 
 
-def find_all_snippet_directories() -> list[str]:
-    """Returns a list of the absolute path of all potential snippet
-    directories, no matter if they exist or not."""
-
+def _snippet_directories_setting() -> list[str]:
+    """Returns the configured UltiSnipsSnippetDirectories."""
     if vim_helper.eval("exists('b:UltiSnipsSnippetDirectories')") == "1":
-        snippet_dirs = vim_helper.eval("b:UltiSnipsSnippetDirectories")
-    else:
-        snippet_dirs = vim_helper.eval("g:UltiSnipsSnippetDirectories")
+        return vim_helper.eval("b:UltiSnipsSnippetDirectories")
+    return vim_helper.eval("g:UltiSnipsSnippetDirectories")
+
 
+def _expand_snippet_directories(
+    snippet_dirs, runtimepath: str, keep_missing: bool = False
+) -> list[str]:
+    """Returns the absolute paths of 'snippet_dirs' in every 'runtimepath'
+    entry. Runtimepath entries may contain wildcards, those are globbed and
+    only yield existing directories. Other paths are only kept if they exist
+    or 'keep_missing' is true."""
     if len(snippet_dirs) == 1:
         # To reduce confusion and increase consistency with
         # `UltiSnipsSnippetsDir`, we expand ~ here too.
@@ -46,7 +62,7 @@ def find_all_snippet_directories() -> list[str]:
             return [str(full_path)]
 
     all_dirs = []
-    check_dirs = vim_helper.eval("&runtimepath").split(",")
+    check_dirs = runtimepath.split(",")
     for rtp in check_dirs:
         for snippet_dir in snippet_dirs:
             if snippet_dir == "snippets":
@@ -56,6 +72,9 @@ def find_all_snippet_directories() -> list[str]:
                     "directory for UltiSnips snippets."
                 )
             pth = Path(rtp, snippet_dir).expanduser()
+            if keep_missing and not _GLOB_MAGIC.search(str(pth)):
+                all_dirs.append(str(pth))
+                continue
             # Runtimepath entries may contain wildcards.
             all_dirs.extend(
                 str(p) for p in Path(pth.anchor).glob(str(pth.relative_to(pth.anchor)))
@@ -63,6 +82,67 @@ def find_all_snippet_directories() -> list[str]:
     return all_dirs
 
 
+def find_all_snippet_directories() -> list[str]:
+    """Returns a list of the absolute path of all potential snippet
+    directories, no matter if they exist or not."""
+    return _expand_snippet_directories(
+        _snippet_directories_setting(), vim_helper.eval("&runtimepath")
+    )
+
+
+def _files_in_directories(index, directories, ft) -> set[str]:
+    """Returns the snippet files for 'ft' in all 'directories'."""
+    ret = set()
+    for directory in directories:
+        ret.update(_indexed_snippet_files(index, ft, directory))
+    return ret
+
+
+def _indexed_snippet_files(index, ft, directory: str) -> set[str]:
+    """Like `find_snippet_files`, but served from the listings in 'index'."""
+    ft = os.path.normcase(ft)
+    listing = index.listing(directory)
+    ret = set(listing.filetypes.get(ft, ()))
+    if ft in listing.dirs:
+        ret.update(index.listing(listing.dirs[ft]).files.values())
+    return ret
+
+
+def compile_snippet_bundles(directory: str, errors=None) -> list[str]:
+    """Writes a bundle for every filetype that has snippet files in
+    'directory' and returns their paths. Hidden subdirectories and
+    filetypes with files other than `.snippets` files are skipped. The
+    files that cannot be read or parsed are appended to 'errors' as
+    (filename, message), their filetypes get no bundle."""
+    index = SnippetDirectoryIndex()
+    listing = index.listing(directory)
+    written = []
+    for ft in sorted(listing.filetypes.keys() | listing.dirs.keys()):
+        if ft.startswith("."):
+            continue
+        files = _indexed_snippet_files(index, ft, directory)
+        if not files or not all(
+            os.path.normcase(fn).endswith(".snippets") for fn in files
+        ):
+            continue
+        path = os.path.join(directory, ft + BUNDLE_SUFFIX)
+        failed = write_bundle(path, files, _parse_snippets_file)
+        if failed:
+            if errors is not None:
+                errors.extend(failed)
+            continue
+        written.append(path)
+    return written
+
+
+# The lines closing a snippet or global block: their keyword, optionally
+# followed by whitespace.
+_END_LINE = {
+    snip: re.compile(rf"\nend{snip}[^\S\n]*$", re.MULTILINE)
+    for snip in ("snippet", "global")
+}
+
+
 def _handle_snippet_or_global(
     filename, line, lines, python_globals, priority, pre_expand, context
 ):
@@ -101,19 +181,13 @@ def _handle_snippet_or_global(
         if trig[0] != trig[-1]:
             return "error", (f"Invalid multiword trigger: '{trig}'", lines.line_index)
         trig = trig[1:-1]
-    end = "end" + snip
-    content = ""
-
-    found_end = False
-    for line in lines:
-        if line.rstrip() == end:
-            content = content[:-1]  # Chomp the last newline
-            found_end = True
-            break
-        content += line
-
-    if not found_end:
+    body_start = lines.offset
+    if not lines.skip_to(_END_LINE[snip]):
         return "error", (f"Missing 'endsnippet' for {trig!r}", lines.line_index)
+    body_end = lines.offset
+    next(lines)
+    # Slice the body out of the file, without its last newline.
+    content = lines.text[body_start : max(body_start, body_end - 1)]
 
     if snip == "global":
         python_globals[trig].append(content)
@@ -141,7 +215,7 @@ def _parse_snippets_file(data, filename):
 
     """
 
-    python_globals = defaultdict(list)
+    python_globals = PythonGlobals()
     lines = LineIterator(data)
     current_priority = 0
     actions = {}
@@ -195,17 +269,51 @@ def _parse_snippets_file(data, filename):
 class UltiSnipsFileSource(SnippetFileSource):
     """Manages all snippets definitions found in rtp for ultisnips."""
 
+    def __init__(self, cache=None, parallel_threshold=None):
+        super().__init__(cache, parallel_threshold)
+        self._index = SnippetDirectoryIndex()
+
     def get_all_snippet_files_for(self, ft):
         """Returns all snippet files matching 'ft' across the configured
-        snippet directories. `find_snippet_files` already canonicalizes
-        paths, so symlinked or duplicated runtimepath entries don't make
-        the same file appear twice."""
-        ret = set()
-        for directory in find_all_snippet_directories():
-            if not Path(directory).is_dir():
+        snippet directories. The directory listings are cached and paths
+        canonicalized, so symlinked or duplicated runtimepath entries don't
+        make the same file appear twice."""
+        return self._file_finder()(ft)
+
+    def _file_finder(self):
+        return partial(_files_in_directories, self._index, self._snippet_directories())
+
+    def _snippet_directories(self):
+        """Returns all snippet directories, including the ones that do not
+        exist yet. The list only changes with the runtimepath or the
+        UltiSnipsSnippetDirectories setting."""
+        snippet_dirs = _snippet_directories_setting()
+        runtimepath = vim_helper.eval("&runtimepath")
+        return self._index.directories(
+            (runtimepath, tuple(snippet_dirs)),
+            lambda: _expand_snippet_directories(
+                snippet_dirs, runtimepath, keep_missing=True
+            ),
+        )
+
+    def watched_directories(self):
+        return self._snippet_directories()
+
+    def _load_bundles(self, ft):
+        for directory in self._snippet_directories():
+            listing = self._index.listing(directory)
+            path = listing.files.get(os.path.normcase(ft + BUNDLE_SUFFIX))
+            if path is None:
                 continue
-            ret.update(find_snippet_files(ft, directory))
-        return ret
+            files = _indexed_snippet_files(self._index, ft, directory)
+            if all(self._is_parsed(fn, file_signature(fn)) for fn in files):
+                continue
+            parsed = load_bundle(path, files)
+            if parsed is not None:
+                self._parsed_files.update(parsed)
 
     def _parse_snippet_file(self, filedata, filename):
         yield from _parse_snippets_file(filedata, filename)
+
+    def _file_parser(self):
+        return _parse_snippets_file
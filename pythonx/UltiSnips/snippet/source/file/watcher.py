@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+
+"""Watches snippet directories for changes made outside of this Vim.
+
+Snippet files written from within Vim are picked up through BufWritePost, but
+a `git pull`, a generator or another Vim instance change them behind our
+back. The watcher notices those changes in a daemon thread, using inotify on
+Linux and comparing stat signatures everywhere else, and hands the changed
+paths to the main thread once a burst of changes has settled down. Like the
+preload thread, it never calls into Vim.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# Snippet files live at most two levels below a snippet directory: snipMate
+# reads `<dir>/<ft>/<name>/<trigger>.snippet`.
+_DEPTH = 2
+
+# Seconds between two scans of the polling backend.
+_POLL_INTERVAL = 1.0
+
+# Changes are only reported after no new change arrived for this long.
+DEBOUNCE_SECONDS = 0.2
+
+
+def _is_ignored(name):
+    """Returns true for files that are never snippet files, like the swap
+    and backup files editors write next to them."""
+    return name.startswith(".") or name.endswith("~")
+
+
+def _walk(directory, depth=_DEPTH):
+    """Yields all directories below and including 'directory', up to
+    'depth' levels deep."""
+    yield directory
+    if depth == 0:
+        return
+    try:
+        with os.scandir(directory) as entries:
+            subdirectories = [
+                entry.path
+                for entry in entries
+                if entry.is_dir() and not _is_ignored(entry.name)
+            ]
+    except OSError:
+        return
+    for subdirectory in subdirectories:
+        yield from _walk(subdirectory, depth - 1)
+
+
+def _snapshot(directory):
+    """Returns a dict from every path below 'directory' to its stat
+    signature."""
+    result = {}
+    for path in _walk(directory):
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if _is_ignored(entry.name):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    result[entry.path] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            continue
+    return result
+
+
+class _PollingBackend:
+    """Finds changes by comparing the stat signatures of all files."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def set_directories(self, directories):
+        with self._lock:
+            for directory in self._snapshots.keys() - set(directories):
+                del self._snapshots[directory]
+            for directory in directories:
+                if directory not in self._snapshots:
+                    self._snapshots[directory] = _snapshot(directory)
+
+    def read(self, timeout):
+        time.sleep(timeout)
+        changed = set()
+        with self._lock:
+            for directory, old in self._snapshots.items():
+                new = _snapshot(directory)
+                for path in old.keys() | new.keys():
+                    if old.get(path) != new.get(path):
+                        changed.add(path)
+                self._snapshots[directory] = new
+        return changed
+
+
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x1000000
+_IN_ISDIR = 0x40000000
+_IN_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")
+
+
+class _InotifyBackend:
+    """Gets changes from the Linux kernel through inotify, without any
+    polling. Watches are not recursive, so every subdirectory is watched on
+    its own."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._lock = threading.Lock()
+        self._roots = set()
+        # watch descriptor -> watched directory.
+        self._watches = {}
+
+    def set_directories(self, directories):
+        with self._lock:
+            for directory in set(directories) - self._roots:
+                self._roots.add(directory)
+                for path in _walk(directory):
+                    self._add_watch(path)
+            removed = self._roots - set(directories)
+            self._roots -= removed
+            for wd, path in list(self._watches.items()):
+                if not any(_is_below(path, root) for root in self._roots):
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    del self._watches[wd]
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _IN_MASK)
+        if wd >= 0:
+            self._watches[wd] = path
+
+    def read(self, timeout):
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        with self._lock:
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & _IN_Q_OVERFLOW:
+                    # Events were lost, everything might have changed.
+                    changed.update(self._roots)
+                    continue
+                directory = self._watches.get(wd)
+                if directory is None:
+                    continue
+                if mask & _IN_IGNORED:
+                    del self._watches[wd]
+                    continue
+                if not name:
+                    changed.add(directory)
+                    continue
+                if _is_ignored(name):
+                    continue
+                path = os.path.join(directory, name)
+                changed.add(path)
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    depth = _DEPTH - _depth_below_roots(directory, self._roots)
+                    if depth > 0:
+                        for new_path in _walk(path, depth - 1):
+                            self._add_watch(new_path)
+        return changed
+
+
+def _is_below(path, root):
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def _depth_below_roots(path, roots):
+    """Returns how many levels 'path' is below the closest root."""
+    depths = [
+        path[len(root) :].count(os.sep) for root in roots if _is_below(path, root)
+    ]
+    return min(depths, default=0)
+
+
+def _make_backend():
+    if sys.platform.startswith("linux"):
+        try:
+            return _InotifyBackend()
+        except (OSError, AttributeError, TypeError):
+            # No usable libc or inotify is disabled.
+            pass
+    return _PollingBackend()
+
+
+class SnippetDirectoryWatcher:
+    """Collects the paths changed in a set of directories in a daemon
+    thread."""
+
+    def __init__(self, backend=None):
+        self._backend = backend or _make_backend()
+        self._lock = threading.Lock()
+        self._requested = None
+        self._directories = ()
+        self._pending = set()
+        self._last_change = 0.0
+        self._thread = threading.Thread(
+            target=self._run, name="UltiSnipsWatcher", daemon=True
+        )
+        self._thread.start()
+
+    def watch(self, directories):
+        """Sets the directories to watch. Directories that do not exist
+        are ignored. Which ones exist is only checked again once the list of
+        directories changes."""
+        requested = tuple(directories)
+        if requested == self._requested:
+            return
+        self._requested = requested
+        directories = tuple(sorted(d for d in directories if os.path.isdir(d)))
+        if directories != self._directories:
+            self._directories = directories
+            self._backend.set_directories(directories)
+
+    def changes(self, now=None):
+        """Returns the paths changed since the last call, but only once no
+        change arrived for DEBOUNCE_SECONDS. Returns an empty set
+        otherwise."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self._pending or now - self._last_change < DEBOUNCE_SECONDS:
+                return set()
+            pending = self._pending
+            self._pending = set()
+        return pending
+
+    def _run(self):
+        while True:
+            try:
+                changed = self._backend.read(_POLL_INTERVAL)
+            except Exception:
+                # Never let a broken watch take down the thread.
+                time.sleep(_POLL_INTERVAL)
+                continue
+            if changed:
+                with self._lock:
+                    self._pending.update(changed)
+                    self._last_change = time.monotonic()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""The snippets of all sources for one set of filetypes."""
+
+from collections import defaultdict
+
+from UltiSnips.snippet.definition.base import SnippetMatch
+from UltiSnips.snippet.source.snippet_dictionary import SnippetDictionary
+
+
+def _match_of_source(snippet, match):
+    """Sources that cannot list their snippets decide on their own which of
+    them match. Returns a match for 'snippet' even if matching it again did
+    not give one."""
+    if match is None:
+        return SnippetMatch(snippet, "", None, None)
+    return match
+
+
+class ResolvedSnippets:
+    """Holds the snippets of all 'sources' for 'filetypes' without the ones
+    hidden by `clearsnippets`, merged into one SnippetDictionary per source.
+    It stays valid until the filetypes or the generation of a source change,
+    so a lookup only has to match triggers against the text before the
+    cursor. Sources that cannot list their snippets are asked on every
+    lookup."""
+
+    def __init__(self, sources, filetypes):
+        self._filetypes = filetypes
+        self._clear_priority = None
+        self._cleared = {}
+        for source in sources:
+            clear_priority = source.get_clear_priority(filetypes)
+            if clear_priority is not None and (
+                self._clear_priority is None or clear_priority > self._clear_priority
+            ):
+                self._clear_priority = clear_priority
+            for trigger, priority in source.get_cleared(filetypes).items():
+                if trigger not in self._cleared or priority > self._cleared[trigger]:
+                    self._cleared[trigger] = priority
+
+        # [(source, None)] for sources asked on every lookup and
+        # [(None, dictionary)] for all others, in the order of 'sources'.
+        self._parts = []
+        for source in sources:
+            snippets = source.get_all_snippets(filetypes)
+            if snippets is None:
+                self._parts.append((source, None))
+                continue
+            dictionary = SnippetDictionary()
+            for snippet in snippets:
+                if not self._is_cleared(snippet):
+                    dictionary.add_snippet(snippet)
+            self._parts.append((None, dictionary))
+
+    def _is_cleared(self, snippet):
+        if (
+            self._clear_priority is not None
+            and snippet.priority <= self._clear_priority
+        ):
+            return True
+        return (
+            snippet.trigger in self._cleared
+            and snippet.priority <= self._cleared[snippet.trigger]
+        )
+
+    def get_snippets(self, before, partial, autotrigger_only, visual_content):
+        """Returns the SnippetMatch of every snippet matching 'before'. If
+        'partial' is true, returns the partial matches of every trigger with
+        the highest priority among them, otherwise only the matches with the
+        highest priority overall."""
+        if not partial:
+            return self._get_expandable_matches(
+                before, autotrigger_only, visual_content
+            )
+
+        matches_by_trigger = defaultdict(list)
+        for source, dictionary in self._parts:
+            if dictionary is not None:
+                matches = dictionary.get_partial_matches(before, autotrigger_only)
+            else:
+                snippets = self._get_live_snippets(
+                    source, before, partial, autotrigger_only, visual_content
+                )
+                matches = [
+                    _match_of_source(s, s.partial_match(before)) for s in snippets
+                ]
+            for match in matches:
+                matches_by_trigger[match.snippet.trigger].append(match)
+
+        # Now filter duplicates and only keep the one with the highest
+        # priority.
+        matches = []
+        for matches_with_trigger in matches_by_trigger.values():
+            highest_priority = max(m.snippet.priority for m in matches_with_trigger)
+            matches.extend(
+                m
+                for m in matches_with_trigger
+                if m.snippet.priority == highest_priority
+            )
+        return matches
+
+    def _get_live_snippets(
+        self, source, before, partial, autotrigger_only, visual_content
+    ):
+        return [
+            snippet
+            for snippet in source.get_snippets(
+                self._filetypes, before, partial, autotrigger_only, visual_content
+            )
+            if not self._is_cleared(snippet)
+        ]
+
+    def _get_expandable_matches(self, before, autotrigger_only, visual_content):
+        """Returns the matches with the highest priority in the same order as
+        the partial lookup would, but only confirms candidates with match()
+        until no lower priority can be selected. Lower priorities are shadowed
+        anyway, so their context code does not need to run."""
+        # [(position, snippet)], where position is the order in which the
+        # snippet would have been matched.
+        candidates = []
+        # Positions of the snippets of sources that cannot list them. Those
+        # were already matched by the source, but matching them again is the
+        # only way to get their SnippetMatch.
+        matched_by_source = set()
+        for source, dictionary in self._parts:
+            if dictionary is not None:
+                snippets = dictionary.get_candidates(before, autotrigger_only)
+            else:
+                snippets = self._get_live_snippets(
+                    source, before, False, autotrigger_only, visual_content
+                )
+                matched_by_source.update(
+                    range(len(candidates), len(candidates) + len(snippets))
+                )
+            candidates.extend(enumerate(snippets, len(candidates)))
+
+        by_priority = defaultdict(list)
+        for entry in candidates:
+            by_priority[entry[1].priority].append(entry)
+        # [(position, SnippetMatch)] of the highest priority.
+        matched = []
+        for priority in sorted(by_priority, reverse=True):
+            for position, snippet in by_priority.pop(priority):
+                match = snippet.match(before, visual_content)
+                if position in matched_by_source:
+                    match = _match_of_source(snippet, match)
+                if match is not None:
+                    matched.append((position, match))
+            if matched:
+                break
+        if not matched:
+            return []
+
+        # A trigger is listed where any of its snippets first matched, even
+        # one of lower priority.
+        first_match = {}
+        for position, match in matched:
+            first_match.setdefault(match.snippet.trigger, position)
+        if len(first_match) > 1:
+            shadowed = sorted(
+                (entry for entries in by_priority.values() for entry in entries),
+                key=lambda entry: entry[0],
+            )
+            for position, snippet in shadowed:
+                if position >= first_match.get(snippet.trigger, -1):
+                    continue
+                if position in matched_by_source or snippet.matches(
+                    before, visual_content
+                ):
+                    first_match[snippet.trigger] = position
+
+        matched.sort(
+            key=lambda entry: (first_match[entry[1].snippet.trigger], entry[0])
+        )
+        return [match for _, match in matched]
+
+    def autotrigger_characters(self):
+        """Returns the set of characters whose typing can complete an
+        autotrigger snippet, or None if that could be any character."""
+        characters = set()
+        for _, dictionary in self._parts:
+            if dictionary is None:
+                return None
+            dictionary_characters = dictionary.autotrigger_characters()
+            if dictionary_characters is None:
+                return None
+            characters |= dictionary_characters
+        return characters
@@ -2,6 +2,319 @@
 
 """Implements a container for parsed snippets."""
 
+import re
+
+try:
+    # Private modules of the re package, which might change or go away with
+    # any Python release. Without them, regular expression triggers are
+    # taken to end with any character.
+    import re._constants as _regex_constants
+    import re._parser as _regex_parser
+except ImportError:
+    _regex_constants = _regex_parser = None
+
+from UltiSnips.snippet.definition.base import (
+    SnippetDefinition,
+    _is_start_anchored,
+    _regex_window_start,
+    _words_for_line,
+    split_at_whitespace,
+)
+
+# Number of regular expression triggers that share one prefilter.
+_REGEX_GROUP_SIZE = 16
+
+# Backreferences and conditionals refer to groups by number or name, which
+# change or clash when patterns are combined.
+_GROUP_REFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+def _end_anchored(triggers):
+    """Returns a regular expression that matches if any of the regular
+    expressions in 'triggers' matches at the end of the text."""
+    return re.compile("|".join(rf"(?:{trigger})\Z" for trigger in triggers))
+
+
+class _RegexPrefilter:
+    """Finds the regular expression triggers that can match the text before
+    the cursor. A trigger only matches if it matches at the end of the text,
+    so one search with a few combined, end anchored expressions rules out
+    most of them at once. The expressions are compiled once per bucket, so
+    large collections do not thrash the cache of the re module."""
+
+    def __init__(self, entries):
+        # [(compiled prefilter, entries it covers, whether one of them is
+        # anchored at the start of the line)]
+        self._groups = []
+        # Entries that cannot be prefiltered and are always candidates.
+        self._always = []
+        combinable = []
+        anchored = []
+        for entry in entries:
+            trigger = entry[1].trigger
+            try:
+                flags = re.compile(trigger).flags
+            except re.error:
+                # Reported by matches().
+                self._always.append(entry)
+                continue
+            if flags != re.UNICODE or _GROUP_REFERENCE.search(trigger):
+                # Inline flags must come first, references would break.
+                self._add_group([entry])
+            elif _is_start_anchored(trigger):
+                # Searched from the start of the line, not only the window.
+                anchored.append(entry)
+            else:
+                combinable.append(entry)
+        for group in (combinable, anchored):
+            for start in range(0, len(group), _REGEX_GROUP_SIZE):
+                self._add_group(group[start : start + _REGEX_GROUP_SIZE])
+
+    def _add_group(self, entries):
+        try:
+            self._groups.append(
+                (
+                    _end_anchored(entry[1].trigger for entry in entries),
+                    entries,
+                    any(_is_start_anchored(entry[1].trigger) for entry in entries),
+                )
+            )
+        except re.error:
+            if len(entries) == 1:
+                self._always.extend(entries)
+            else:
+                # Most likely the same group name is used twice.
+                for entry in entries:
+                    self._add_group([entry])
+
+    def candidates(self, before):
+        found = list(self._always)
+        start = _regex_window_start(before)
+        for prefilter, entries, anchored in self._groups:
+            if prefilter.search(before, 0 if anchored else start):
+                found.extend(entries)
+        return found
+
+
+# Character classes with more characters than this end up in the "any" bucket
+# of the _AutotriggerIndex instead of a bucket per character.
+_MAX_CLASS_SIZE = 256
+
+
+def _final_characters_of_sequence(items):
+    """Returns (characters, can_be_empty) for the parsed regular expression
+    'items', where 'characters' is the set of characters a non-empty match
+    can end with or None if that could be any character."""
+    characters = set()
+    for op, av in reversed(items):
+        item_characters, can_be_empty = _final_characters_of_item(op, av)
+        if item_characters is None:
+            return None, True
+        characters |= item_characters
+        if not can_be_empty:
+            return characters, False
+    return characters, True
+
+
+def _final_characters_of_item(op, av):
+    c = _regex_constants
+    if op is c.LITERAL:
+        return {chr(av)}, False
+    if op is c.IN:
+        characters = set()
+        for class_op, class_av in av:
+            if class_op is c.LITERAL:
+                characters.add(chr(class_av))
+            elif class_op is c.RANGE and class_av[1] - class_av[0] < _MAX_CLASS_SIZE:
+                characters.update(map(chr, range(class_av[0], class_av[1] + 1)))
+            else:
+                return None, True
+        return characters, False
+    if op in (c.AT, c.ASSERT, c.ASSERT_NOT):
+        return set(), True
+    if op is c.SUBPATTERN:
+        _, add_flags, _, items = av
+        if add_flags & re.IGNORECASE:
+            return None, True
+        return _final_characters_of_sequence(items)
+    if op is c.ATOMIC_GROUP:
+        return _final_characters_of_sequence(av)
+    if op is c.BRANCH:
+        characters = set()
+        any_empty = False
+        for items in av[1]:
+            branch_characters, can_be_empty = _final_characters_of_sequence(items)
+            if branch_characters is None:
+                return None, True
+            characters |= branch_characters
+            any_empty = any_empty or can_be_empty
+        return characters, any_empty
+    if op in (c.MAX_REPEAT, c.MIN_REPEAT, c.POSSESSIVE_REPEAT):
+        minimum, maximum, items = av
+        if maximum == 0:
+            return set(), True
+        characters, can_be_empty = _final_characters_of_sequence(items)
+        return characters, can_be_empty or minimum == 0
+    # Any character, backreferences and the like.
+    return None, True
+
+
+def _final_characters(pattern):
+    """Returns the set of characters a match of the regular expression
+    'pattern' can end with, or None if it could end with any character or be
+    empty."""
+    if _regex_parser is None:
+        return None
+    try:
+        parsed = _regex_parser.parse(pattern)
+    except Exception:
+        # Reported by matches().
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    characters, can_be_empty = _final_characters_of_sequence(list(parsed))
+    if can_be_empty:
+        return None
+    return characters
+
+
+class _AutotriggerIndex:
+    """Finds the autotrigger snippets that can complete with the character
+    just typed. This is asked on every change in insert mode, so a character
+    that cannot end any trigger only costs a dict lookup.
+
+    Plain, `w`, `i` and `p` triggers are compared against the last words of
+    the text, which never end with whitespace, so they are bucketed by the
+    last non-whitespace character before the cursor. Regular expressions
+    must match right up to the cursor and are bucketed by the last
+    character. Snippets whose final character cannot be told from the
+    trigger are always candidates."""
+
+    def __init__(self, snippets):
+        # character -> [(position, snippet)]
+        self._by_last_word_character = {}
+        self._by_last_character = {}
+        self._any = []
+        # Whitespace in triggers bucketed by their last word character. Such
+        # a trigger might complete when that whitespace is typed.
+        self._whitespace = set()
+        for position, snippet in enumerate(snippets):
+            if not snippet.has_option("A"):
+                continue
+            entry = (position, snippet)
+            trigger = snippet.trigger
+            if type(snippet).match is not SnippetDefinition.match:
+                characters, buckets = None, None
+            elif snippet.has_option("r"):
+                characters = _final_characters(trigger)
+                buckets = self._by_last_character
+            elif snippet.has_option("p"):
+                # Any prefix of the trigger completes it.
+                characters = set(trigger) - set(" \t") or None
+                buckets = self._by_last_word_character
+            elif trigger and not trigger[-1].isspace():
+                characters = {trigger[-1]}
+                buckets = self._by_last_word_character
+            else:
+                characters, buckets = None, None
+            if characters is None:
+                self._any.append(entry)
+                continue
+            for character in characters:
+                buckets.setdefault(character, []).append(entry)
+            if buckets is self._by_last_word_character:
+                self._whitespace.update(c for c in trigger if c.isspace())
+
+    def final_characters(self):
+        """Returns the set of characters whose typing can complete one of
+        the snippets, or None if that could be any character."""
+        if self._any:
+            return None
+        return (
+            self._by_last_word_character.keys()
+            | self._by_last_character.keys()
+            | self._whitespace
+        )
+
+    def candidates(self, before):
+        """Returns the autotrigger snippets that might match 'before', in
+        the order they were added."""
+        found = self._by_last_word_character.get(before.rstrip()[-1:], ())
+        if self._by_last_character:
+            found = [*found, *self._by_last_character.get(before[-1:], ())]
+        if not found:
+            return [snippet for _, snippet in self._any]
+        found = sorted([*self._any, *found], key=lambda entry: entry[0])
+        return [snippet for _, snippet in found]
+
+
+class _TriggerIndex:
+    """Finds the snippets that can possibly match the text before the cursor
+    without asking every snippet. Candidates still have to be confirmed with
+    matches(), which also checks the `b` option and context code.
+
+    Whether a plain, `w` or `i` snippet matches only depends on the last
+    words of the text, as many as its trigger has. Plain snippets need those
+    words to equal the trigger and are found with a hash lookup. `w` and `i`
+    snippets need them to end with the trigger and are found with one hash
+    lookup per distinct trigger length. Regular expression triggers are
+    narrowed down by a _RegexPrefilter. Everything else, like `p` triggers,
+    is always a candidate."""
+
+    def __init__(self, snippets):
+        # word count -> {trigger: [(position, snippet)]}
+        self._exact = {}
+        # word count -> {trigger: [(position, snippet)]}
+        self._suffix = {}
+        # word count -> trigger lengths in '_suffix'
+        self._suffix_lengths = {}
+        # word count -> length of the longest trigger in '_exact' and
+        # '_suffix', which bounds the part of the line that is looked at.
+        self._longest = {}
+        self._scan = []
+        regex_entries = []
+        for position, snippet in enumerate(snippets):
+            entry = (position, snippet)
+            if type(snippet).match is not SnippetDefinition.match:
+                self._scan.append(entry)
+            elif snippet.has_option("r"):
+                regex_entries.append(entry)
+            else:
+                self._add(entry)
+        self._regex = _RegexPrefilter(regex_entries)
+
+    def _add(self, entry):
+        snippet = entry[1]
+        if snippet.has_option("p"):
+            self._scan.append(entry)
+            return
+        trigger = snippet.trigger
+        num_words = len(split_at_whitespace(trigger))
+        if snippet.has_option("w") or snippet.has_option("i"):
+            by_trigger = self._suffix.setdefault(num_words, {})
+            self._suffix_lengths.setdefault(num_words, set()).add(len(trigger))
+        else:
+            by_trigger = self._exact.setdefault(num_words, {})
+        by_trigger.setdefault(trigger, []).append(entry)
+        self._longest[num_words] = max(self._longest.get(num_words, 0), len(trigger))
+
+    def candidates(self, before):
+        """Returns the snippets that might match 'before', in the order they
+        were added."""
+        found = self._scan + self._regex.candidates(before)
+        for num_words in self._exact.keys() | self._suffix.keys():
+            window = before[-(self._longest[num_words] + 1) :]
+            words = _words_for_line("", window, num_words)
+            found.extend(self._exact.get(num_words, {}).get(words, ()))
+            by_trigger = self._suffix.get(num_words)
+            if by_trigger is None:
+                continue
+            for length in self._suffix_lengths[num_words]:
+                if length <= len(words):
+                    found.extend(by_trigger.get(words[len(words) - length :], ()))
+        found.sort(key=lambda entry: entry[0])
+        return [snippet for _, snippet in found]
+
 
 class SnippetDictionary:
     """See module docstring."""
@@ -10,10 +323,15 @@ class SnippetDictionary:
         self._snippets = []
         self._cleared = {}
         self._clear_priority = float("-inf")
+        # Built on the first lookup after snippets were added.
+        self._index = None
+        self._autotrigger_index = None
 
     def add_snippet(self, snippet):
         """Add 'snippet' to this dictionary."""
         self._snippets.append(snippet)
+        self._index = None
+        self._autotrigger_index = None
 
     def get_matching_snippets(
         self, trigger, potentially, autotrigger_only, visual_content
@@ -30,13 +348,41 @@ class SnippetDictionary:
         made in insert mode.
 
         """
+        if not potentially:
+            return [
+                s
+                for s in self.get_candidates(trigger, autotrigger_only)
+                if s.matches(trigger, visual_content)
+            ]
+
+        return [m.snippet for m in self.get_partial_matches(trigger, autotrigger_only)]
+
+    def get_partial_matches(self, before, autotrigger_only):
+        """Returns the SnippetMatch of every snippet that could match the
+        (partial) 'before'."""
         all_snippets = self._snippets
         if autotrigger_only:
             all_snippets = [s for s in all_snippets if s.has_option("A")]
+        matches = (s.partial_match(before) for s in all_snippets)
+        return [m for m in matches if m is not None]
 
-        if not potentially:
-            return [s for s in all_snippets if s.matches(trigger, visual_content)]
-        return [s for s in all_snippets if s.could_match(trigger)]
+    def get_candidates(self, before, autotrigger_only):
+        """Returns the snippets that might match 'before' in the order they
+        were added. They still have to be confirmed with matches()."""
+        if autotrigger_only:
+            if self._autotrigger_index is None:
+                self._autotrigger_index = _AutotriggerIndex(self._snippets)
+            return self._autotrigger_index.candidates(before)
+        if self._index is None:
+            self._index = _TriggerIndex(self._snippets)
+        return self._index.candidates(before)
+
+    def autotrigger_characters(self):
+        """Returns the set of characters whose typing can complete an
+        autotrigger snippet, or None if that could be any character."""
+        if self._autotrigger_index is None:
+            self._autotrigger_index = _AutotriggerIndex(self._snippets)
+        return self._autotrigger_index.final_characters()
 
     def clear_snippets(self, priority, triggers):
         """Clear the snippets by mark them as cleared.
@@ -15,20 +15,29 @@ from UltiSnips.change_provider import (
     NvimChangeProvider,
     VimChangeProvider,
 )
+from UltiSnips.error import PebkacError
 from UltiSnips.position import JumpDirection, Position
-from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+from UltiSnips.snippet.definition import (
+    SnippetDefinition,
+    UltiSnipsSnippetDefinition,
+)
 from UltiSnips.snippet.source import (
     AddedSnippetsSource,
+    ResolvedSnippets,
     SnipMateFileSource,
     UltiSnipsFileSource,
+    compile_snippet_bundles,
     find_all_snippet_directories,
     find_snippet_files,
 )
+from UltiSnips.snippet.source.file.cache import SnippetFileCache
 from UltiSnips.snippet.source.file.common import (
     normalize_file_path,
 )
+from UltiSnips.snippet.source.file.watcher import SnippetDirectoryWatcher
 from UltiSnips.text import escape
 from UltiSnips.vim_state import VimState, VisualContentPreserver
+from UltiSnips.word_boundary import forget_word_boundaries
 
 
 def _ask_user(a, formatted):
@@ -63,15 +72,27 @@ def _show_user_warning(msg):
     vim.command("echohl None")
 
 
-def _ask_snippets(snippets):
-    """Given a list of snippets, ask the user which one they want to use, and
-    return it."""
+def _ask_snippets(matches):
+    """Given a list of SnippetMatch, ask the user which snippet they want to
+    use, and return its match."""
     _bs = "\\"
     display = [
-        f"{i + 1}: {escape(s.description, _bs)} ({escape(s.location, _bs)})"
-        for i, s in enumerate(snippets)
+        f"{i + 1}: {escape(m.snippet.description, _bs)}"
+        f" ({escape(m.snippet.location, _bs)})"
+        for i, m in enumerate(matches)
     ]
-    return _ask_user(snippets, display)
+    return _ask_user(matches, display)
+
+
+def _get_snippet_cache_directory():
+    """Returns the directory for the on-disk cache of parsed snippet files."""
+    directory = vim.vars.get("UltiSnipsSnippetCacheDirectory", None)
+    if directory is not None:
+        return str(Path(vim_helper.as_str(directory)).expanduser())
+    if int(vim_helper.eval("has('nvim')")):
+        return str(Path(vim_helper.eval("stdpath('cache')")) / "ultisnips")
+    cache_home = vim_helper.eval("$XDG_CACHE_HOME") or str(Path("~/.cache"))
+    return str(Path(cache_home).expanduser() / "vim" / "ultisnips")
 
 
 def _select_and_create_file_to_edit(potentials: set[str]) -> str:
@@ -132,6 +153,11 @@ class SnippetManager:
         self._active_snippets = []
         self._added_buffer_filetypes = defaultdict(list)
         self._removed_buffer_filetypes = defaultdict(set)
+        # Bumped whenever the snippets available in a buffer might have
+        # changed, see _snippets_changed.
+        self._snippets_generation = 0
+        # filetypes -> (source generations, ResolvedSnippets)
+        self._resolved_snippets_cache = {}
 
         self._vstate = VimState()
         self._visual_content = VisualContentPreserver()
@@ -143,13 +169,37 @@ class SnippetManager:
 
         self._last_change = ("", Position(-1, -1))
 
+        self._snippet_file_cache = SnippetFileCache(_get_snippet_cache_directory())
+        file_cache = None
+        if int(vim.vars.get("UltiSnipsEnableSnippetCache", 0)):
+            file_cache = self._snippet_file_cache
+
+        SnippetDefinition.regex_trigger_window = int(
+            vim.vars.get("UltiSnipsRegexTriggerWindow", 1000)
+        )
+
+        parallel_threshold = None
+        if int(vim.vars.get("UltiSnipsParallelParsing", 0)):
+            parallel_threshold = int(
+                vim.vars.get("UltiSnipsParallelParsingThreshold", 1024 * 1024)
+            )
+
         self._added_snippets_source = AddedSnippetsSource()
-        self.register_snippet_source("ultisnips_files", UltiSnipsFileSource())
+        self.register_snippet_source(
+            "ultisnips_files", UltiSnipsFileSource(file_cache, parallel_threshold)
+        )
         self.register_snippet_source("added", self._added_snippets_source)
 
         enable_snipmate = vim.vars.get("UltiSnipsEnableSnipMate", 1)
         if int(enable_snipmate):
-            self.register_snippet_source("snipmate_files", SnipMateFileSource())
+            self.register_snippet_source(
+                "snipmate_files", SnipMateFileSource(file_cache, parallel_threshold)
+            )
+
+        self._snippet_watcher = None
+        self._watched_key = None
+        if int(vim.vars.get("UltiSnipsWatchSnippetDirectories", 0)):
+            self._snippet_watcher = SnippetDirectoryWatcher()
 
         self._autotrigger = bool(int(vim.vars.get("UltiSnipsAutoTrigger", 1)))
 
@@ -233,7 +283,7 @@ class SnippetManager:
         """Returns the snippets that could be expanded to Vim as a global
         variable."""
         before = "" if search_all else vim_helper.buf.line_till_cursor
-        snippets = self._snips(before, True)
+        snippets = [match.snippet for match in self._snips(before, True)]
 
         # Sort snippets alphabetically
         snippets.sort(key=lambda x: x.trigger)
@@ -274,23 +324,23 @@ class SnippetManager:
         """Shows the snippets that could be expanded to the User and let her
         select one."""
         before = vim_helper.buf.line_till_cursor
-        snippets = self._snips(before, True)
+        matches = self._snips(before, True)
 
-        if len(snippets) == 0:
+        if len(matches) == 0:
             self._handle_failure(vim_helper.as_str(vim.vars["UltiSnipsListSnippets"]))
             return True
 
         # Sort snippets alphabetically
-        snippets.sort(key=lambda x: x.trigger)
+        matches.sort(key=lambda x: x.snippet.trigger)
 
-        if not snippets:
+        if not matches:
             return True
 
-        snippet = _ask_snippets(snippets)
-        if not snippet:
+        match = _ask_snippets(matches)
+        if not match:
             return True
 
-        self._do_snippet(snippet, before)
+        self._do_snippet(match, before)
 
         return True
 
@@ -307,6 +357,7 @@ class SnippetManager:
         actions=None,
     ):
         """Add a snippet to the list of known snippets of the given 'ft'."""
+        self._snippets_changed()
         self._added_snippets_source.add_snippet(
             ft,
             UltiSnipsSnippetDefinition(
@@ -332,8 +383,12 @@ class SnippetManager:
             0, trigger, value, description, options, {}, "", context, actions
         )
 
-        if not trigger or snip.matches(before, self._visual_content):
-            self._do_snippet(snip, before)
+        if not trigger:
+            self._do_snippet(snip._initial_match(), before)
+            return True
+        match = snip.match(before, self._visual_content)
+        if match is not None:
+            self._do_snippet(match, before)
             return True
         return False
 
@@ -355,6 +410,7 @@ class SnippetManager:
 
         """
         self._snippet_sources.append((name, snippet_source))
+        self._snippets_changed()
 
     def unregister_snippet_source(self, name):
         """Unregister the source with the given 'name'.
@@ -367,6 +423,7 @@ class SnippetManager:
                 self._snippet_sources = (
                     self._snippet_sources[:index] + self._snippet_sources[index + 1 :]
                 )
+                self._snippets_changed()
                 break
 
     def get_buffer_filetypes(self):
@@ -380,6 +437,7 @@ class SnippetManager:
 
     def add_buffer_filetypes(self, filetypes: str):
         """'filetypes' is a dotted filetype list, for example 'cuda.cpp'"""
+        self._snippets_changed()
         buf_fts = self._added_buffer_filetypes[vim_helper.buf.number]
         removed = self._removed_buffer_filetypes[vim_helper.buf.number]
         idx = -1
@@ -405,6 +463,7 @@ class SnippetManager:
         eligible to be removed. Removal is persistent for the lifetime of the
         buffer; a later `add_buffer_filetypes` re-enables the filetype.
         """
+        self._snippets_changed()
         buf_fts = self._added_buffer_filetypes[vim_helper.buf.number]
         removed = self._removed_buffer_filetypes[vim_helper.buf.number]
         for ft in filetypes.split("."):
@@ -515,6 +574,7 @@ class SnippetManager:
         self._change_provider.attach(vim.current.buffer.number)
         self._snippet_buffer_number = vim.current.buffer.number
         self._inner_state_up = True
+        vim.vars["_ultisnips_inner_state_up"] = 1
 
     def _teardown_inner_state(self):
         """Reverse _setup_inner_state."""
@@ -546,6 +606,7 @@ class SnippetManager:
             self._change_provider.detach()
             self._snippet_buffer_number = None
             self._inner_state_up = False
+            vim.vars["_ultisnips_inner_state_up"] = 0
 
     @err_to_scratch_buffer.wrap
     def _save_last_visual_selection(self):
@@ -785,64 +846,35 @@ class SnippetManager:
             vim.command(f"return {vim_helper.escape(feedkey)}")
 
     def _snips(self, before, partial, autotrigger_only=False):
-        """Returns all the snippets for the given text before the cursor.
+        """Returns the SnippetMatch of all the snippets for the given text
+        before the cursor.
 
         If partial is True, then get also return partial matches.
 
         """
+        return self._resolved_snippets().get_snippets(
+            before, partial, autotrigger_only, self._visual_content
+        )
+
+    def _resolved_snippets(self):
+        """Returns the ResolvedSnippets for the filetypes of the current
+        buffer, rebuilt only if a source changed since it was last used."""
         filetypes = self.get_buffer_filetypes()[::-1]
-        matching_snippets = defaultdict(list)
-        clear_priority = None
-        cleared = {}
         for _, source in self._snippet_sources:
+            source.finish_preload(wait=True)
             source.ensure(filetypes)
-
-        # Collect cleared information from sources.
-        for _, source in self._snippet_sources:
-            sclear_priority = source.get_clear_priority(filetypes)
-            if sclear_priority is not None and (
-                clear_priority is None or sclear_priority > clear_priority
-            ):
-                clear_priority = sclear_priority
-            for key, value in source.get_cleared(filetypes).items():
-                if key not in cleared or value > cleared[key]:
-                    cleared[key] = value
-
-        for _, source in self._snippet_sources:
-            possible_snippets = source.get_snippets(
-                filetypes, before, partial, autotrigger_only, self._visual_content
-            )
-
-            for snippet in possible_snippets:
-                if (clear_priority is None or snippet.priority > clear_priority) and (
-                    snippet.trigger not in cleared
-                    or snippet.priority > cleared[snippet.trigger]
-                ):
-                    matching_snippets[snippet.trigger].append(snippet)
-        if not matching_snippets:
-            return []
-
-        # Now filter duplicates and only keep the one with the highest
-        # priority.
-        snippets = []
-        for snippets_with_trigger in matching_snippets.values():
-            highest_priority = max(s.priority for s in snippets_with_trigger)
-            snippets.extend(
-                s for s in snippets_with_trigger if s.priority == highest_priority
-            )
-
-        # For partial matches we are done, but if we want to expand a snippet,
-        # we have to go over them again and only keep those with the maximum
-        # priority.
-        if partial:
-            return snippets
-
-        highest_priority = max(s.priority for s in snippets)
-        return [s for s in snippets if s.priority == highest_priority]
-
-    def _do_snippet(self, snippet, before):
-        """Expands the given snippet, and handles everything that needs to be
-        done with it."""
+        sources = [source for _, source in self._snippet_sources]
+        generations = [(source, source.generation) for source in sources]
+        cached = self._resolved_snippets_cache.get(tuple(filetypes))
+        if cached is None or cached[0] != generations:
+            cached = (generations, ResolvedSnippets(sources, filetypes))
+            self._resolved_snippets_cache[tuple(filetypes)] = cached
+        return cached[1]
+
+    def _do_snippet(self, match, before):
+        """Expands the snippet of the SnippetMatch 'match', and handles
+        everything that needs to be done with it."""
+        snippet = match.snippet
         self._setup_inner_state()
 
         self._snip_expanded_in_action = False
@@ -850,8 +882,8 @@ class SnippetManager:
 
         # Adjust before, maybe the trigger is not the complete word
         text_before = before
-        if snippet.matched:
-            text_before = before[: -len(snippet.matched)]
+        if match.matched:
+            text_before = before[: -len(match.matched)]
 
         with (
             use_proxy_buffer(
@@ -859,8 +891,8 @@ class SnippetManager:
             ),
             self._action_context(),
         ):
-            cursor_set_in_action = snippet.do_pre_expand(
-                self._visual_content.text, self._active_snippets
+            cursor_set_in_action, match = snippet.do_pre_expand(
+                match, self._visual_content.text, self._active_snippets
             )
 
         # `pre_expand` may have nested an anonymous snippet (the "wrap"
@@ -889,13 +921,13 @@ class SnippetManager:
                     # killed. We do this by pretending that the user deleted
                     # and retyped the text that our trigger matched.
                     edit_actions = [
-                        ("D", start.line, start.col, snippet.matched),
-                        ("I", start.line, start.col, snippet.matched),
+                        ("D", start.line, start.col, match.matched),
+                        ("I", start.line, start.col, match.matched),
                     ]
                     self._active_snippets[0].replay_user_edits(edit_actions)
                 parent = self._current_snippet.find_parent_for_new_to(start)
             snippet_instance = snippet.launch(
-                text_before, self._visual_content, parent, start, end
+                match, text_before, self._visual_content, parent, start, end
             )
             # Open any folds this might have created
             vim.command("normal! zv")
@@ -1003,23 +1035,23 @@ class SnippetManager:
         # placeholder boundaries, deleting sibling tabstops. See #1380/#1327.
         if self._active_snippets:
             self._cursor_moved()
-        before, snippets = self._can_expand(autotrigger_only)
-        if snippets:
+        before, matches = self._can_expand(autotrigger_only)
+        if matches:
             # prefer snippets with context if any
-            snippets_with_context = [s for s in snippets if s.context]
-            if snippets_with_context:
-                snippets = snippets_with_context
-        if not snippets:
+            matches_with_context = [m for m in matches if m.context]
+            if matches_with_context:
+                matches = matches_with_context
+        if not matches:
             # No snippet found
             return False
         vim.command("let &g:undolevels = &g:undolevels")
-        if len(snippets) == 1:
-            snippet = snippets[0]
+        if len(matches) == 1:
+            match = matches[0]
         else:
-            snippet = _ask_snippets(snippets)
-            if not snippet:
+            match = _ask_snippets(matches)
+            if not match:
                 return True
-        self._do_snippet(snippet, before)
+        self._do_snippet(match, before)
         vim.command("let &g:undolevels = &g:undolevels")
         return True
 
@@ -1041,6 +1073,7 @@ class SnippetManager:
 
     def _toggle_autotrigger(self):
         self._autotrigger = not self._autotrigger
+        self._snippets_changed()
         return self._autotrigger
 
     @property
@@ -1171,6 +1204,115 @@ class SnippetManager:
     def _refresh_snippets(self):
         for _, source in self._snippet_sources:
             source.refresh()
+        self._snippets_changed()
+
+    def _iskeyword_changed(self):
+        """Called when the current buffer or its 'iskeyword' might have
+        changed."""
+        forget_word_boundaries()
+
+    def _snippets_changed(self):
+        """Makes UltiSnips#TrackChange ask _autotrigger_characters again
+        before it skips any keystroke."""
+        self._snippets_generation += 1
+        vim.vars["_ultisnips_snippets_generation"] = self._snippets_generation
+
+    @err_to_scratch_buffer.wrap
+    def _autotrigger_characters(self):
+        """Returns the characters whose typing can complete an autotrigger
+        snippet in the current buffer, as a dict for the Vim script side.
+        UltiSnips#TrackChange does not call into Python for other keystrokes
+        while no snippet is active. 'any' is set if every character can."""
+        characters = set()
+        if self._autotrigger:
+            characters = self._resolved_snippets().autotrigger_characters()
+            if characters is None:
+                return {"any": 1, "characters": {}}
+        return {"any": 0, "characters": dict.fromkeys(characters, 1)}
+
+    @err_to_scratch_buffer.wrap
+    def _check_snippet_directories(self):
+        """Updates the watched directories and hands the snippet files that
+        changed outside of Vim to the sources, which reload them on the next
+        expansion."""
+        if self._snippet_watcher is None:
+            return
+        # The directories of the sources only change with these settings or
+        # the sources themselves, so they are not asked on every tick.
+        key = (
+            vim_helper.eval(
+                "[&runtimepath, get(b:, 'UltiSnipsSnippetDirectories',"
+                " get(g:, 'UltiSnipsSnippetDirectories', []))]"
+            ),
+            [id(source) for _, source in self._snippet_sources],
+        )
+        if key != self._watched_key:
+            self._watched_key = key
+            directories = []
+            for _, source in self._snippet_sources:
+                directories.extend(source.watched_directories())
+            self._snippet_watcher.watch(directories)
+        paths = self._snippet_watcher.changes()
+        if paths:
+            for _, source in self._snippet_sources:
+                source.files_changed(paths)
+            self._snippets_changed()
+
+    @err_to_scratch_buffer.wrap
+    def _preload_snippets(self):
+        """Starts loading the snippets for the current buffer in a background
+        thread. Returns true if _finish_preloading_snippets must be polled."""
+        filetypes = self.get_buffer_filetypes()[::-1]
+        started = False
+        for _, source in self._snippet_sources:
+            started = source.preload(filetypes) or started
+        return started
+
+    @err_to_scratch_buffer.wrap
+    def _finish_preloading_snippets(self):
+        """Merges the snippets loaded in the background into their sources.
+        Returns true while some are still being loaded."""
+        pending = False
+        for _, source in self._snippet_sources:
+            pending = source.finish_preload() or pending
+        return pending
+
+    @err_to_scratch_buffer.wrap
+    def _clear_snippet_cache(self):
+        """Removes all entries of the on-disk snippet cache."""
+        self._snippet_file_cache.clear()
+
+    @err_to_scratch_buffer.wrap
+    def _compile_snippet_bundles(self, directories):
+        """Writes snippet bundles for all 'directories', or for every existing
+        UltiSnips snippet directory if none are given. Returns the paths of
+        the written bundles. Files that cannot be compiled are reported
+        after all other bundles are written."""
+        if not directories:
+            directories = [
+                d for d in find_all_snippet_directories() if Path(d).is_dir()
+            ]
+        written = []
+        errors = []
+        for directory in directories:
+            written.extend(
+                compile_snippet_bundles(str(Path(directory).expanduser()), errors)
+            )
+        if errors:
+            raise PebkacError(
+                f"Wrote {len(written)} snippet bundles, but could not compile:\n"
+                + "\n".join(f"{filename}: {message}" for filename, message in errors)
+            )
+        return written
+
+    def snippet_cache_stats(self):
+        """Returns the hit and miss counters of the on-disk snippet cache."""
+        return {
+            "enabled": int(vim.vars.get("UltiSnipsEnableSnippetCache", 0)),
+            "directory": self._snippet_file_cache.directory,
+            "hits": self._snippet_file_cache.hits,
+            "misses": self._snippet_file_cache.misses,
+        }
 
 
 UltiSnips_Manager = SnippetManager(
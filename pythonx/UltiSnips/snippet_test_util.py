@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Helpers shared by the tests of the file based snippet sources."""
+
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from UltiSnips.snippet.source.file.ulti_snips import UltiSnipsFileSource
+
+
+class DirectorySource(UltiSnipsFileSource):
+    """Reads the snippets of a single directory and records the names of
+    the files parsed in this process since the last refresh and the threads
+    that parsed them."""
+
+    def __init__(self, directory, parallel_threshold=None, cache=None):
+        super().__init__(cache, parallel_threshold)
+        self._directory = str(directory)
+        self.parsed = []
+        self.threads = []
+
+    def refresh(self):
+        self.parsed = []
+        self.threads = []
+        super().refresh()
+
+    def _snippet_directories(self):
+        return [self._directory]
+
+    def _parse_snippet_file(self, filedata, filename):
+        self.parsed.append(Path(filename).name)
+        self.threads.append(threading.current_thread().name)
+        yield from super()._parse_snippet_file(filedata, filename)
+
+
+class DirectoryTestCase(unittest.TestCase):
+    """Runs every test in a new temporary 'directory'."""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.directory = Path(self._tmp.name).resolve()
+
+
+def snippet(trigger):
+    """Returns the definition of a snippet that expands 'trigger' to
+    itself."""
+    return f"snippet {trigger}\n{trigger}\nendsnippet\n"
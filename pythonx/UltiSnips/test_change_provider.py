@@ -2,18 +2,26 @@
 
 """Tests for change_provider pure-Python helper functions.
 
-Tests detect_edits and _on_bytes_to_edits as pure functions.  The `vim`
+Tests detect_edits and _replay_on_bytes as pure functions.  The `vim`
 module is mocked by pythonx/conftest.py so these run without Vim.
 """
 
+import itertools
+import random
+import time
 import unittest
+from unittest import mock
 
 from UltiSnips.change_provider import (
+    NvimChangeProvider,
+    VimChangeProvider,
     _is_pathological_diff_input,
     _listener_to_edits,
-    _on_bytes_to_edits,
+    _replay_listener,
+    _replay_on_bytes,
     detect_edits,
     diff,
+    diff_lines,
 )
 
 
@@ -189,16 +197,22 @@ class TestDetectEdits(unittest.TestCase):
 
 
 class TestIsPathologicalDiffInput(unittest.TestCase):
-    """Regression for #1513/#155/#1074 — diff() is O(n·m) and freezes for
-    large inputs. consume_edits uses _is_pathological_diff_input as a
-    guard: when the old→new character delta is too large, we signal the
-    caller to drop the snippet rather than attempting a (slow, and at
-    this point semantically pointless) reconciliation."""
-
-    def test_pure_insert_many_lines_is_pathological(self):
-        # The #1513 shape: [''] → thousands of content lines (undo of big
-        # deletion while snippet still tracked).
-        self.assertTrue(_is_pathological_diff_input([""], ["AAAAA"] * 3000))
+    """Regression for #1513/#155/#1074. consume_edits uses
+    _is_pathological_diff_input as a guard: when the old→new character
+    delta is too large and none of the remembered text is left at either
+    end, we signal the caller to drop the snippet rather than attempting a
+    semantically pointless reconciliation."""
+
+    def test_restoring_lines_over_snippet_is_pathological(self):
+        # The #1513 shape: the snippet's text → thousands of content lines
+        # (undo of big deletion while snippet still tracked).
+        self.assertTrue(_is_pathological_diff_input(["()"], ["AAAAA"] * 3000))
+
+    def test_large_paste_is_not_pathological(self):
+        # Pasting into a tabstop keeps the snippet text around it; diff()
+        # tracks that quickly.
+        self.assertFalse(_is_pathological_diff_input([""], ["AAAAA"] * 3000))
+        self.assertFalse(_is_pathological_diff_input(["(x)"], ["(" + "A" * 3000 + ")"]))
 
     def test_pure_delete_many_lines_is_pathological(self):
         # The #155 shape: thousands of lines visually selected and fed
@@ -223,21 +237,55 @@ class TestIsPathologicalDiffInput(unittest.TestCase):
         # above is. Documents the cutoff.
         from UltiSnips.change_provider import _PATHOLOGICAL_CHAR_DELTA
 
-        under = ["a" * _PATHOLOGICAL_CHAR_DELTA]
-        self.assertFalse(_is_pathological_diff_input([""], under))
-        over = ["a" * (_PATHOLOGICAL_CHAR_DELTA + 1)]
-        self.assertTrue(_is_pathological_diff_input([""], over))
-
-
-class TestOnBytesToEdits(unittest.TestCase):
-    """Test _on_bytes_to_edits for Neovim on_bytes event translation."""
+        under = ["a" * (_PATHOLOGICAL_CHAR_DELTA + 1)]
+        self.assertFalse(_is_pathological_diff_input(["b"], under))
+        over = ["a" * (_PATHOLOGICAL_CHAR_DELTA + 2)]
+        self.assertTrue(_is_pathological_diff_input(["b"], over))
+
+    def test_needs_enough_kept_text(self):
+        # A single matching character at an end does not tell that the
+        # snippet text is still there.
+        old = ["xxxxxxxxxx", "tab"]
+        self.assertTrue(_is_pathological_diff_input(old, ["x" + "P" * 3000]))
+        self.assertTrue(_is_pathological_diff_input(old, ["P" * 3000 + "b"]))
+
+    def test_at_kept_text_boundary(self):
+        from UltiSnips.change_provider import _PATHOLOGICAL_KEPT_CHARS
+
+        old = ["x" * 20, "tab"]
+        paste = "P" * 3000
+        enough = "x" * _PATHOLOGICAL_KEPT_CHARS
+        self.assertFalse(_is_pathological_diff_input(old, [enough + paste]))
+        self.assertTrue(_is_pathological_diff_input(old, [enough[1:] + paste]))
+        # Text kept at both ends adds up.
+        self.assertFalse(_is_pathological_diff_input(old, [enough[4:] + paste, "tab"]))
+        self.assertTrue(_is_pathological_diff_input(old, [enough[5:] + paste, "tab"]))
+
+
+def _replay_one(event, old_lines, new_buf, snippet_start):
+    """Replays a single on_bytes 'event', reading the text it inserted from
+    'new_buf' like lua/ultisnips/on_bytes.lua does."""
+    start_row, start_col, _, _, new_end_row, new_end_col = event
+    lines = [line.encode("utf-8") for line in new_buf]
+    if new_end_row:
+        inserted = [lines[start_row][start_col:]]
+        inserted += lines[start_row + 1 : start_row + new_end_row]
+        inserted.append(lines[start_row + new_end_row][:new_end_col])
+    else:
+        inserted = [lines[start_row][start_col : start_col + new_end_col]]
+    text = b"\n".join(inserted).decode("utf-8")
+    return _replay_on_bytes([(*event, text)], old_lines, snippet_start)
+
+
+class TestReplayOnBytes(unittest.TestCase):
+    """Test _replay_on_bytes for Neovim on_bytes event translation."""
 
     def test_single_char_insert(self):
         # Type "x" at (5,3)
         event = (5, 3, 0, 0, 0, 1)
         old_lines = ["hello"]
         new_buf = [""] * 5 + ["helxlo"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("I", 5, 3, "x")])
 
     def test_enter(self):
@@ -245,7 +293,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 3, 0, 0, 1, 0)
         old_lines = ["hello"]
         new_buf = [""] * 5 + ["hel", "lo"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("I", 5, 3, "\n")])
 
     def test_backspace(self):
@@ -253,7 +301,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 2, 0, 1, 0, 0)
         old_lines = ["hello"]
         new_buf = [""] * 5 + ["helo"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("D", 5, 2, "l")])
 
     def test_delete_line_dd(self):
@@ -261,7 +309,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 0, 1, 0, 0, 0)
         old_lines = ["hello", "world"]
         new_buf = [""] * 5 + ["world"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("D", 5, 0, "hello"), ("D", 5, 0, "\n")])
 
     def test_multi_line_paste(self):
@@ -269,7 +317,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 3, 0, 0, 1, 3)
         old_lines = ["hello"]
         new_buf = [""] * 5 + ["helabc", "deflo"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(
             cmds,
             [
@@ -284,7 +332,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 1, 0, 4, 0, 1)
         old_lines = ["hello"]
         new_buf = [""] * 5 + ["hio"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(
             cmds,
             [
@@ -298,7 +346,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 0, 2, 0, 0, 0)
         old_lines = ["hello", "world", "end"]
         new_buf = [""] * 5 + ["end"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(
             cmds,
             [
@@ -313,7 +361,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 0, 0, 0, 0, 0)
         old_lines = ["hello"]
         new_buf = [""] * 5 + ["hello"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [])
 
     def test_multi_line_visual_replace(self):
@@ -321,7 +369,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 2, 1, 3, 0, 1)
         old_lines = ["hello", "world"]
         new_buf = [""] * 5 + ["heXld"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(
             cmds,
             [
@@ -338,7 +386,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 8, 0, 0, 0, 1)
         old_lines = ["te üü world"]
         new_buf = [""] * 5 + ["te üü hworld"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("I", 5, 6, "h")])
 
     def test_utf8_replace_in_umlaut_string(self):
@@ -348,7 +396,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 8, 0, 5, 0, 1)
         old_lines = ["te üü world"]
         new_buf = [""] * 5 + ["te üü h"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("D", 5, 6, "world"), ("I", 5, 6, "h")])
 
     def test_utf8_delete_umlaut(self):
@@ -357,7 +405,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (5, 3, 0, 2, 0, 0)
         old_lines = ["te üü world"]
         new_buf = [""] * 5 + ["te ü world"]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertEqual(cmds, [("D", 5, 3, "ü")])
 
     def test_bounds_violation_returns_none(self):
@@ -368,7 +416,7 @@ class TestOnBytesToEdits(unittest.TestCase):
         old_lines = ["hello", "nice", "world"]  # 3 lines
         new_buf = ["", ""]  # not relevant
         # rel_row=1, old_end_row=2, rel_row + old_end_row = 3 = len(old_lines)
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 0)
+        cmds = _replay_one(event, old_lines, new_buf, 0)
         self.assertIsNone(cmds)
 
     def test_bounds_change_above_snippet_returns_none(self):
@@ -376,9 +424,79 @@ class TestOnBytesToEdits(unittest.TestCase):
         event = (3, 0, 0, 1, 0, 0)
         old_lines = ["hello"]
         new_buf = [""] * 3 + [""]
-        cmds = _on_bytes_to_edits(event, old_lines, new_buf, 5)
+        cmds = _replay_one(event, old_lines, new_buf, 5)
         self.assertIsNone(cmds)
 
+    def test_typing_several_characters(self):
+        events = [(5, 3, 0, 0, 0, 1, "x"), (5, 4, 0, 0, 0, 1, "y")]
+        cmds = _replay_on_bytes(events, ["hello"], 5)
+        self.assertEqual(cmds, [("I", 5, 3, "x"), ("I", 5, 4, "y")])
+
+    def test_completion_replaces_typed_text(self):
+        # Type "fo", then the completion replaces it with "foobar".
+        events = [
+            (5, 0, 0, 0, 0, 1, "f"),
+            (5, 1, 0, 0, 0, 1, "o"),
+            (5, 0, 0, 2, 0, 0, ""),
+            (5, 0, 0, 0, 0, 6, "foobar"),
+        ]
+        cmds = _replay_on_bytes(events, [""], 5)
+        self.assertEqual(
+            cmds,
+            [
+                ("I", 5, 0, "f"),
+                ("I", 5, 1, "o"),
+                ("D", 5, 0, "fo"),
+                ("I", 5, 0, "foobar"),
+            ],
+        )
+
+    def test_text_of_earlier_event_is_changed_again(self):
+        # Paste "ab\ncd" and delete the "b\nc" across the new line break.
+        events = [(5, 2, 0, 0, 1, 2, "ab\ncd"), (5, 3, 1, 1, 0, 0, "")]
+        cmds = _replay_on_bytes(events, ["xy"], 5)
+        self.assertEqual(
+            cmds,
+            [
+                ("I", 5, 2, "ab"),
+                ("I", 5, 4, "\n"),
+                ("I", 6, 0, "cd"),
+                ("D", 5, 3, "b"),
+                ("D", 5, 3, "\n"),
+                ("D", 5, 3, "c"),
+            ],
+        )
+        self.assertEqual(["xyad"], _apply(["xy"], cmds, 5))
+
+    def test_later_events_use_updated_byte_columns(self):
+        # After "ü" (2 bytes) is typed, byte 3 is the character at 2.
+        events = [(5, 0, 0, 0, 0, 2, "ü"), (5, 3, 0, 1, 0, 0, "")]
+        cmds = _replay_on_bytes(events, ["abc"], 5)
+        self.assertEqual(cmds, [("I", 5, 0, "ü"), ("D", 5, 2, "b")])
+
+    def test_rows_follow_inserted_lines(self):
+        events = [(5, 0, 0, 0, 1, 0, "\n"), (7, 0, 0, 0, 0, 1, "z")]
+        cmds = _replay_on_bytes(events, ["a", "b"], 5)
+        self.assertEqual(cmds, [("I", 5, 0, "\n"), ("I", 7, 0, "z")])
+
+    def test_event_leaving_region_returns_none(self):
+        events = [(5, 0, 0, 0, 0, 1, "x"), (6, 0, 0, 1, 0, 0, "")]
+        self.assertIsNone(_replay_on_bytes(events, ["hello"], 5))
+
+
+class TestNvimChangeProvider(unittest.TestCase):
+    def test_drains_events_in_one_call(self):
+        snippet = mock.Mock()
+        snippet.start.line = 5
+        vstate = mock.Mock(remembered_buffer=["hello"])
+        with mock.patch("UltiSnips.change_provider.vim") as vim:
+            vim.exec_lua.return_value = [5, 0, 0, 0, 0, 2, "ab", 5, 4, 0, 1, 0, 0, ""]
+            cmds = NvimChangeProvider().consume_edits(None, snippet, vstate)
+        self.assertEqual(cmds, [("I", 5, 0, "ab"), ("D", 5, 4, "l")])
+        vim.exec_lua.assert_called_once()
+        vim.eval.assert_not_called()
+        vim.command.assert_not_called()
+
 
 class TestListenerToEdits(unittest.TestCase):
     """Test _listener_to_edits for Vim listener_add event translation."""
@@ -520,8 +638,84 @@ class TestListenerToEdits(unittest.TestCase):
         self.assertEqual(result, ["xhello"])
 
 
+class TestReplayListener(unittest.TestCase):
+    """Test _replay_listener for several Vim listener_add events."""
+
+    def _check(self, events, old_lines, new_buf, snippet_start=5):
+        cmds = _replay_listener(events, old_lines, new_buf, snippet_start, 0, 0)
+        self.assertIsNotNone(cmds, "_replay_listener returned None (gave up)")
+        self.assertEqual(_apply(old_lines, cmds, snippet_start), new_buf[5:])
+        return cmds
+
+    def test_changes_on_several_lines(self):
+        events = [
+            {"lnum": "6", "end": "7", "added": "0", "col": "2"},
+            {"lnum": "8", "end": "9", "added": "0", "col": "2"},
+        ]
+        cmds = self._check(events, ["a", "b", "c"], [""] * 5 + ["ax", "b", "cy"])
+        self.assertEqual(cmds, [("I", 5, 1, "x"), ("I", 7, 1, "y")])
+
+    def test_lines_inserted_above_earlier_change(self):
+        events = [
+            {"lnum": "8", "end": "9", "added": "0", "col": "2"},
+            {"lnum": "7", "end": "7", "added": "1", "col": "1"},
+        ]
+        cmds = self._check(events, ["a", "b", "c"], [""] * 5 + ["a", "new", "b", "cz"])
+        self.assertEqual(
+            cmds, [("I", 7, 1, "z"), ("I", 6, 0, "new"), ("I", 6, 3, "\n")]
+        )
+
+    def test_lines_removed_before_later_change(self):
+        events = [
+            {"lnum": "6", "end": "8", "added": "-2", "col": "1"},
+            {"lnum": "6", "end": "7", "added": "0", "col": "2"},
+        ]
+        self._check(events, ["a", "b", "c", "d"], [""] * 5 + ["cx", "d"])
+
+    def test_uses_recorded_text(self):
+        # The buffer is not read for a change that carries its text.
+        event = {"lnum": "6", "end": "7", "added": "0", "col": "3", "text": "abXc"}
+        cmds = _replay_listener([event], ["abc"], [], 5, 0, 0)
+        self.assertEqual(cmds, [("I", 5, 2, "X")])
+
+    def test_line_changed_again_uses_recorded_text(self):
+        events = [
+            {"lnum": "6", "end": "7", "added": "0", "col": "2", "text": "ax"},
+            {"lnum": "8", "end": "9", "added": "0", "col": "2"},
+            {"lnum": "6", "end": "7", "added": "0", "col": "3"},
+        ]
+        new_buf = [""] * 5 + ["axy", "b", "cz"]
+        cmds = self._check(events, ["a", "b", "c"], new_buf)
+        self.assertEqual(cmds, [("I", 5, 1, "x"), ("I", 7, 1, "z"), ("I", 5, 2, "y")])
+
+    def test_line_changed_again_without_text_returns_none(self):
+        events = [
+            {"lnum": "6", "end": "7", "added": "0", "col": "2"},
+            {"lnum": "8", "end": "9", "added": "0", "col": "2"},
+            {"lnum": "6", "end": "7", "added": "0", "col": "3"},
+        ]
+        new_buf = [""] * 5 + ["axy", "b", "cz"]
+        self.assertIsNone(_replay_listener(events, ["a", "b", "c"], new_buf, 5, 0, 0))
+
+
+class TestVimChangeProvider(unittest.TestCase):
+    def test_drains_changes_in_one_call(self):
+        snippet = mock.Mock()
+        snippet.start.line = 5
+        vstate = mock.Mock(remembered_buffer=["hello"])
+        buf = mock.MagicMock()
+        with mock.patch("UltiSnips.change_provider.vim") as vim:
+            vim.eval.return_value = [
+                {"lnum": "6", "end": "7", "added": "0", "col": "3", "text": "heXllo"}
+            ]
+            cmds = VimChangeProvider().consume_edits(buf, snippet, vstate)
+        self.assertEqual(cmds, [("I", 5, 2, "X")])
+        vim.eval.assert_called_once_with("UltiSnips#listener#Drain()")
+        vim.command.assert_not_called()
+
+
 class TestDiff(unittest.TestCase):
-    """Test diff() — the shortest-edit-path fallback."""
+    """Test diff() — the fallback when nothing tells where the edit was."""
 
     @staticmethod
     def _transform(a, cmds):
@@ -636,6 +830,120 @@ class TestDiff(unittest.TestCase):
             ),
         )
 
+    def test_deletion_is_not_interrupted_by_matches(self):
+        self._check(
+            "a xyz b\nc",
+            "a yb\nc",
+            (("D", 0, 2, "xyz "), ("I", 0, 2, "y")),
+        )
+
+    def test_deletion_before_newline(self):
+        self._check("ab\ncd", "a\nc", (("D", 0, 1, "b"), ("D", 1, 1, "d")))
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        words = ["if", "foo", "bar", " ", "  ", "\n", "\n    ", "(", ")", "=", ":"]
+        for _ in range(1000):
+            a = "".join(rng.choice(words) for _ in range(rng.randrange(12)))
+            b = a
+            for _ in range(rng.randrange(1, 4)):
+                start = rng.randrange(len(b) + 1)
+                end = min(len(b), start + rng.randrange(8))
+                inserted = "".join(rng.choice(words) for _ in range(rng.randrange(3)))
+                b = b[:start] + inserted + b[end:]
+            with self.subTest(a=a, b=b):
+                es = diff(a, b, 3)
+                self.assertEqual(b, self._transform(a, [_shift(e, -3) for e in es]))
+                for first, second in itertools.pairwise(es):
+                    if first[0] == second[0] == "D" and first[1:3] != second[1:3]:
+                        # Matched text right after a deletion starts a line.
+                        self.assertGreater(second[1], first[1])
+
+    def test_large_inputs_are_fast(self):
+        rng = random.Random(0)
+        a = "".join(rng.choice("abcdefgh \n") for _ in range(20000))
+        for b in [
+            a[:10000] + "x" * 100000 + a[10000:],
+            a[:5000] + a[15000:],
+            "".join(c.upper() if rng.random() < 0.01 else c for c in a),
+            "z" * 20000,
+        ]:
+            start = time.perf_counter()
+            es = diff(a, b)
+            self.assertLess(time.perf_counter() - start, 5)
+            self.assertEqual(b, self._transform(a, es))
+
+    def test_distant_edits_in_a_long_line(self):
+        rng = random.Random(0)
+        a = "".join(rng.choice("abcdefghij ") for _ in range(3000))
+        first = "".join(rng.choice("klmnop ") for _ in range(300))
+        second = "".join(rng.choice("klmnop ") for _ in range(300))
+        b = a[:100] + first + a[100:2500] + second + a[2500:]
+        # Too costly to search as a whole, but the text between them is kept.
+        self._check(a, b, (("I", 0, 100, first), ("I", 0, 2800, second)))
+
+
+class TestDiffLines(unittest.TestCase):
+    """Test diff_lines() — diff() over whole lines first."""
+
+    def _check(self, old, new, wanted=None):
+        es = diff_lines(old, new, 2)
+        self.assertEqual(
+            "\n".join(new),
+            TestDiff._transform("\n".join(old), [_shift(e, -2) for e in es]),
+        )
+        if wanted is not None:
+            self.assertEqual(wanted, es)
+
+    def test_same_as_diff_within_a_line(self):
+        old = ["class A:", "    def f(self):", "        pass"]
+        new = ["class A:", "    def g(self, x):", "        pass"]
+        self._check(old, new, diff("\n".join(old), "\n".join(new), 2))
+
+    def test_inserted_line(self):
+        self._check(["a", "c"], ["a", "b", "c"], (("I", 2, 1, "\n"), ("I", 3, 0, "b")))
+
+    def test_deleted_lines(self):
+        self._check(["a", "b", "c", "d"], ["a", "d"])
+        self._check(["a", "b"], ["b"], (("D", 2, 0, "a"), ("D", 2, 0, "\n")))
+        self._check(["a", "b"], ["a"], (("D", 2, 1, "\n"), ("D", 2, 1, "b")))
+
+    def test_empty_sides(self):
+        self._check([""], ["a", "b"])
+        self._check(["a", "b"], [""])
+        self._check([], ["a"])
+
+    def test_random_edits(self):
+        rng = random.Random(0)
+        lines = ["", "a", "b", "  x = 1", "  x = 2", "def f():"]
+        for _ in range(1000):
+            old = [rng.choice(lines) for _ in range(rng.randrange(1, 8))]
+            new = old[:]
+            for _ in range(rng.randrange(1, 4)):
+                start = rng.randrange(len(new) + 1)
+                end = min(len(new), start + rng.randrange(3))
+                new[start:end] = [rng.choice(lines) for _ in range(rng.randrange(3))]
+            with self.subTest(old=old, new=new):
+                self._check(old, new)
+
+    def test_few_changes_in_many_lines(self):
+        old = [f"    line {i} of a long template" for i in range(5000)]
+        old[::10] = [""] * 500
+        new = old[:]
+        new[101] = "    changed"
+        new[3000:3000] = ["    pasted"] * 1000
+        del new[4500:4600]
+        start = time.perf_counter()
+        es = diff_lines(old, new)
+        self.assertLess(time.perf_counter() - start, 1)
+        # Only the changed lines are touched.
+        self.assertEqual({101, 4500} | set(range(2999, 4000)), {e[1] for e in es})
+        self.assertEqual("\n".join(new), TestDiff._transform("\n".join(old), es))
+
+
+def _shift(edit, lines):
+    return (edit[0], edit[1] + lines, edit[2], edit[3])
+
 
 if __name__ == "__main__":
     unittest.main()
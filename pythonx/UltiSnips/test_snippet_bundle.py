@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+"""Tests for ahead-of-time compiled snippet bundles."""
+
+import os
+import shutil
+import unittest
+from pathlib import Path
+
+from UltiSnips.snippet.source.file.ulti_snips import compile_snippet_bundles
+from UltiSnips.snippet_test_util import DirectorySource, DirectoryTestCase
+
+
+class TestSnippetBundles(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        (self.directory / "python.snippets").write_text(
+            "global !p\ndef f():\n\treturn 1\nendglobal\n"
+            'context "True"\nsnippet a\n`!p snip.rv = f()`\nendsnippet\n'
+            'pre_expand "x = 1"\nsnippet b\nb\nendsnippet\n'
+        )
+        (self.directory / "python").mkdir()
+        (self.directory / "python" / "more.snippets").write_text(
+            "snippet c\nc\nendsnippet\n"
+        )
+        (self.directory / "python_django.snippets").write_text(
+            "snippet d\nd\nendsnippet\n"
+        )
+
+    def compile(self):
+        errors = []
+        written = compile_snippet_bundles(str(self.directory), errors)
+        self.assertEqual(errors, [])
+        return written
+
+    def snippets(self, source):
+        source.ensure(["python"])
+        return sorted(
+            (s.trigger, s.location, s._value)
+            for s in source.get_snippets(["python"], "", True, False, "")
+        )
+
+    def test_one_bundle_per_filetype(self):
+        self.assertEqual(
+            [Path(path).name for path in self.compile()],
+            ["python.bundle", "python_django.bundle"],
+        )
+
+    def test_bundle_replaces_parsing(self):
+        expected = self.snippets(DirectorySource(self.directory))
+        self.compile()
+        source = DirectorySource(self.directory)
+        self.assertEqual(self.snippets(source), expected)
+        self.assertEqual(source.parsed, [])
+
+    def test_bundle_carries_compiled_code(self):
+        self.compile()
+        source = DirectorySource(self.directory)
+        source.ensure(["python"])
+        snippets = {
+            s.trigger: s for s in source.get_snippets(["python"], "", True, False, "")
+        }
+        self.assertIsNotNone(snippets["a"]._compiled_context_code)
+        self.assertIsNotNone(snippets["a"]._compiled_globals)
+        self.assertIn("pre_expand", snippets["b"]._compiled_actions)
+        namespace = {}
+        exec(snippets["a"]._compiled_globals, namespace)
+        self.assertEqual(namespace["f"](), 1)
+
+    def test_changed_snippet_file_ignores_bundle(self):
+        self.compile()
+        changed = self.directory / "python" / "more.snippets"
+        stat = changed.stat()
+        changed.write_text("snippet e\ne\nendsnippet\n")
+        # Only the content counts, not the modification time.
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        source = DirectorySource(self.directory)
+        self.assertIn("e", [trigger for trigger, _, _ in self.snippets(source)])
+        self.assertEqual(len(source.parsed), 3)
+
+    def test_touched_snippet_file_keeps_bundle(self):
+        self.compile()
+        os.utime(self.directory / "python.snippets", (4_000_000_000, 4_000_000_000))
+        source = DirectorySource(self.directory)
+        self.snippets(source)
+        self.assertEqual(source.parsed, [])
+
+    def test_moved_directory_keeps_bundle(self):
+        self.compile()
+        moved = self.directory.parent / (self.directory.name + "_moved")
+        shutil.copytree(self.directory, moved)
+        self.addCleanup(shutil.rmtree, moved)
+        source = DirectorySource(moved)
+        self.assertIn(
+            ("c", f"{moved / 'python' / 'more.snippets'}:1", "c"),
+            self.snippets(source),
+        )
+        self.assertEqual(source.parsed, [])
+
+    def test_added_snippet_file_ignores_bundle(self):
+        self.compile()
+        (self.directory / "python_extra.snippets").write_text(
+            "snippet f\nf\nendsnippet\n"
+        )
+        source = DirectorySource(self.directory)
+        self.assertIn("f", [trigger for trigger, _, _ in self.snippets(source)])
+        self.assertEqual(len(source.parsed), 4)
+
+    def test_hidden_directories_are_skipped(self):
+        (self.directory / ".git").mkdir()
+        (self.directory / ".git" / "index").write_bytes(b"DIRC\xff\xfe")
+        self.assertEqual(
+            [Path(path).name for path in self.compile()],
+            ["python.bundle", "python_django.bundle"],
+        )
+
+    def test_directories_with_other_files_are_skipped(self):
+        (self.directory / "notes").mkdir()
+        (self.directory / "notes" / "README").write_text("snippet x\n")
+        self.assertNotIn("notes.bundle", [Path(path).name for path in self.compile()])
+
+    def test_unreadable_file_skips_only_its_filetype(self):
+        broken = self.directory / "c.snippets"
+        broken.write_bytes(b"snippet d\n\xff\nendsnippet\n")
+        errors = []
+        written = compile_snippet_bundles(str(self.directory), errors)
+        self.assertEqual(
+            [Path(path).name for path in written],
+            ["python.bundle", "python_django.bundle"],
+        )
+        self.assertEqual([filename for filename, _ in errors], [str(broken)])
+
+
+if __name__ == "__main__":
+    unittest.main()
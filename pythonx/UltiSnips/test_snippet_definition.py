@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""Tests for the lazy parts of snippet definitions."""
+
+import itertools
+import pickle
+import random
+import unittest
+from unittest import mock
+
+from UltiSnips.snippet.definition import (
+    PythonGlobals,
+    SnippetDefinition,
+    UltiSnipsSnippetDefinition,
+)
+from UltiSnips.snippet.definition.base import _trigger_window, _words_for_line
+from UltiSnips.snippet.source.file.ulti_snips import _parse_snippets_file
+
+
+def _definition(trigger, options="", context=None, actions=None):
+    return UltiSnipsSnippetDefinition(
+        0, trigger, "body", "", options, {}, "/a.snippets:1", context, actions
+    )
+
+
+class TestLazyDefinition(unittest.TestCase):
+    def test_construction_does_no_work(self):
+        with (
+            mock.patch("UltiSnips.snippet.definition.base.vim_helper") as helper,
+            mock.patch("UltiSnips.snippet.definition.base.cached_compile") as comp,
+        ):
+            snippet = _definition(
+                "foo", "w", context="True", actions={"pre_expand": "pass"}
+            )
+        helper.eval.assert_not_called()
+        comp.assert_not_called()
+        self.assertIsNone(snippet._compiled_context_code)
+        self.assertEqual(snippet._compiled_actions, {})
+
+    def test_initial_match_is_trigger(self):
+        self.assertEqual(_definition("foo")._initial_match().matched, "foo")
+        self.assertEqual(_definition("foo", "b")._initial_match().matched, "foo")
+
+    def test_initial_match_is_regex_match_of_trigger(self):
+        match = _definition("fo+", "r")._initial_match()
+        self.assertEqual(match.matched, "")
+        self.assertIsNone(match.last_re)
+        match = _definition("foo", "r")._initial_match()
+        self.assertEqual(match.matched, "foo")
+        self.assertEqual(match.last_re.group(0), "foo")
+
+    def test_no_match(self):
+        snippet = _definition("foo")
+        self.assertIsNone(snippet.match("bar"))
+        self.assertFalse(snippet.matches("bar"))
+
+    def test_matches_are_independent(self):
+        snippet = _definition("x+", "r")
+        first = snippet.match("a xx")
+        second = snippet.match("xxx")
+        self.assertIsNone(snippet.match("y"))
+        self.assertEqual((first.matched, first.last_re.group(0)), ("xx", "xx"))
+        self.assertEqual((second.matched, second.last_re.group(0)), ("xxx", "xxx"))
+        self.assertIs(first.snippet, snippet)
+        self.assertIsNone(first.context)
+
+    def test_partial_match(self):
+        self.assertEqual(_definition("foo").partial_match("fo").matched, "fo")
+        self.assertEqual(_definition("foo", "i").partial_match("xfo").matched, "fo")
+        self.assertIsNone(_definition("foo").partial_match("fx"))
+        self.assertIsNone(_definition("foo", "b").partial_match("x fo"))
+
+    def test_action_is_compiled_once_on_first_use(self):
+        snippet = _definition("foo", actions={"post_jump": "x = 1"})
+        compiled = snippet._compiled_action("post_jump")
+        self.assertIs(snippet._compiled_action("post_jump"), compiled)
+
+    def test_action_syntax_error_carries_snippet_info(self):
+        snippet = _definition("foo", actions={"post_jump": "x = ("})
+        with self.assertRaises(SyntaxError) as cm:
+            snippet._compiled_action("post_jump")
+        self.assertIn("Trigger: foo", cm.exception.snippet_info)
+
+
+class TestPythonGlobals(unittest.TestCase):
+    def snippets(self):
+        data = "global !p\nx = 1\nendglobal\n" + "".join(
+            f"snippet s{i}\nbody\nendsnippet\n" for i in range(3)
+        )
+        return [data[0] for _, data in _parse_snippets_file(data, "/f")]
+
+    def test_globals_are_compiled_once_per_file(self):
+        snippets = self.snippets()
+        with mock.patch(
+            "UltiSnips.snippet.definition.base.compile", create=True, wraps=compile
+        ) as comp:
+            for snippet in snippets:
+                snippet._precompile_globals()
+        comp.assert_called_once()
+        self.assertIs(snippets[0]._compiled_globals, snippets[2]._compiled_globals)
+        namespace = {}
+        exec(snippets[1]._compiled_globals, namespace)
+        self.assertEqual(namespace["x"], 1)
+
+    def test_pickling_keeps_sharing_but_not_code(self):
+        snippets = self.snippets()
+        snippets[0]._precompile_globals()
+        loaded = pickle.loads(pickle.dumps(snippets))
+        self.assertIsInstance(loaded[0]._globals, PythonGlobals)
+        self.assertIs(loaded[0]._globals, loaded[2]._globals)
+        self.assertEqual(loaded[0]._globals, snippets[0]._globals)
+        self.assertIsNone(loaded[0]._globals._compiled)
+
+    def test_plain_dict_globals_still_work(self):
+        snippet = UltiSnipsSnippetDefinition(
+            0, "t", "body", "", "", {"!p": ["y = 2"]}, "", None, None
+        )
+        snippet._precompile_globals()
+        namespace = {}
+        exec(snippet._compiled_globals, namespace)
+        self.assertEqual(namespace["y"], 2)
+
+
+class TestTriggerWindow(unittest.TestCase):
+    def test_words_match_like_the_whole_line(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            trigger = "".join(rng.choice("ab ") for _ in range(rng.randrange(4)))
+            before = "".join(rng.choice("ab \t") for _ in range(rng.randrange(10)))
+            window = _trigger_window(trigger, before)
+            words = _words_for_line(trigger, before)
+            window_words = _words_for_line(trigger, window)
+            with self.subTest(trigger=trigger, before=before):
+                self.assertEqual(window_words == trigger, words == trigger)
+                self.assertEqual(
+                    window_words.endswith(trigger), words.endswith(trigger)
+                )
+                self.assertEqual(
+                    trigger.startswith(window_words), trigger.startswith(words)
+                )
+
+    def test_long_lines(self):
+        line = "x" * 100_000
+        for (trigger, options), before in itertools.product(
+            [("foo", ""), ("foo", "i"), ("foo", "b"), ("a foo", "")],
+            ["foo", " foo", "xfoo", "a foo"],
+        ):
+            snippet = _definition(trigger, options)
+            with self.subTest(trigger=trigger, options=options, before=before):
+                self.assertEqual(
+                    snippet.matches(line + before), snippet.matches("x" + before)
+                )
+
+    def test_regex_triggers_only_look_at_the_window(self):
+        window = SnippetDefinition.regex_trigger_window
+        self.addCleanup(setattr, SnippetDefinition, "regex_trigger_window", window)
+        SnippetDefinition.regex_trigger_window = 5
+        snippet = _definition("x+", "r")
+        self.assertEqual(snippet.match("xxxxxxxx").matched, "xxxxx")
+        self.assertFalse(_definition("x{6}", "r").matches("xxxxxx"))
+        self.assertTrue(_definition("(?<=a)x", "r").matches("aaaaaaax"))
+        SnippetDefinition.regex_trigger_window = 0
+        self.assertTrue(_definition("x{6}", "r").matches("xxxxxx"))
+
+    def test_start_anchored_regex_triggers_see_the_whole_line(self):
+        window = SnippetDefinition.regex_trigger_window
+        self.addCleanup(setattr, SnippetDefinition, "regex_trigger_window", window)
+        SnippetDefinition.regex_trigger_window = 5
+        for trigger in ["^x+", r"\Ax+", "(?i)^X+", "^(?:x)+"]:
+            with self.subTest(trigger=trigger):
+                match = _definition(trigger, "r").match("xxxxxxxx")
+                self.assertEqual(match.matched, "xxxxxxxx")
+        self.assertFalse(_definition("^x+", "r").matches("axxxxxxx"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+"""Tests for looking up snippets in a SnippetDictionary."""
+
+import itertools
+import random
+import unittest
+from unittest import mock
+
+from UltiSnips import word_boundary
+from UltiSnips.snippet.definition import SnippetDefinition, UltiSnipsSnippetDefinition
+from UltiSnips.snippet.source.snippet_dictionary import (
+    SnippetDictionary,
+    _final_characters,
+)
+
+_TRIGGERS = ["a", "ab", "b", "ba", "a b", "b a", "", "x y z", "a.", "fo+"]
+_OPTIONS = ["", "b", "w", "i", "p", "r", "A", "iA", "wb", "ib", "rA", "pA", "wA"]
+
+
+def _snippets():
+    return [
+        UltiSnipsSnippetDefinition(0, trigger, "", "", options, {}, "", None, None)
+        for trigger, options in itertools.product(_TRIGGERS, _OPTIONS)
+    ]
+
+
+def _use_default_iskeyword(test):
+    patcher = mock.patch.object(
+        word_boundary,
+        "_current",
+        word_boundary.WordBoundaries(
+            word_boundary.parse_iskeyword("@,48-57,_,192-255")
+        ),
+    )
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+def _linear_matches(snippets, before, autotrigger_only):
+    if autotrigger_only:
+        snippets = [s for s in snippets if s.has_option("A")]
+    return [s for s in snippets if s.matches(before)]
+
+
+class TestTriggerIndex(unittest.TestCase):
+    def setUp(self):
+        _use_default_iskeyword(self)
+
+    def test_same_result_as_linear_scan(self):
+        snippets = _snippets()
+        random.Random(0).shuffle(snippets)
+        dictionary = SnippetDictionary()
+        for snippet in snippets:
+            dictionary.add_snippet(snippet)
+        rng = random.Random(1)
+        befores = ["", " ", "a", "ab", "xab", "x a b", "  b a", "x y z", "fooo"]
+        befores += [
+            "".join(rng.choice("ab .xyzfo") for _ in range(rng.randrange(8)))
+            for _ in range(200)
+        ]
+        for before, autotrigger_only in itertools.product(befores, (False, True)):
+            with self.subTest(before=before, autotrigger_only=autotrigger_only):
+                self.assertEqual(
+                    dictionary.get_matching_snippets(
+                        before, False, autotrigger_only, None
+                    ),
+                    _linear_matches(snippets, before, autotrigger_only),
+                )
+
+    def test_regex_triggers_same_result_as_linear_scan(self):
+        triggers = [
+            "a|ab",
+            "aa",
+            "(?i)AB",
+            r"(a)\1",
+            "(?P<x>a)b",
+            "(?P<x>b)a",
+            "^b",
+            "(?<=x)a",
+            r"\ba",
+        ]
+        triggers += [f"{c}+{d}" for c in "abx" for d in "ab"] * 3
+        snippets = [
+            UltiSnipsSnippetDefinition(0, trigger, "", "", "r", {}, "", None, None)
+            for trigger in triggers
+        ]
+        dictionary = SnippetDictionary()
+        for snippet in snippets:
+            dictionary.add_snippet(snippet)
+        rng = random.Random(2)
+        for _ in range(300):
+            before = "".join(rng.choice("abAx ") for _ in range(rng.randrange(7)))
+            with self.subTest(before=before):
+                matches = dictionary.get_matching_snippets(before, False, False, None)
+                self.assertEqual(matches, _linear_matches(snippets, before, False))
+                for snippet in matches:
+                    match = snippet.match(before)
+                    self.assertEqual(match.last_re.end(), len(before))
+                    self.assertEqual(match.matched, match.last_re.group(0))
+
+    def test_start_anchored_regex_triggers_on_long_lines(self):
+        window = SnippetDefinition.regex_trigger_window
+        self.addCleanup(setattr, SnippetDefinition, "regex_trigger_window", window)
+        SnippetDefinition.regex_trigger_window = 5
+        triggers = ["^a+", r"\Aa+", "(?i)^A+", "a{6}", "(a)\\1+"]
+        snippets = [
+            UltiSnipsSnippetDefinition(0, trigger, "", "", "r", {}, "", None, None)
+            for trigger in triggers
+        ]
+        dictionary = SnippetDictionary()
+        for snippet in snippets:
+            dictionary.add_snippet(snippet)
+        matches = dictionary.get_matching_snippets("aaaaaaaa", False, False, None)
+        self.assertEqual(matches, snippets[:3] + snippets[4:])
+        self.assertEqual(matches, _linear_matches(snippets, "aaaaaaaa", False))
+
+    def test_index_is_rebuilt_after_adding(self):
+        dictionary = SnippetDictionary()
+        first = UltiSnipsSnippetDefinition(0, "a", "", "", "", {}, "", None, None)
+        dictionary.add_snippet(first)
+        self.assertEqual(
+            dictionary.get_matching_snippets("a", False, False, None), [first]
+        )
+        second = UltiSnipsSnippetDefinition(0, "a", "", "", "i", {}, "", None, None)
+        dictionary.add_snippet(second)
+        self.assertEqual(
+            dictionary.get_matching_snippets("xa", False, False, None), [second]
+        )
+
+
+class TestAutotriggerIndex(unittest.TestCase):
+    def setUp(self):
+        _use_default_iskeyword(self)
+
+    def test_final_characters_of_regular_expressions(self):
+        for pattern, expected in [
+            ("ab", {"b"}),
+            ("a|bc", {"a", "c"}),
+            ("(x|y)+", {"x", "y"}),
+            (r"[a-c]\Z", {"a", "b", "c"}),
+            ("(?:ab)+c?d?", {"b", "c", "d"}),
+            ("(?:ab)*c?d?", None),
+            ("a(?=b)", {"a"}),
+            ("a?", None),
+            ("a.", None),
+            (r"a\w", None),
+            ("[^a]", None),
+            ("(?i)a", None),
+            ("(?i:a)", None),
+            (r"(a)\1", None),
+            ("(", None),
+        ]:
+            with self.subTest(pattern=pattern):
+                self.assertEqual(_final_characters(pattern), expected)
+
+    def test_any_final_character_without_the_regex_parser(self):
+        with mock.patch(
+            "UltiSnips.snippet.source.snippet_dictionary._regex_parser", None
+        ):
+            self.assertIsNone(_final_characters("ab"))
+
+    def test_same_result_as_linear_scan(self):
+        triggers = ["ab", "a b", "b ", "", "x|ab", "a+", "a?", "[ab]x", r"\s", "xa"]
+        snippets = [
+            UltiSnipsSnippetDefinition(0, trigger, "", "", options, {}, "", None, None)
+            for trigger, options in itertools.product(
+                triggers, ["A", "iA", "wA", "bA", "pA", "rA", "r", "i"]
+            )
+        ]
+        random.Random(3).shuffle(snippets)
+        dictionary = SnippetDictionary()
+        for snippet in snippets:
+            dictionary.add_snippet(snippet)
+        rng = random.Random(4)
+        for _ in range(300):
+            before = "".join(rng.choice("abx |\t") for _ in range(rng.randrange(7)))
+            with self.subTest(before=before):
+                self.assertEqual(
+                    dictionary.get_matching_snippets(before, False, True, None),
+                    _linear_matches(snippets, before, True),
+                )
+
+    def test_no_candidates_for_other_characters(self):
+        dictionary = SnippetDictionary()
+        dictionary.add_snippet(
+            UltiSnipsSnippetDefinition(0, "ab", "", "", "A", {}, "", None, None)
+        )
+        index_candidates = dictionary.get_matching_snippets("xa", False, True, None)
+        self.assertEqual(index_candidates, [])
+        self.assertEqual(dictionary._autotrigger_index.candidates("xa"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""Tests for the cached listings of snippet directories."""
+
+import os
+import unittest
+
+from UltiSnips.snippet.source.file.directory_index import SnippetDirectoryIndex
+from UltiSnips.snippet.source.file.snipmate import _snipmate_files_for
+from UltiSnips.snippet.source.file.ulti_snips import (
+    _expand_snippet_directories,
+    _indexed_snippet_files,
+    find_snippet_files,
+)
+from UltiSnips.snippet_test_util import DirectoryTestCase
+
+
+class TestSnippetDirectoryIndex(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = SnippetDirectoryIndex()
+
+    def touch(self, *names):
+        for name in names:
+            path = self.directory / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text("")
+
+    def files(self, *names):
+        return {str((self.directory / name).resolve()) for name in names}
+
+    def test_ultisnips_files_match_globbing(self):
+        self.touch(
+            "python.snippets",
+            "python_django.snippets",
+            "python_.snippets",
+            "python_django_orm.snippets",
+            "pythonic.snippets",
+            "c.snippets",
+            "python/extra.snippets",
+            "python/README",
+            "notes.txt",
+        )
+        for ft in ("python", "python_django", "python_", "pythonic", "c", "rust"):
+            with self.subTest(ft=ft):
+                self.assertEqual(
+                    _indexed_snippet_files(self.index, ft, str(self.directory)),
+                    find_snippet_files(ft, str(self.directory)),
+                )
+
+    def test_subdirectories_are_not_snippet_files(self):
+        self.touch("python/extra.snippets")
+        (self.directory / "python" / "nested").mkdir()
+        self.assertEqual(
+            _indexed_snippet_files(self.index, "python", str(self.directory)),
+            self.files("python/extra.snippets"),
+        )
+
+    def test_snipmate_files(self):
+        self.touch(
+            "c.snippets",
+            "c_extra.snippets",
+            "c/a.snippets",
+            "c/for.snippet",
+            "c/notes.txt",
+            "c/if/plain.snippet",
+            "c/if/other.snippets",
+            "_.snippets",
+        )
+        self.assertEqual(
+            _snipmate_files_for("c", self.index, str(self.directory)),
+            self.files(
+                "c.snippets", "c/a.snippets", "c/for.snippet", "c/if/plain.snippet"
+            ),
+        )
+        self.assertEqual(
+            _snipmate_files_for("_", self.index, str(self.directory)),
+            self.files("_.snippets"),
+        )
+
+    def test_missing_directory_is_empty(self):
+        missing = str(self.directory / "missing")
+        self.assertEqual(_indexed_snippet_files(self.index, "c", missing), set())
+        self.touch("missing/c.snippets")
+        self.assertEqual(
+            _indexed_snippet_files(self.index, "c", missing),
+            self.files("missing/c.snippets"),
+        )
+
+    def test_listing_is_reused_until_mtime_changes(self):
+        self.touch("c.snippets")
+        os.utime(self.directory, ns=(1, 1))
+        listing = self.index.listing(str(self.directory))
+        self.assertIs(self.index.listing(str(self.directory)), listing)
+
+        self.touch("c_more.snippets")
+        os.utime(self.directory, ns=(1, 1))
+        self.assertIs(self.index.listing(str(self.directory)), listing)
+
+        os.utime(self.directory, ns=(2, 2))
+        self.assertEqual(
+            _indexed_snippet_files(self.index, "c", str(self.directory)),
+            self.files("c.snippets", "c_more.snippets"),
+        )
+
+    def test_directories_are_recomputed_when_key_changes(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return [str(len(calls))]
+
+        self.assertEqual(self.index.directories(("a",), compute), ["1"])
+        self.assertEqual(self.index.directories(("a",), compute), ["1"])
+        self.assertEqual(self.index.directories(("b",), compute), ["2"])
+
+    def test_expand_keeps_missing_directories(self):
+        rtp = f"{self.directory / 'one'},{self.directory / 'two'}"
+        (self.directory / "one" / "UltiSnips").mkdir(parents=True)
+        self.assertEqual(
+            _expand_snippet_directories(["UltiSnips"], rtp),
+            [str(self.directory / "one" / "UltiSnips")],
+        )
+        self.assertEqual(
+            _expand_snippet_directories(["UltiSnips"], rtp, keep_missing=True),
+            [
+                str(self.directory / "one" / "UltiSnips"),
+                str(self.directory / "two" / "UltiSnips"),
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
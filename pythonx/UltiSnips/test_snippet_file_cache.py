@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""Tests for the on-disk cache of parsed snippet files."""
+
+import os
+import pickle
+import unittest
+from pathlib import Path
+
+from UltiSnips.snippet.definition import (
+    SnipMateSnippetDefinition,
+    UltiSnipsSnippetDefinition,
+)
+from UltiSnips.snippet.source.file.cache import SnippetFileCache, file_signature
+from UltiSnips.snippet.source.file.ulti_snips import _parse_snippets_file
+from UltiSnips.snippet_test_util import DirectorySource, DirectoryTestCase, snippet
+
+_SNIPPETS = """\
+global !p
+def helper():
+    return 42
+endglobal
+
+priority 10
+snippet hello "Greeting" b
+Hello ${1:world}!
+endsnippet
+
+extends python
+clearsnippets foo
+"""
+
+
+class TestSnippetFileCache(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = SnippetFileCache(self.directory / "cache")
+
+    def test_missing_entry_is_a_miss(self):
+        self.assertIsNone(self.cache.load("kind", "/a.snippets", (1, 2)))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    def test_roundtrip(self):
+        events = list(_parse_snippets_file(_SNIPPETS, "/a.snippets"))
+        self.cache.store("kind", "/a.snippets", (1, 2), events)
+        loaded = self.cache.load("kind", "/a.snippets", (1, 2))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+        self.assertEqual([e for e, _ in loaded], [e for e, _ in events])
+        (snippet,) = next(data for e, data in loaded if e == "snippet")
+        self.assertIsInstance(snippet, UltiSnipsSnippetDefinition)
+        self.assertEqual(snippet.trigger, "hello")
+        self.assertEqual(snippet.priority, 10)
+        self.assertEqual(snippet.location, "/a.snippets:7")
+        self.assertEqual(snippet._value, "Hello ${1:world}!")
+        self.assertEqual(snippet._globals["!p"], ["def helper():\n    return 42"])
+        self.assertIn(("extends", (["python"],)), loaded)
+        self.assertIn(("clearsnippets", (10, ["foo"])), loaded)
+
+    def test_snipmate_roundtrip(self):
+        events = [("snippet", (SnipMateSnippetDefinition("t", "v", "d", "/x:1"),))]
+        self.cache.store("kind", "/x", (1, 2), events)
+        ((_, (snippet,)),) = self.cache.load("kind", "/x", (1, 2))
+        self.assertIsInstance(snippet, SnipMateSnippetDefinition)
+        self.assertEqual(
+            (snippet.trigger, snippet._value, snippet.location), ("t", "v", "/x:1")
+        )
+        self.assertTrue(snippet.has_option("w"))
+
+    def test_changed_signature_is_a_miss(self):
+        self.cache.store("kind", "/a.snippets", (1, 2), [])
+        self.assertIsNone(self.cache.load("kind", "/a.snippets", (1, 3)))
+        self.assertIsNone(self.cache.load("other", "/a.snippets", (1, 2)))
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_corrupt_entry_is_a_miss(self):
+        self.cache.store("kind", "/a.snippets", (1, 2), [])
+        (entry,) = Path(self.cache.directory).iterdir()
+        entry.write_bytes(pickle.dumps("garbage")[:-2])
+        self.assertIsNone(self.cache.load("kind", "/a.snippets", (1, 2)))
+
+    def test_clear(self):
+        self.cache.store("kind", "/a.snippets", (1, 2), [])
+        self.cache.load("kind", "/a.snippets", (1, 2))
+        self.cache.clear()
+        self.assertEqual(list(Path(self.cache.directory).iterdir()), [])
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 0))
+        self.assertIsNone(self.cache.load("kind", "/a.snippets", (1, 2)))
+
+    def test_file_signature(self):
+        path = self.directory / "a.snippets"
+        self.assertIsNone(file_signature(str(path)))
+        path.write_text("abc")
+        os.utime(path, ns=(1, 5))
+        self.assertEqual(file_signature(str(path)), (5, 3))
+
+
+class TestSnippetFileCacheInSource(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = SnippetFileCache(self.directory / "cache")
+        self.path = self.directory / "python.snippets"
+        self.path.write_text(snippet("a"))
+
+    def triggers(self, source):
+        source.ensure(["python"])
+        return [s.trigger for s in source.get_snippets(["python"], "", True, False, "")]
+
+    def test_unchanged_file_is_loaded_from_cache(self):
+        first = DirectorySource(self.directory, cache=self.cache)
+        self.assertEqual(self.triggers(first), ["a"])
+        self.assertEqual(first.parsed, ["python.snippets"])
+
+        second = DirectorySource(self.directory, cache=self.cache)
+        self.assertEqual(self.triggers(second), ["a"])
+        self.assertEqual(second.parsed, [])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_changed_file_is_parsed_again(self):
+        self.triggers(DirectorySource(self.directory, cache=self.cache))
+        self.path.write_text(snippet("b"))
+        os.utime(self.path, ns=(1, 1))
+
+        source = DirectorySource(self.directory, cache=self.cache)
+        self.assertEqual(self.triggers(source), ["b"])
+        self.assertEqual(source.parsed, ["python.snippets"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
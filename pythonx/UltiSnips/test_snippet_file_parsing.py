@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""Tests for the single pass parsing of snippet files."""
+
+import re
+import unittest
+
+from UltiSnips.snippet.source.file import snipmate, ulti_snips
+from UltiSnips.text import LineIterator
+
+_TEXTS = [
+    "",
+    "a",
+    "a\n",
+    "a\nb",
+    "a\r\nb\r\n",
+    "a\rb\r\n\nc",
+    "a\x0cb c\n",
+    "\n\n\n",
+]
+
+
+def _snippets(events):
+    return [
+        (data[0].trigger, data[0]._value, data[0].location)
+        if event == "snippet"
+        else (event, data)
+        for event, data in events
+    ]
+
+
+class TestLineIterator(unittest.TestCase):
+    def test_lines_match_splitlines(self):
+        for text in _TEXTS:
+            with self.subTest(text=text):
+                self.assertEqual(list(LineIterator(text)), text.splitlines(True))
+
+    def test_peek_does_not_advance(self):
+        lines = LineIterator("a\nb\n")
+        self.assertEqual(lines.peek(), "a\n")
+        self.assertEqual(next(lines), "a\n")
+        self.assertEqual(lines.peek(), "b\n")
+        self.assertEqual((lines.line_index, lines.offset), (1, 2))
+        next(lines)
+        self.assertIsNone(lines.peek())
+
+    def test_skip_to(self):
+        pattern = re.compile(r"\nstop\s*$", re.MULTILINE)
+        for text in ("head\na\nb\nstop\nc\n", "head\ra\rb\rstop\rc\r"):
+            with self.subTest(text=text):
+                lines = LineIterator(text)
+                next(lines)
+                self.assertTrue(lines.skip_to(pattern))
+                self.assertEqual(lines.line_index, 3)
+                self.assertEqual(text[: lines.offset], text[:9])
+                self.assertEqual(next(lines).rstrip(), "stop")
+
+    def test_skip_to_without_match_consumes_everything(self):
+        pattern = re.compile(r"\nstop$", re.MULTILINE)
+        for text in ("head\na\nb\n", "head\na\nb"):
+            with self.subTest(text=text):
+                lines = LineIterator(text)
+                next(lines)
+                self.assertFalse(lines.skip_to(pattern))
+                self.assertEqual(lines.line_index, 3)
+                self.assertIsNone(lines.peek())
+
+
+class TestParsers(unittest.TestCase):
+    def test_ultisnips_bodies_and_line_numbers(self):
+        for newline in ("\n", "\r"):
+            data = newline.join(
+                [
+                    "snippet a",
+                    "first",
+                    "second",
+                    "endsnippet  ",
+                    "snippet b",
+                    "endsnippet",
+                    "snippet c",
+                    "no end",
+                    "",
+                ]
+            )
+            with self.subTest(newline=newline):
+                self.assertEqual(
+                    _snippets(ulti_snips._parse_snippets_file(data, "/f")),
+                    [
+                        ("a", f"first{newline}second", "/f:1"),
+                        ("b", "", "/f:5"),
+                        ("error", ("Missing 'endsnippet' for 'c'", 8)),
+                    ],
+                )
+
+    def test_snipmate_bodies(self):
+        data = "snippet a desc\n\tfirst\n\t\tsecond\n\n\tthird\nsnippet b\n\tx"
+        self.assertEqual(
+            _snippets(snipmate._parse_snippets_file(data, "/f")),
+            [("a", "first\n\tsecond\n\nthird", "/f:1"), ("b", "", "/f:6")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
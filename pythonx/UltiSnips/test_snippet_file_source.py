@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+"""Tests for the incremental reloading of file based snippet sources."""
+
+import os
+import unittest
+
+from UltiSnips.snippet_test_util import DirectorySource, DirectoryTestCase, snippet
+
+
+class TestIncrementalRefresh(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = DirectorySource(self.directory)
+        self._mtime = 1
+
+    def write(self, name, content):
+        path = self.directory / name
+        path.write_text(content)
+        # Make every write visible to the stat signature, however fast the
+        # test runs.
+        self._mtime += 1
+        os.utime(path, ns=(self._mtime, self._mtime))
+
+    def triggers(self, *filetypes):
+        self.source.ensure(filetypes)
+        return sorted(
+            s.trigger for s in self.source.get_snippets(filetypes, "", True, False, "")
+        )
+
+    def test_refresh_without_changes_parses_nothing(self):
+        self.write("python.snippets", snippet("a"))
+        self.write("c.snippets", snippet("b"))
+        self.assertEqual(self.triggers("python"), ["a"])
+        self.assertEqual(self.triggers("c"), ["b"])
+        self.source.refresh()
+        self.assertEqual(self.triggers("python"), ["a"])
+        self.assertEqual(self.triggers("c"), ["b"])
+        self.assertEqual(self.source.parsed, [])
+
+    def test_only_changed_file_is_parsed(self):
+        self.write("python.snippets", snippet("a"))
+        self.write("python_extra.snippets", snippet("b"))
+        self.write("c.snippets", snippet("c"))
+        self.triggers("python")
+        self.triggers("c")
+        self.source.refresh()
+        self.write("python_extra.snippets", snippet("b") + snippet("d"))
+        self.assertEqual(self.triggers("python"), ["a", "b", "d"])
+        self.assertEqual(self.triggers("c"), ["c"])
+        self.assertEqual(self.source.parsed, ["python_extra.snippets"])
+
+    def test_added_and_removed_files(self):
+        self.write("python.snippets", snippet("a"))
+        self.assertEqual(self.triggers("python"), ["a"])
+        self.source.refresh()
+        self.write("python_extra.snippets", snippet("b"))
+        self.assertEqual(self.triggers("python"), ["a", "b"])
+        self.source.refresh()
+        (self.directory / "python.snippets").unlink()
+        self.assertEqual(self.triggers("python"), ["b"])
+        self.assertEqual(self.source.parsed, [])
+
+    def test_changed_parent_is_reloaded_through_extends(self):
+        self.write("python.snippets", "extends base\n" + snippet("a"))
+        self.write("base.snippets", snippet("b"))
+        self.assertEqual(self.triggers("python"), ["a", "b"])
+        self.source.refresh()
+        self.write("base.snippets", snippet("c"))
+        self.assertEqual(self.triggers("python"), ["a", "c"])
+        self.assertEqual(self.source.parsed, ["base.snippets"])
+
+    def test_removed_extends_is_dropped(self):
+        self.write("python.snippets", "extends base\n" + snippet("a"))
+        self.write("base.snippets", snippet("b"))
+        self.assertEqual(self.triggers("python"), ["a", "b"])
+        self.source.refresh()
+        self.write("python.snippets", snippet("a"))
+        self.assertEqual(self.triggers("python"), ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
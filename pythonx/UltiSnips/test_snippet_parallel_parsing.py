@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Tests for parsing snippet files in worker processes."""
+
+import unittest
+from unittest import mock
+
+from UltiSnips.snippet.source.file.parallel import can_fork
+from UltiSnips.snippet_test_util import DirectorySource, DirectoryTestCase
+
+
+@unittest.skipUnless(can_fork(), "worker processes cannot be forked")
+class TestParallelParsing(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        # Worker processes are only used with more than one CPU.
+        patcher = mock.patch(
+            "UltiSnips.snippet.source.file.base.worker_count", return_value=2
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = self.directory
+        (directory / "python.snippets").write_text(
+            "extends base\npriority -10\nsnippet a\nfirst\nendsnippet\n"
+        )
+        (directory / "python_more.snippets").write_text(
+            "clearsnippets a\nsnippet a\nsecond\nendsnippet\n"
+        )
+        (directory / "python").mkdir()
+        (directory / "python" / "x.snippets").write_text(
+            "priority 5\nsnippet b\nb\nendsnippet\n"
+        )
+        (directory / "base.snippets").write_text("snippet c\nc\nendsnippet\n")
+
+    def snippets(self, source):
+        source.ensure(["python"])
+        return [
+            (s.trigger, s.priority, s.location, s._value)
+            for s in source.get_snippets(["python"], "", True, False, "")
+        ]
+
+    def test_same_snippets_as_serial_parsing(self):
+        serial = DirectorySource(self.directory)
+        parallel = DirectorySource(self.directory, parallel_threshold=0)
+        self.assertEqual(self.snippets(parallel), self.snippets(serial))
+        self.assertEqual(parallel._extends, serial._extends)
+        self.assertEqual(
+            sorted(serial.parsed),
+            ["base.snippets", "python.snippets", "python_more.snippets", "x.snippets"],
+        )
+        # 'base' has a single file, which is not worth a pool.
+        self.assertEqual(parallel.parsed, ["base.snippets"])
+
+    def test_single_cpu_parses_serially(self):
+        source = DirectorySource(self.directory, parallel_threshold=0)
+        with mock.patch(
+            "UltiSnips.snippet.source.file.base.worker_count", return_value=1
+        ):
+            self.snippets(source)
+        self.assertEqual(len(source.parsed), 4)
+
+    def test_small_collections_are_parsed_serially(self):
+        source = DirectorySource(self.directory, parallel_threshold=1 << 20)
+        self.snippets(source)
+        self.assertEqual(len(source.parsed), 4)
+
+    def test_unchanged_files_are_not_sent_to_workers(self):
+        source = DirectorySource(self.directory, parallel_threshold=0)
+        self.snippets(source)
+        parsed = dict(source._parsed_files)
+        source.refresh()
+        source._snippets.clear()
+        self.snippets(source)
+        for fn, (_, events) in source._parsed_files.items():
+            self.assertIs(events, parsed[fn][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Tests for loading snippet files in a background thread."""
+
+import unittest
+
+from UltiSnips.snippet_test_util import DirectorySource, DirectoryTestCase
+
+
+class TestPreload(DirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.source = DirectorySource(self.directory)
+        (self.directory / "python.snippets").write_text(
+            "extends base\nsnippet a\na\nendsnippet\n"
+        )
+        (self.directory / "base.snippets").write_text("snippet b\nb\nendsnippet\n")
+
+    def triggers(self, *filetypes):
+        self.source.ensure(filetypes)
+        return sorted(
+            s.trigger for s in self.source.get_snippets(filetypes, "", True, False, "")
+        )
+
+    def test_files_are_parsed_in_the_background(self):
+        self.assertTrue(self.source.preload(["python"]))
+        self.assertFalse(self.source.finish_preload(wait=True))
+        self.assertEqual(self.triggers("python"), ["a", "b"])
+        self.assertEqual(
+            sorted(zip(self.source.parsed, self.source.threads, strict=True)),
+            [
+                ("base.snippets", "UltiSnipsPreload"),
+                ("python.snippets", "UltiSnipsPreload"),
+            ],
+        )
+
+    def test_loaded_filetypes_are_not_preloaded(self):
+        self.triggers("python")
+        self.assertFalse(self.source.preload(["python"]))
+
+    def test_syntax_errors_are_reported_by_ensure(self):
+        (self.directory / "base.snippets").write_text("snippet b\nb\n")
+        self.source.preload(["python"])
+        self.source.finish_preload(wait=True)
+        self.assertNotIn("base", self.source._snippets)
+        self.assertEqual(self.source.parsed.count("base.snippets"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+"""Tests for the bookkeeping shared by all snippet sources."""
+
+import itertools
+import random
+import unittest
+
+from UltiSnips.snippet.definition import UltiSnipsSnippetDefinition
+from UltiSnips.snippet.source.added import AddedSnippetsSource
+from UltiSnips.snippet.source.base import SnippetSource
+from UltiSnips.snippet.source.resolved import ResolvedSnippets
+
+
+class TestDeepExtends(unittest.TestCase):
+    def setUp(self):
+        self.source = SnippetSource()
+        self.source.update_extends("python", ["base", "django"])
+        self.source.update_extends("django", ["html", "base"])
+        self.source.update_extends("html", ["python"])
+
+    def test_breadth_first_in_insertion_order(self):
+        self.assertEqual(
+            self.source.get_deep_extends(["python", "c"]),
+            ["python", "c", "base", "django", "html"],
+        )
+
+    def test_result_is_shared_until_extends_change(self):
+        deep_extends = self.source.get_deep_extends(["python"])
+        self.assertIs(self.source.get_deep_extends(("python",)), deep_extends)
+        self.source.update_extends("python", ["django"])
+        self.assertIs(self.source.get_deep_extends(["python"]), deep_extends)
+        self.source.update_extends("base", ["c"])
+        self.assertEqual(
+            self.source.get_deep_extends(["python"]),
+            ["python", "base", "django", "c", "html"],
+        )
+
+    def test_forgetting_extends_invalidates(self):
+        self.source.get_deep_extends(["python"])
+        self.source._forget_extends("python")
+        self.assertEqual(self.source.get_deep_extends(["python"]), ["python"])
+        self.assertNotIn("python", self.source._extends)
+
+
+def _snippet(trigger, options, priority=0):
+    return UltiSnipsSnippetDefinition(
+        priority, trigger, "", "", options, {}, "", None, None
+    )
+
+
+class _OnTheFlySource(SnippetSource):
+    def get_snippets(self, filetypes, before, possible, autotrigger_only, visual):
+        return [_snippet("a", "A"), _snippet("b", "A", priority=-1)]
+
+
+class _UnlistedSource(AddedSnippetsSource):
+    def get_all_snippets(self, filetypes):
+        return None
+
+
+class _CountingSnippet(UltiSnipsSnippetDefinition):
+    def __init__(self, trigger, options, priority, asked):
+        super().__init__(priority, trigger, "", "", options, {}, "", None, None)
+        self._asked = asked
+
+    def match(self, before, visual_content=None):
+        self._asked.append(self)
+        return super().match(before, visual_content)
+
+
+def _highest_priority_matches(sources, filetypes, before):
+    """The matches ResolvedSnippets selects, found by matching everything."""
+    matching_snippets = {}
+    for source in sources:
+        for snippet in source.get_snippets(filetypes, before, False, False, None):
+            matching_snippets.setdefault(snippet.trigger, []).append(snippet)
+    if not matching_snippets:
+        return []
+    snippets = list(itertools.chain(*matching_snippets.values()))
+    highest_priority = max(s.priority for s in snippets)
+    return [s for s in snippets if s.priority == highest_priority]
+
+
+class TestResolvedSnippets(unittest.TestCase):
+    def setUp(self):
+        self.source = AddedSnippetsSource()
+        self.source.add_snippet("python", _snippet("ab", "A"))
+        self.source.add_snippet("python", _snippet("ignored", ""))
+        self.source.add_snippet("base", _snippet("a b", "pA"))
+        self.source.add_snippet("base", _snippet("x[yz]", "rA"))
+        self.source.add_snippet("base", _snippet("ab", "A", priority=1))
+        self.source.add_snippet("c", _snippet("c", "A"))
+        self.source.update_extends("python", ["base"])
+
+    def test_same_result_as_asking_the_sources(self):
+        resolved = ResolvedSnippets([self.source], ("python",))
+        self.assertEqual(
+            [
+                m.snippet.priority
+                for m in resolved.get_snippets("ab", False, False, None)
+            ],
+            [1],
+        )
+        self.assertEqual(
+            [m.snippet.trigger for m in resolved.get_snippets("a", True, False, None)],
+            ["ab", "a b"],
+        )
+
+    def test_cleared_snippets_are_removed(self):
+        self.source._snippets["python"].clear_snippets(1, ["ab"])
+        self.source._snippets["base"].clear_snippets(0, [])
+        resolved = ResolvedSnippets([self.source], ("python",))
+        self.assertEqual(resolved.get_snippets("ab", False, False, None), [])
+        self.assertEqual(resolved.autotrigger_characters(), set())
+
+    def test_autotrigger_characters_of_filetypes_and_parents(self):
+        resolved = ResolvedSnippets([self.source], ("python",))
+        self.assertEqual(resolved.autotrigger_characters(), {"b", "a", " ", "y", "z"})
+        self.source.add_snippet("python", _snippet("a.", "rA"))
+        resolved = ResolvedSnippets([self.source], ("python",))
+        self.assertIsNone(resolved.autotrigger_characters())
+
+    def test_sources_creating_snippets_on_the_fly(self):
+        resolved = ResolvedSnippets([_OnTheFlySource(), self.source], ("python",))
+        self.assertIsNone(resolved.autotrigger_characters())
+        self.assertEqual(
+            [m.snippet.trigger for m in resolved.get_snippets("a", True, False, None)],
+            ["a", "b", "ab", "a b"],
+        )
+
+    def test_shadowed_priorities_are_not_matched(self):
+        asked = []
+        source = AddedSnippetsSource()
+        source.add_snippet("python", _CountingSnippet("ab", "", 2, asked))
+        source.add_snippet("python", _CountingSnippet("b", "i", 1, asked))
+        source.add_snippet("python", _CountingSnippet("ab", "", 1, asked))
+        resolved = ResolvedSnippets([source], ("python",))
+        self.assertEqual(
+            [
+                m.snippet.priority
+                for m in resolved.get_snippets("ab", False, False, None)
+            ],
+            [2],
+        )
+        self.assertEqual([s.priority for s in asked], [2])
+
+        asked.clear()
+        self.assertEqual(
+            [m.snippet.trigger for m in resolved.get_snippets("b", False, False, None)],
+            ["b"],
+        )
+        self.assertEqual([s.priority for s in asked], [2, 1, 1])
+
+    def test_same_result_as_matching_everything(self):
+        rng = random.Random(0)
+        triggers = ["a", "ab", "b", "a b", "[ab]", "b|ab"]
+        for _ in range(200):
+            sources = [AddedSnippetsSource(), _UnlistedSource(), AddedSnippetsSource()]
+            for source in sources:
+                for _ in range(rng.randrange(6)):
+                    trigger = rng.choice(triggers)
+                    options = rng.choice(["", "i", "b"])
+                    if not trigger.isalpha() and " " not in trigger:
+                        options += "r"
+                    source.add_snippet(
+                        rng.choice(["python", "base"]),
+                        _snippet(trigger, options, rng.randrange(3)),
+                    )
+                source.update_extends("python", ["base"])
+            before = "".join(rng.choice("ab ") for _ in range(rng.randrange(5)))
+            resolved = ResolvedSnippets(sources, ["python"])
+            with self.subTest(before=before):
+                self.assertEqual(
+                    [
+                        m.snippet
+                        for m in resolved.get_snippets(before, False, False, None)
+                    ],
+                    _highest_priority_matches(sources, ["python"], before),
+                )
+
+    def test_generation_changes_with_snippets(self):
+        generation = self.source.generation
+        self.source.add_snippet("python", _snippet("d", ""))
+        self.assertGreater(self.source.generation, generation)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""Tests for watching snippet directories for changes."""
+
+import os
+import queue
+import time
+import unittest
+from unittest import mock
+
+from UltiSnips.snippet.source.file import watcher
+from UltiSnips.snippet_test_util import DirectorySource, DirectoryTestCase
+
+
+class _QueueBackend:
+    """Reports the paths put into its queue."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.directories = None
+
+    def set_directories(self, directories):
+        self.directories = directories
+
+    def read(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return set()
+
+
+class _TempDirectoryTestCase(DirectoryTestCase):
+    def read_until(self, backend, path, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        changed = set()
+        while time.monotonic() < deadline and str(path) not in changed:
+            changed |= backend.read(0.05)
+        return changed
+
+
+class TestPollingBackend(_TempDirectoryTestCase):
+    def test_reports_new_changed_and_removed_files(self):
+        backend = watcher._PollingBackend()
+        (self.directory / "python").mkdir()
+        existing = self.directory / "python" / "a.snippets"
+        existing.write_text("")
+        backend.set_directories([str(self.directory)])
+        self.assertEqual(backend.read(0), set())
+
+        added = self.directory / "all.snippets"
+        added.write_text("")
+        os.utime(existing, (1, 1))
+        self.assertEqual(backend.read(0), {str(added), str(existing)})
+        added.unlink()
+        self.assertEqual(backend.read(0), {str(added)})
+
+    def test_ignores_swap_and_backup_files(self):
+        backend = watcher._PollingBackend()
+        backend.set_directories([str(self.directory)])
+        (self.directory / ".all.snippets.swp").write_text("")
+        (self.directory / "all.snippets~").write_text("")
+        self.assertEqual(backend.read(0), set())
+
+
+class TestInotifyBackend(_TempDirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        try:
+            self.backend = watcher._InotifyBackend()
+        except (OSError, AttributeError, TypeError):
+            self.skipTest("inotify is not available")
+        self.backend.set_directories([str(self.directory)])
+
+    def test_reports_written_files(self):
+        path = self.directory / "all.snippets"
+        path.write_text("")
+        self.assertIn(str(path), self.read_until(self.backend, path))
+
+    def test_watches_new_subdirectories(self):
+        (self.directory / "python").mkdir()
+        self.read_until(self.backend, self.directory / "python")
+        path = self.directory / "python" / "a.snippets"
+        path.write_text("")
+        self.assertIn(str(path), self.read_until(self.backend, path))
+
+
+class TestSnippetDirectoryWatcher(_TempDirectoryTestCase):
+    def test_changes_are_debounced(self):
+        backend = _QueueBackend()
+        snippet_watcher = watcher.SnippetDirectoryWatcher(backend)
+        snippet_watcher.watch([str(self.directory), "/does/not/exist"])
+        self.assertEqual(backend.directories, (str(self.directory),))
+
+        backend.queue.put({"a"})
+        backend.queue.put({"b"})
+        deadline = time.monotonic() + 5
+        while not snippet_watcher._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        last_change = snippet_watcher._last_change
+        self.assertEqual(snippet_watcher.changes(now=last_change), set())
+        changes = set()
+        while changes != {"a", "b"} and time.monotonic() < deadline:
+            changes |= snippet_watcher.changes(now=time.monotonic() + 1)
+            time.sleep(0.01)
+        self.assertEqual(changes, {"a", "b"})
+        self.assertEqual(snippet_watcher.changes(now=time.monotonic() + 1), set())
+
+    def test_same_directories_are_not_checked_again(self):
+        snippet_watcher = watcher.SnippetDirectoryWatcher(_QueueBackend())
+        snippet_watcher.watch([str(self.directory)])
+        with mock.patch("os.path.isdir") as isdir:
+            snippet_watcher.watch([str(self.directory)])
+            isdir.assert_not_called()
+            snippet_watcher.watch([str(self.directory), "/does/not/exist"])
+            self.assertEqual(isdir.call_count, 2)
+
+
+class TestFilesChanged(_TempDirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        (self.directory / "python.snippets").write_text("extends base\n")
+        (self.directory / "base.snippets").write_text("snippet b\nb\nendsnippet\n")
+        self.source = DirectorySource(self.directory)
+        self.source.ensure(["python"])
+
+    def test_only_buckets_of_known_files_are_checked(self):
+        self.source.files_changed([str(self.directory / "base.snippets")])
+        self.assertEqual(self.source._unverified, {"base"})
+
+    def test_unknown_files_check_all_buckets(self):
+        self.source.files_changed([str(self.directory / "python_new.snippets")])
+        self.assertEqual(self.source._unverified, {"python", "base"})
+
+
+if __name__ == "__main__":
+    unittest.main()
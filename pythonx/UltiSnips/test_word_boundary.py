@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""Tests for deciding where words start from 'iskeyword'."""
+
+import unittest
+from unittest import mock
+
+from UltiSnips.word_boundary import WordBoundaries, parse_iskeyword
+
+_DEFAULT = "@,48-57,_,192-255"
+
+
+class TestParseIskeyword(unittest.TestCase):
+    def test_default_value(self):
+        keyword = parse_iskeyword(_DEFAULT)
+        for char in "azAZ09_é":
+            self.assertIn(ord(char), keyword)
+        for char in " -.@\t":
+            self.assertNotIn(ord(char), keyword)
+
+    def test_exclusions_and_literals(self):
+        keyword = parse_iskeyword("@,^a-c,@-@,94,44,45")
+        for char in "dz@^,-":
+            self.assertIn(ord(char), keyword)
+        for char in "abc":
+            self.assertNotIn(ord(char), keyword)
+
+    def test_spaces_after_comma(self):
+        self.assertEqual(parse_iskeyword("a, b"), {ord("a"), ord("b")})
+
+    def test_lisp_adds_dash(self):
+        self.assertEqual(parse_iskeyword("a", lisp=True), {ord("a"), ord("-")})
+        self.assertEqual(parse_iskeyword("a,^-", lisp=True), {ord("a")})
+
+    def test_invalid_values(self):
+        for value in ["a,", "0", "256", "c-a", "ab", "48-300"]:
+            with self.subTest(value=value):
+                self.assertIsNone(parse_iskeyword(value))
+
+
+class TestWordBoundaries(unittest.TestCase):
+    def test_word_starts(self):
+        boundaries = WordBoundaries(parse_iskeyword(_DEFAULT))
+        for previous, char, expected in [
+            (" ", "a", True),
+            (".", "a", True),
+            ("a", "b", False),
+            ("a", ".", False),
+            (" ", ".", False),
+            ("_", "a", False),
+        ]:
+            with self.subTest(previous=previous, char=char):
+                self.assertEqual(boundaries.is_word_start(previous, char), expected)
+
+    def test_last_word_start(self):
+        boundaries = WordBoundaries(parse_iskeyword(_DEFAULT))
+        self.assertEqual(boundaries.last_word_start("foo.bar"), 4)
+        self.assertEqual(boundaries.last_word_start("foo bar."), 4)
+        self.assertEqual(boundaries.last_word_start("foo"), 0)
+        self.assertEqual(boundaries.last_word_start(""), 0)
+
+    def test_asks_vim_once_for_other_characters(self):
+        boundaries = WordBoundaries(parse_iskeyword(_DEFAULT))
+        with mock.patch("UltiSnips.word_boundary.vim_helper") as helper:
+            helper.eval.return_value = "1"
+            self.assertTrue(boundaries.is_word_start("a", "あ"))
+            self.assertTrue(boundaries.is_word_start("a", "あ"))
+            self.assertFalse(boundaries.is_word_start("あ", "."))
+        helper.eval.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@
 """Utilities to deal with text."""
 
 import contextlib
+import re
 
 
 def unescape(text):
@@ -49,32 +50,96 @@ def head_tail(line):
     return head, tail
 
 
+# Everything str.splitlines() treats as a line boundary.
+_LINE_END = re.compile(r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+
+
+def _has_plain_line_ends(text):
+    """Returns true if "\n" and "\r\n" are the only line boundaries in
+    'text'."""
+    if any(sep in text for sep in "\v\f\x1c\x1d\x1e\x85\u2028\u2029"):
+        return False
+    return "\r" not in text or text.count("\r") == text.count("\r\n")
+
+
 class LineIterator:
-    """Convenience class that keeps track of line numbers in files."""
+    """Convenience class that keeps track of line numbers in files.
+
+    Lines are found one by one in a single pass over 'text', which is never
+    split up. 'offset' allows slicing multi-line blocks out of 'text'
+    instead of concatenating their lines.
+    """
 
     def __init__(self, text):
+        self.text = text
         self._line_index = -1
-        self._lines = list(text.splitlines(True))
+        self._pos = 0
+        # End of the line starting at '_pos', once peek() looked for it.
+        self._next_end = None
+        # Almost all files only use "\n" or "\r\n", which can be found with
+        # str.find and regular expressions in MULTILINE mode.
+        self._plain = _has_plain_line_ends(text)
 
     def __iter__(self):
         return self
 
+    def _line_end(self):
+        if self._next_end is None:
+            if self._plain:
+                end = self.text.find("\n", self._pos)
+                self._next_end = len(self.text) if end == -1 else end + 1
+            else:
+                match = _LINE_END.search(self.text, self._pos)
+                self._next_end = match.end() if match else len(self.text)
+        return self._next_end
+
     def __next__(self):
         """Returns the next line."""
-        if self._line_index + 1 < len(self._lines):
-            self._line_index += 1
-            return self._lines[self._line_index]
-        raise StopIteration()
+        if self._pos >= len(self.text):
+            raise StopIteration()
+        start = self._pos
+        self._pos = self._line_end()
+        self._next_end = None
+        self._line_index += 1
+        return self.text[start : self._pos]
 
     @property
     def line_index(self):
         """The 1 based line index in the current file."""
         return self._line_index + 1
 
+    @property
+    def offset(self):
+        """The offset in 'text' right after the current line."""
+        return self._pos
+
     def peek(self):
         """Returns the next line (if there is any, otherwise None) without
         advancing the iterator."""
-        try:
-            return self._lines[self._line_index + 1]
-        except IndexError:
+        if self._pos >= len(self.text):
             return None
+        return self.text[self._pos : self._line_end()]
+
+    def skip_to(self, pattern):
+        """Advances over all lines before the first one for which 'pattern'
+        matches the newline ending the previous line followed by the line
+        itself. Returns False if there is no such line, all lines are
+        consumed then."""
+        # The first line of a file has no newline before it to search for.
+        while not self._plain or self._pos == 0:
+            line = self.peek()
+            if line is None:
+                return False
+            if pattern.match("\n" + line):
+                return True
+            next(self)
+        text = self.text
+        match = pattern.search(text, self._pos - 1)
+        stop = match.start() + 1 if match else len(text)
+        if stop > self._pos:
+            self._line_index += text.count("\n", self._pos, stop)
+            if not match and text[-1] != "\n":
+                self._line_index += 1
+            self._pos = stop
+            self._next_end = None
+        return match is not None
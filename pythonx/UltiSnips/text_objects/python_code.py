@@ -8,7 +8,6 @@ from functools import cache
 from pathlib import Path
 from typing import NamedTuple
 
-import UltiSnips.snippet_manager
 from UltiSnips import vim_helper
 from UltiSnips.indent_util import IndentUtil
 from UltiSnips.text_objects.base import NoneditableTextObject
@@ -51,7 +50,9 @@ class SnippetUtilForAction(dict):
         self.__dict__ = self
 
     def expand_anon(self, *args, **kwargs):
-        UltiSnips.snippet_manager.UltiSnips_Manager.expand_anon(*args, **kwargs)
+        from UltiSnips.snippet_manager import UltiSnips_Manager
+
+        UltiSnips_Manager.expand_anon(*args, **kwargs)
         self.cursor.preserve()
 
 
@@ -43,6 +43,7 @@ class SnippetInstance(EditableTextObject):
         self._cts = 0
 
         self.context = context
+        self.last_re = last_re
         self.locals = {"match": last_re, "context": context}
         self.globals = globals
         self._compiled_globals = _compiled_globals
@@ -13,7 +13,6 @@ from vim import error
 
 from UltiSnips.error import PebkacError
 from UltiSnips.position import Position
-from UltiSnips.snippet.source.file.common import normalize_file_path
 from UltiSnips.vim_encoding import byte2col, col2byte
 
 
@@ -255,6 +254,9 @@ def select(start, end):
 
 def get_dot_vim():
     """Returns the likely places for ~/.vim for the current setup."""
+    # Imported here, the snippet sources import this module.
+    from UltiSnips.snippet.source.file.common import normalize_file_path
+
     home = Path(vim.eval("$HOME"))
     candidates = []
     if platform.system() == "Windows":
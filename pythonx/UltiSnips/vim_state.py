@@ -159,6 +159,15 @@ class VisualContentPreserver:
         self._mode = ""
         self._text = ""
         self._placeholder = None
+        self._update_pending_reset()
+
+    def _update_pending_reset(self):
+        # A placeholder conserved without a visual selection is forgotten by
+        # the next typed text (see SnippetManager._track_change), so
+        # UltiSnips#TrackChange must not skip keystrokes while there is one.
+        vim.vars["_ultisnips_visual_placeholder"] = int(
+            self._placeholder is not None and self._mode == ""
+        )
 
     def conserve(self):
         """Save the last visual selection and the mode it was made in."""
@@ -189,6 +198,7 @@ class VisualContentPreserver:
                 text += _vim_line_with_eol(cl)
             text += _vim_line_with_eol(el - 1)[: ec + 1]
         self._text = text
+        self._update_pending_reset()
 
     def conserve_placeholder(self, placeholder):
         if placeholder:
@@ -197,6 +207,7 @@ class VisualContentPreserver:
             )
         else:
             self._placeholder = None
+        self._update_pending_reset()
 
     @property
     def text(self):
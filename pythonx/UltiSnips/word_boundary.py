@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""Decides where words start like `\\<` in a Vim regular expression, without
+asking Vim.
+
+In a UTF-8 Vim, `\\<` matches before a character whose class is 2 or higher
+if the character before it is of another class. Characters below 256 are of
+class 0 if they are blank, 2 if 'iskeyword' makes them keyword characters
+and 1 otherwise, so their classes are computed here from 'iskeyword' and
+'lisp'. The classes of all other characters come from tables inside Vim;
+those are asked from Vim once per pair of characters.
+"""
+
+from UltiSnips import vim_helper
+from UltiSnips.text import escape
+
+_BLANKS = frozenset((0x00, 0x09, 0x20, 0xA0))
+_DIGITS = "0123456789"
+
+
+def _is_alpha(c):
+    """Like MB_ISLOWER(c) || MB_ISUPPER(c) in Vim, which decides the
+    characters '@' stands for."""
+    char = chr(c)
+    return char.lower() != char or char.upper() != char
+
+
+def _parse_character(value, pos):
+    if value[pos] in _DIGITS:
+        end = pos
+        while end < len(value) and value[end] in _DIGITS:
+            end += 1
+        return int(value[pos:end]), end
+    return ord(value[pos]), pos + 1
+
+
+def parse_iskeyword(value, lisp=False):
+    """Returns the set of character codes below 256 that are keyword
+    characters for the 'iskeyword' option 'value', parsed like Vim does it.
+    Returns None if Vim would reject the value."""
+    keyword = {ord("-")} if lisp else set()
+    pos = 0
+    while pos < len(value):
+        exclude = value[pos] == "^" and pos + 1 < len(value)
+        if exclude:
+            pos += 1
+        first, pos = _parse_character(value, pos)
+        last = None
+        if pos + 1 < len(value) and value[pos] == "-":
+            last, pos = _parse_character(value, pos + 1)
+        if (
+            not 0 < first < 256
+            or (last is not None and not first <= last < 256)
+            or (pos < len(value) and value[pos] != ",")
+        ):
+            return None
+        alpha_only = False
+        if last is None:
+            if first == ord("@"):
+                alpha_only = True
+                first, last = 1, 255
+            else:
+                last = first
+        for c in range(first, last + 1):
+            if alpha_only and not _is_alpha(c):
+                continue
+            if exclude:
+                keyword.discard(c)
+            else:
+                keyword.add(c)
+        if pos < len(value):
+            pos += 1
+            while pos < len(value) and value[pos] == " ":
+                pos += 1
+            if pos == len(value):
+                # A trailing comma is not allowed.
+                return None
+    return keyword
+
+
+class WordBoundaries:
+    """Finds word starts for one value of 'iskeyword'. If 'keyword' is None,
+    every question is asked from Vim."""
+
+    def __init__(self, keyword):
+        self._keyword = keyword
+        # (previous character, character) -> answer from Vim.
+        self._asked = {}
+
+    def _class(self, char):
+        """Returns the class of 'char', or None if only Vim knows it."""
+        c = ord(char)
+        if c >= 0x100 or self._keyword is None:
+            return None
+        if c in _BLANKS:
+            return 0
+        if c in self._keyword:
+            return 2
+        return 1
+
+    def is_word_start(self, previous, char):
+        """Returns true if a word starts at 'char' when it follows
+        'previous'."""
+        char_class = self._class(char)
+        if char_class is not None:
+            if char_class <= 1:
+                return False
+            previous_class = self._class(previous)
+            if previous_class is not None:
+                return previous_class != char_class
+        key = (previous, char)
+        if key not in self._asked:
+            chars = escape(previous + char, r"\"")
+            self._asked[key] = vim_helper.eval(f'"{chars}" =~# "\\\\v.<."') != "0"
+        return self._asked[key]
+
+    def last_word_start(self, text):
+        """Returns the index of the last word start in 'text' after its
+        first character, or 0 if there is none."""
+        for index in range(len(text) - 1, 0, -1):
+            if self.is_word_start(text[index - 1], text[index]):
+                return index
+        return 0
+
+
+# The WordBoundaries of the current buffer, see current_word_boundaries.
+_current = None
+
+# ('iskeyword', 'lisp', 'encoding') -> WordBoundaries, shared by all buffers.
+_by_options = {}
+
+
+def current_word_boundaries():
+    """Returns the WordBoundaries for the current buffer. They are only
+    read from Vim again after forget_word_boundaries was called."""
+    global _current
+    if _current is None:
+        iskeyword, lisp, encoding = vim_helper.eval("[&iskeyword, &lisp, &encoding]")
+        key = (iskeyword, lisp, encoding)
+        if key not in _by_options:
+            keyword = None
+            if encoding in ("utf-8", "utf8"):
+                keyword = parse_iskeyword(iskeyword, int(lisp))
+            _by_options[key] = WordBoundaries(keyword)
+        _current = _by_options[key]
+    return _current
+
+
+def forget_word_boundaries():
+    """Called when the current buffer or its 'iskeyword' might have
+    changed."""
+    global _current
+    _current = None
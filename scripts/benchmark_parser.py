@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Measure the throughput of the UltiSnips and snipMate snippet file parsers.
+
+Generates a large synthetic snippet file for both formats, with many small
+snippets and a few huge bodies (think license headers or generated
+boilerplate), and reports how fast each parser gets through it. The parsers
+are run outside of Vim, so the `vim` module is replaced by a stand-in the
+same way the unit tests do it.
+
+Usage: scripts/benchmark_parser.py [--snippets N] [--body-lines N] [--repeat N]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from unittest.mock import MagicMock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "pythonx"))
+sys.modules.setdefault("vim", MagicMock())
+
+from UltiSnips.snippet.source.file import snipmate, ulti_snips  # noqa: E402
+
+
+def ultisnips_corpus(snippets: int, body_lines: int) -> str:
+    parts = ["priority -50\n\nglobal !p\ndef helper():\n\treturn 1\nendglobal\n\n"]
+    for i in range(snippets):
+        parts.append(f'snippet trig{i} "Snippet number {i}" b\n')
+        parts.append(f"for (${{1:i}} = 0; $1 < ${{2:{i}}}; $1++) {{\n\t$0\n}}\n")
+        parts.append("endsnippet\n\n")
+    for i in range(10):
+        parts.append(f'snippet big{i} "A long body"\n')
+        parts.extend(
+            f"Line {j} of a very long body ${{1:x}}\n" for j in range(body_lines)
+        )
+        parts.append("endsnippet\n\n")
+    return "".join(parts)
+
+
+def snipmate_corpus(snippets: int, body_lines: int) -> str:
+    parts = ["extends c\n\n"]
+    for i in range(snippets):
+        parts.append(f"snippet trig{i} Snippet number {i}\n")
+        parts.append(f"\tfor (${{1:i}} = 0; $1 < ${{2:{i}}}; $1++) {{\n\t\t$0\n\t}}\n")
+    for i in range(10):
+        parts.append(f"snippet big{i} A long body\n")
+        parts.extend(
+            f"\tLine {j} of a very long body ${{1:x}}\n" for j in range(body_lines)
+        )
+    return "".join(parts)
+
+
+def measure(name: str, parse, data: str, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = list(parse(data, "/benchmark.snippets"))
+        best = min(best, time.perf_counter() - start)
+    size = len(data.encode()) / 1e6
+    print(
+        f"{name:<10} {len(events):>7} events  {size:6.1f} MB  "
+        f"{best * 1e3:8.1f} ms  {size / best:6.1f} MB/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snippets", type=int, default=20000)
+    parser.add_argument("--body-lines", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    measure(
+        "UltiSnips",
+        ulti_snips._parse_snippets_file,
+        ultisnips_corpus(args.snippets, args.body_lines),
+        args.repeat,
+    )
+    measure(
+        "snipMate",
+        snipmate._parse_snippets_file,
+        snipmate_corpus(args.snippets, args.body_lines),
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -53,6 +53,23 @@ class Autotrigger_CanMatchPreviouslySelectedPlaceholder(_VimTest):
     wanted = "if var == nil: pass\n="
 
 
+class Autotrigger_TypedTextForgetsSelectedPlaceholder(_VimTest):
+    # 'x' cannot complete an autotrigger snippet, but typing it has to forget
+    # the placeholder selected by the expansion all the same.
+    files = {
+        "us/all.snippets": r"""
+        snippet if "desc"
+        if ${1:var}: pass
+        endsnippet
+        snippet = "desc" "snip.last_placeholder" Ae
+        `!p snip.rv = snip.context.current_text` == nil
+        endsnippet
+        """
+    }
+    keys = "if" + EX + ESC + "ox="
+    wanted = "if var: pass\nx="
+
+
 class Autotrigger_GlobalDisable(_VimTest):
     def _extra_vim_config(self, vim_config):
         vim_config.append("let g:UltiSnipsAutoTrigger=0")
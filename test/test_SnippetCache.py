@@ -0,0 +1,60 @@
+"""Tests for the on-disk cache of parsed snippet files."""
+
+from test.constant import EX
+from test.vim_test_case import VimTestCase as _VimTest
+
+C_L = chr(12)  # <C-L>, used to dump the cache counters into the buffer.
+C_F = chr(6)  # <C-F>, reloads all snippet files.
+C_G = chr(7)  # <C-G>, empties the cache.
+C_E = chr(5)  # <C-E>, adds a snippet to the snippet file on disk.
+
+
+class _SnippetCacheBase(_VimTest):
+    files = {
+        "us/all.snippets": r"""
+        snippet hello "greeting"
+        Hello!
+        endsnippet
+        """
+    }
+
+    def _extra_vim_config(self, vim_config):
+        vim_config.extend(
+            [
+                "let g:UltiSnipsEnableSnippetCache = 1",
+                f"let g:UltiSnipsSnippetCacheDirectory = '{self._temp_dir}/cache'",
+                "function! S_DumpCacheStats()",
+                "  let stats = UltiSnips#SnippetCacheStats()",
+                "  return stats.hits . '/' . stats.misses",
+                "endfunction",
+                "inoremap <silent> <C-L> <C-R>=S_DumpCacheStats()<CR>",
+                "inoremap <silent> <C-F> <C-R>=execute('call UltiSnips#RefreshSnippets()')<CR>",
+                "inoremap <silent> <C-G> <C-R>=execute('UltiSnipsClearCache')<CR>",
+                f"let g:S_SnippetFile = '{self._temp_dir}/us/all.snippets'",
+                "inoremap <silent> <C-E> <C-R>=execute('call writefile("
+                'readfile(g:S_SnippetFile) + ["snippet bye", "Bye!", '
+                '"endsnippet"], g:S_SnippetFile)\')<CR>',
+            ]
+        )
+
+
+class SnippetCache_FirstLoadIsAMiss(_SnippetCacheBase):
+    keys = "hello" + EX + " " + C_L
+    wanted = "Hello! 0/1"
+
+
+class SnippetCache_ReloadKeepsUnchangedFiles(_SnippetCacheBase):
+    # A file that did not change on disk is not read again on reload, so the
+    # cache is not asked for it either.
+    keys = "hello" + EX + C_F + " hello" + EX + " " + C_L
+    wanted = "Hello! Hello! 0/1"
+
+
+class SnippetCache_ChangedFileIsAMiss(_SnippetCacheBase):
+    keys = "hello" + EX + C_E + C_F + " bye" + EX + " " + C_L
+    wanted = "Hello! Bye! 0/2"
+
+
+class SnippetCache_ClearResetsCounters(_SnippetCacheBase):
+    keys = "hello" + EX + C_G + C_E + C_F + " bye" + EX + " " + C_L
+    wanted = "Hello! Bye! 0/1"